@@ -0,0 +1,83 @@
+'''
+ICEQ (2025) - Бенчмарк движков кластеризации
+
+Сравнивает алгоритмы кластеризации (kmeans, minibatch, faiss) и выбор
+центральных чанков на синтетических нормализованных эмбеддингах.
+Количество кластеров выбирается так же, как в QuestionsGenerator.generate.
+
+Запуск:
+    >>> python benchmarks/bench_clustering.py --sizes 10000 50000 200000
+'''
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from clustering import CLUSTERING_BACKENDS, ClusteringEngine, select_central_indices  # noqa: E402
+
+# Те же константы, что и в generation.py
+DATA_PART = 0.01
+MIN_CLUSTERS_NUM = 10
+MAX_CLUSTERS_NUM = 500
+
+
+def make_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Синтетические эмбеддинги: нормализованные точки вокруг случайных тем"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(MIN_CLUSTERS_NUM, n // 200), dim)).astype(np.float32)
+    embeddings = topics[rng.integers(0, len(topics), n)]
+    embeddings += 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def central_indices_loop(labels: np.ndarray, distances: np.ndarray, n_clusters: int) -> list:
+    """Прежняя реализация выбора центральных объектов (цикл с маской, O(k·n))"""
+    return [
+        np.where(labels == i)[0][np.argmin(distances[labels == i])]
+        for i in range(n_clusters)
+        if np.any(labels == i)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк движков кластеризации ICEQ')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 50_000, 100_000, 200_000])
+    parser.add_argument('--dim', type=int, default=1024, help='размерность эмбеддингов (e5-large: 1024)')
+    parser.add_argument('--backends', nargs='+', default=list(CLUSTERING_BACKENDS), choices=CLUSTERING_BACKENDS)
+    args = parser.parse_args()
+
+    header = f'{"чанков":>8} {"кластеров":>9} {"алгоритм":>10} {"fit, с":>9} {"центры (цикл), мс":>18} {"центры (векторно), мс":>22}'
+    print(header)
+    print('-' * len(header))
+
+    for n in args.sizes:
+        embeddings = make_embeddings(n, args.dim)
+        clusters_num = min(MAX_CLUSTERS_NUM, max(MIN_CLUSTERS_NUM, int(n * DATA_PART)))
+
+        for backend in args.backends:
+            engine = ClusteringEngine(backend)
+
+            start = time.perf_counter()
+            result = engine.fit(embeddings, clusters_num)
+            fit_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loop_indices = central_indices_loop(result.labels, result.distances, clusters_num)
+            loop_time = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            vector_indices = select_central_indices(result)
+            vector_time = (time.perf_counter() - start) * 1000
+
+            assert np.array_equal(np.asarray(loop_indices), vector_indices)
+            print(f'{n:>8} {clusters_num:>9} {backend:>10} {fit_time:>9.2f} {loop_time:>18.1f} {vector_time:>22.1f}')
+
+
+if __name__ == '__main__':
+    main()
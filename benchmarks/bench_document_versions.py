@@ -0,0 +1,153 @@
+'''
+ICEQ (2025) - Бенчмарк инкрементальной перегенерации изменённого документа
+
+Сравнивает повторную генерацию после правки документа (опечатка в одном
+или нескольких абзацах) без версии документа и с ней (generate с document_id):
+- время перегенерации и количество запросов к LLM
+- количество заново закодированных чанков (энкодер кластеризации)
+- количество вопросов, взятых из предыдущей версии
+
+Сценарии правки:
+- central: опечатка в центральном чанке кластера первого вопроса - ответ LLM
+  не находится в кэше ответов, так как меняется текст промпта
+- random: опечатки в --edits случайных абзацах
+
+Энкодеры заменяются StubEncoder, LLM - заглушкой, которая отвечает
+--llm-seconds-per-question секунд на вопрос (как API, время ответа которого
+растёт с количеством токенов), а её вопросы зависят от текста запроса. Проверка: перегенерация
+неизменённого документа не обращается к LLM и энкодеру и возвращает те же
+вопросы (код возврата 1, если это не так).
+
+Запуск:
+    >>> python benchmarks/bench_document_versions.py --paragraphs 3000 --questions 10 --llm-seconds-per-question 0.3
+'''
+
+import io
+import os
+import sys
+import zlib
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def make_typos(text: str, paragraphs: list[int]) -> str:
+    """Удваивает букву в последнем слове каждого из указанных абзацев (тема абзаца не меняется)"""
+    lines = text.split('\n')
+    for i in paragraphs:
+        head, last = lines[i].rsplit(' ', 1)
+        lines[i] = f'{head} {last[0]}{last}'
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк инкрементальной перегенерации изменённого документа')
+    parser.add_argument('--paragraphs', type=int, default=3000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--edits', type=int, default=1, help='абзацев с опечаткой в сценарии random')
+    parser.add_argument('--llm-seconds-per-question', type=float, default=0.3, help='время ответа LLM на вопрос')
+    parser.add_argument('--backend', default='kmeans', help='алгоритм кластеризации')
+    args = parser.parse_args()
+
+    sys.path[:0] = [SRC_DIR, BENCH_DIR]
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    from synthetic import make_text, StubEncoder, FakeLLMClient
+    from generation import QuestionsGenerator, CLUSTERING_MODEL_KEY, SEARCH_MODEL_KEY
+    from embedding_cache import chunk_hash
+
+    class CountingEncoder(StubEncoder):
+        """StubEncoder, считающий закодированные тексты"""
+
+        def __init__(self, dim: int = 1024):
+            super().__init__(dim)
+            self.encoded = 0
+
+        def encode(self, sentences, prompt: str | None = None, **kwargs):
+            sentences = list(sentences)
+            self.encoded += len(sentences)
+            return super().encode(sentences, prompt=prompt, **kwargs)
+
+    class TextLLMClient(FakeLLMClient):
+        """Заглушка LLM: время ответа пропорционально количеству вопросов, вопросы зависят от текста запроса"""
+
+        def generate(self, provider: str, text: str, num_questions: int = 5) -> str:
+            time.sleep(args.llm_seconds_per_question * num_questions)
+            response = super().generate(provider, text, num_questions)
+            return response.replace('разделе', f'фрагменте {zlib.crc32(text.encode("utf8"))}, разделе')
+
+    client = TextLLMClient()
+    versions_dir = tempfile.TemporaryDirectory(prefix='iceq-documents-')
+    generator = QuestionsGenerator(
+        embedding_cache_dir=None,
+        response_cache_dir=None,
+        time_estimator_path=None,
+        clustering_backend=args.backend,
+        llm_client=client,
+        document_versions_dir=versions_dir.name
+    )
+    clustering_encoder, search_encoder = CountingEncoder(), StubEncoder()
+    generator.models.register(CLUSTERING_MODEL_KEY, lambda: clustering_encoder)
+    generator.models.register(SEARCH_MODEL_KEY, lambda: search_encoder)
+
+    text = make_text(args.paragraphs, seed=0)
+    paragraphs = text.split('\n')
+
+    def run(source: str, document_id: str | None) -> dict:
+        requests, encoded = client.requests, clustering_encoder.encoded
+        reused = generator.document_versions.stats()['reuse']['questions']['reused']
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            questions = generator.generate(source, args.questions, llm='deepseek', document_id=document_id)
+        return {
+            'questions': questions,
+            'seconds': time.perf_counter() - start,
+            'llm_requests': client.requests - requests,
+            'encoded': clustering_encoder.encoded - encoded,
+            'reused': generator.document_versions.stats()['reuse']['questions']['reused'] - reused
+        }
+
+    def regenerate(edited: str, document_id: str | None) -> dict:
+        # Одинаковое начальное состояние: кэши прогреты только первой версией документа
+        generator.embedding_cache.clear_memory()
+        generator.response_cache.invalidate()
+        run(text, document_id)
+        return run(edited, document_id)
+
+    probe = run(text, 'probe')
+    version = generator.document_versions.get('probe')
+    central = [i for i, paragraph in enumerate(paragraphs) if chunk_hash(paragraph) == version.question_centers[0]]
+    print(f'Документ: {args.paragraphs} абзацев, {len(version.central_hashes)} кластеров, {args.questions} вопросов, '
+          f'LLM {args.llm_seconds_per_question} сек на вопрос')
+
+    scenarios = {
+        'central': make_typos(text, central[:1]),
+        'random': make_typos(text, random.Random(0).sample(range(len(paragraphs)), args.edits))
+    }
+    header = f'{"сценарий":>9} {"режим":>9} {"сек":>7} {"запросов LLM":>13} {"закодировано чанков":>20} {"вопросов из версии":>19}'
+    print(header)
+    print('-' * len(header))
+    for scenario, edited in scenarios.items():
+        for mode, document_id in (('полный', None), ('документ', f'bench-{scenario}')):
+            r = regenerate(edited, document_id)
+            print(f'{scenario:>9} {mode:>9} {r["seconds"]:>7.2f} {r["llm_requests"]:>13} {r["encoded"]:>20} {r["reused"]:>19}')
+
+    # Перегенерация без изменений: ни LLM, ни энкодера кластеризации, те же вопросы
+    unchanged = run(text, 'probe')
+    same = [q['question'] for q in unchanged['questions']] == [q['question'] for q in probe['questions']]
+    ok = same and unchanged['llm_requests'] == 0 and unchanged['encoded'] == 0
+    print(f'\nНеизменённый документ: {unchanged["llm_requests"]} запросов LLM, {unchanged["encoded"]} закодированных чанков, '
+          f'те же вопросы: {"✅" if same else "❌"}')
+    print(f'Статистика версий документов: {generator.document_versions.stats()}')
+    versions_dir.cleanup()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
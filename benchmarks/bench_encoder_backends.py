@@ -0,0 +1,195 @@
+'''
+ICEQ (2025) - Бенчмарк и проверка паритета бэкендов энкодеров
+
+Сравнивает encoder_backend='torch' (fp32 PyTorch), 'onnx' (fp32 ONNX Runtime)
+и 'onnx-int8' (динамическое квантование) для обеих моделей - e5 (кластеризация)
+и FRIDA (поиск объяснений):
+- время загрузки, RSS процесса после загрузки и пиковый RSS
+- пропускная способность кодирования, чанков в секунду
+- паритет с torch: совпадение кластеров (доля чанков, отнесённых к тому же
+  центроиду эталона, и adjusted Rand index) и совпадение top-1 поиска объяснений
+
+Каждый бэкенд измеряется в отдельном процессе. Код возврата 1, если паритет
+ниже порогов --min-cluster-agreement / --min-top1-agreement.
+
+Запуск:
+    >>> python benchmarks/bench_encoder_backends.py --paragraphs 2000
+    >>> python benchmarks/bench_encoder_backends.py --model /path/to/local/model  # одна модель для обеих стадий
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+# Минимальная доля чанков, попавших в тот же кластер, что и у torch
+DEFAULT_MIN_CLUSTER_AGREEMENT = 0.9
+# Минимальная доля запросов с тем же top-1 документом, что и у torch
+DEFAULT_MIN_TOP1_AGREEMENT = 0.9
+
+
+def make_queries(chunks: list[str], count: int) -> list[str]:
+    """Запросы для поиска: начало случайных чанков (у каждого есть однозначный ответ)"""
+    import random
+
+    rng = random.Random(count)
+    return [' '.join(rng.choice(chunks).split()[:8]) for _ in range(count)]
+
+
+def encode(model, texts: list[str], batch_size: int, prompt_name: str | None = None, **kwargs):
+    """Кодирует тексты; prompt_name передаётся, только если он есть в модели"""
+    if prompt_name is not None and prompt_name in (model.prompts or {}):
+        kwargs['prompt_name'] = prompt_name
+    return model.encode(texts, batch_size=batch_size, device='cpu', convert_to_numpy=True, **kwargs)
+
+
+def run_worker(backend: str, args, output_dir: str) -> dict:
+    """Измеряет один бэкенд внутри текущего процесса и сохраняет эмбеддинги"""
+    sys.path.insert(0, SRC_DIR)
+
+    import numpy as np
+
+    from synthetic import make_text, rss_mb
+    from encoder_backends import load_sentence_transformer
+    from generation import CLUSTERING_MODEL_NAME, SEARCH_MODEL_NAME
+    from chunking import chunk_text
+
+    chunks = list(chunk_text(make_text(args.paragraphs, seed=0)).chunks())
+    queries = make_queries(chunks, args.queries)
+    startup_rss = rss_mb()['rss_mb']
+
+    result = {'backend': backend, 'chunks': len(chunks)}
+    for stage, model_name in (('clustering', args.model or CLUSTERING_MODEL_NAME), ('search', args.model or SEARCH_MODEL_NAME)):
+        start = time.perf_counter()
+        model = load_sentence_transformer(model_name, backend, device='cpu', onnx_dir=args.onnx_dir)
+        result[f'{stage}_load_seconds'] = round(time.perf_counter() - start, 2)
+
+        # Прогрев: первые батчи включают инициализацию сессии ONNX Runtime
+        encode(model, chunks[:args.batch_size], args.batch_size)
+
+        start = time.perf_counter()
+        if stage == 'clustering':
+            documents = encode(model, chunks, args.batch_size, normalize_embeddings=True)
+        else:
+            documents = encode(model, chunks, args.batch_size, prompt_name='search_document')
+        seconds = time.perf_counter() - start
+        result[f'{stage}_chunks_per_second'] = round(len(chunks) / seconds, 1)
+        np.save(os.path.join(output_dir, f'{backend}_{stage}_documents.npy'), documents)
+
+        if stage == 'search':
+            np.save(
+                os.path.join(output_dir, f'{backend}_search_queries.npy'),
+                encode(model, queries, args.batch_size, prompt_name='search_query')
+            )
+
+    memory = rss_mb()
+    result['models_rss_mb'] = round(memory['rss_mb'] - startup_rss, 1)
+    result['peak_rss_mb'] = memory['peak_rss_mb']
+    return result
+
+
+def parity(reference: str, backend: str, clusters_num: int, output_dir: str) -> dict:
+    """Сравнивает кластеры и поиск бэкенда с эталоном"""
+    import numpy as np
+    from sklearn.metrics import adjusted_rand_score
+
+    sys.path.insert(0, SRC_DIR)
+    from clustering import ClusteringEngine
+
+    def load(name: str, stage: str) -> np.ndarray:
+        return np.load(os.path.join(output_dir, f'{name}_{stage}.npy')).astype(np.float32)
+
+    engine = ClusteringEngine('kmeans')
+    reference_embeddings = load(reference, 'clustering_documents')
+    backend_embeddings = load(backend, 'clustering_documents')
+    reference_clustering = engine.fit(reference_embeddings, clusters_num)
+    backend_clustering = engine.fit(backend_embeddings, clusters_num)
+
+    # Те же центроиды: различие только из-за эмбеддингов, а не из-за инициализации KMeans
+    centroid_labels = np.argmax(backend_embeddings @ reference_clustering.centroids.T, axis=1)
+    reference_labels = np.argmax(reference_embeddings @ reference_clustering.centroids.T, axis=1)
+
+    def top1(name: str) -> np.ndarray:
+        return np.argmax(load(name, 'search_queries') @ load(name, 'search_documents').T, axis=1)
+
+    return {
+        'cluster_agreement': round(float(np.mean(centroid_labels == reference_labels)), 4),
+        'cluster_ari': round(float(adjusted_rand_score(reference_clustering.labels, backend_clustering.labels)), 4),
+        'top1_agreement': round(float(np.mean(top1(backend) == top1(reference))), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк бэкендов энкодеров ICEQ')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'onnx-int8'])
+    parser.add_argument('--paragraphs', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--model', help='одна модель для обеих стадий вместо e5 и FRIDA')
+    parser.add_argument('--onnx-dir', default=None, help='директория экспортированных моделей')
+    parser.add_argument('--min-cluster-agreement', type=float, default=DEFAULT_MIN_CLUSTER_AGREEMENT)
+    parser.add_argument('--min-top1-agreement', type=float, default=DEFAULT_MIN_TOP1_AGREEMENT)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.onnx_dir is None:
+        sys.path.insert(0, SRC_DIR)
+        from encoder_backends import DEFAULT_ONNX_DIR
+        args.onnx_dir = DEFAULT_ONNX_DIR
+
+    if args.worker:
+        sys.path.insert(0, BENCH_DIR)
+        result = run_worker(args.worker, args, args.output_dir)
+        print('RESULT ' + json.dumps(result))
+        return
+
+    reference = 'torch'
+    backends = [reference] + [backend for backend in args.backends if backend != reference]
+    with tempfile.TemporaryDirectory(prefix='iceq-encoder-backends-') as output_dir:
+        results = []
+        for backend in backends:
+            command = [sys.executable, os.path.abspath(__file__), '--worker', backend, '--output-dir', output_dir]
+            for name in ('paragraphs', 'queries', 'batch_size', 'model', 'onnx_dir'):
+                value = getattr(args, name)
+                if value is not None:
+                    command += [f'--{name.replace("_", "-")}', str(value)]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            line = next(line for line in output.splitlines() if line.startswith('RESULT '))
+            results.append(json.loads(line[len('RESULT '):]))
+
+        for result in results[1:]:
+            result.update(parity(reference, result['backend'], args.clusters, output_dir))
+
+    header = (f'{"бэкенд":>10} {"загрузка, с":>12} {"e5, чанк/с":>11} {"FRIDA, чанк/с":>14} '
+              f'{"RSS моделей, МБ":>16} {"пиковый RSS, МБ":>16} {"кластеры":>9} {"ARI":>6} {"top-1":>6}')
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f'{r["backend"]:>10} {r["clustering_load_seconds"] + r["search_load_seconds"]:>12.2f} '
+              f'{r["clustering_chunks_per_second"]:>11} {r["search_chunks_per_second"]:>14} '
+              f'{r["models_rss_mb"]:>16} {r["peak_rss_mb"]:>16} '
+              f'{r.get("cluster_agreement", 1.0):>9} {r.get("cluster_ari", 1.0):>6} {r.get("top1_agreement", 1.0):>6}')
+
+    failed = False
+    for r in results[1:]:
+        if r['cluster_agreement'] < args.min_cluster_agreement:
+            print(f'❌ {r["backend"]}: совпадение кластеров {r["cluster_agreement"]} < {args.min_cluster_agreement}')
+            failed = True
+        if r['top1_agreement'] < args.min_top1_agreement:
+            print(f'❌ {r["backend"]}: совпадение top-1 {r["top1_agreement"]} < {args.min_top1_agreement}')
+            failed = True
+    if failed:
+        sys.exit(1)
+    print('✅ Паритет с torch в пределах порогов')
+
+
+if __name__ == '__main__':
+    main()
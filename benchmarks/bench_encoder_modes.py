@@ -0,0 +1,92 @@
+'''
+ICEQ (2025) - Бенчмарк режимов энкодеров
+
+Сравнивает режимы encoder_mode='dual' (e5 + FRIDA) и encoder_mode='single'
+(только e5): время запуска, RSS процесса и задержку запроса без учёта LLM.
+Каждый режим измеряется в отдельном процессе, LLM заменяется заглушкой.
+
+Запуск:
+    >>> python benchmarks/bench_encoder_modes.py --paragraphs 2000 --requests 5
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def run_worker(mode: str, paragraphs: int, requests: int, questions_num: int) -> dict:
+    """Измеряет один режим внутри текущего процесса"""
+    sys.path.insert(0, SRC_DIR)
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    from synthetic import make_text, make_questions, rss_mb
+
+    start = time.perf_counter()
+    from generation import QuestionsGenerator
+    generator = QuestionsGenerator(embedding_cache_dir=None, encoder_mode=mode)
+    startup_seconds = time.perf_counter() - start
+    startup_rss = rss_mb()
+
+    # Заглушка LLM: измеряем только стадии кодирования, кластеризации и поиска
+    generator._QuestionsGenerator__get_questions = lambda llm, text, num, use_cache=True: make_questions(num)
+
+    latencies = []
+    for i in range(requests):
+        text = make_text(paragraphs, seed=i)
+        generator.embedding_cache.clear_memory()
+        start = time.perf_counter()
+        generator.generate(text, questions_num, llm='deepseek')
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        'mode': mode,
+        'startup_seconds': round(startup_seconds, 2),
+        'startup_rss_mb': startup_rss['rss_mb'],
+        'peak_rss_mb': rss_mb()['peak_rss_mb'],
+        'request_seconds_mean': round(sum(latencies) / len(latencies), 3),
+        'request_seconds_min': round(min(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк режимов энкодеров ICEQ')
+    parser.add_argument('--paragraphs', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--worker', choices=['dual', 'single'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, BENCH_DIR)
+        result = run_worker(args.worker, args.paragraphs, args.requests, args.questions)
+        print('RESULT ' + json.dumps(result))
+        return
+
+    results = []
+    for mode in ('dual', 'single'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode,
+             '--paragraphs', str(args.paragraphs),
+             '--requests', str(args.requests),
+             '--questions', str(args.questions)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        line = next(line for line in output.splitlines() if line.startswith('RESULT '))
+        results.append(json.loads(line[len('RESULT '):]))
+
+    header = f'{"режим":>7} {"запуск, с":>10} {"RSS после запуска, МБ":>22} {"пиковый RSS, МБ":>16} {"запрос (ср.), с":>16} {"запрос (мин.), с":>17}'
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f'{r["mode"]:>7} {r["startup_seconds"]:>10} {r["startup_rss_mb"]:>22} {r["peak_rss_mb"]:>16} '
+              f'{r["request_seconds_mean"]:>16} {r["request_seconds_min"]:>17}')
+
+
+if __name__ == '__main__':
+    main()
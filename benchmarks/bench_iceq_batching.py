@@ -0,0 +1,123 @@
+'''
+ICEQ (2025) - Бенчмарк динамического батчинга ICEQ
+
+Сравнивает пропускную способность локальной модели при 1, 4 и 16
+одновременных запросах с батчингом (iceq_max_batch_size > 1) и без него
+(каждый запрос - отдельный generate). Вместо ICEQ используется маленькая
+causal LM со случайными весами (или модель из --model), запросы идут
+через QuestionsGenerator и основной промпт ICEQ.
+
+Случайная модель не выдаёт корректных вопросов, поэтому "вопросов в минуту"
+считается по запрошенному количеству: запросов в минуту × --questions.
+Длина ответа фиксируется (--new-tokens), чтобы режимы были сравнимы.
+
+Запуск:
+    >>> python benchmarks/bench_iceq_batching.py --concurrency 1 4 16 --new-tokens 64
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def run_worker(args) -> list[dict]:
+    """Измеряет один режим батчинга для всех уровней конкурентности"""
+    sys.path.insert(0, SRC_DIR)
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    from synthetic import make_text, make_tiny_causal_lm
+
+    import generation
+    from generation import QuestionsGenerator, ICEQ_MODEL_KEY
+
+    max_batch_size = max(args.concurrency) if args.worker == 'batched' else 1
+    generator = QuestionsGenerator(
+        embedding_cache_dir=None,
+        iceq_max_batch_size=max_batch_size,
+        iceq_max_wait=args.max_wait
+    )
+
+    texts = [make_text(args.paragraphs, seed=i) for i in range(max(args.concurrency))]
+    with open('system_prompt.txt', encoding='utf8') as f:
+        corpus = [f.read()] + texts
+    iceq_model = make_tiny_causal_lm(corpus, hidden_size=args.hidden_size, layers=args.layers, model_name=args.model)
+    # Фиксированная длина ответа: модель не останавливается раньше new_tokens
+    iceq_model['model'].generation_config.min_new_tokens = args.new_tokens
+    generation.ICEQ_MAX_NEW_TOKENS = args.new_tokens
+    generator.models.register(ICEQ_MODEL_KEY, lambda: iceq_model)
+
+    get_questions = generator._QuestionsGenerator__get_questions
+    get_questions('iceq', texts[0], args.questions)  # прогрев
+
+    results = []
+    for concurrency in args.concurrency:
+        def client(index: int) -> None:
+            for _ in range(args.requests):
+                get_questions('iceq', texts[index], args.questions)
+
+        before = generator.models_status()['iceq_batching']['main']
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        after = generator.models_status()['iceq_batching']['main']
+
+        requests = concurrency * args.requests
+        batches = after['batches'] - before['batches']
+        results.append({
+            'mode': args.worker,
+            'concurrency': concurrency,
+            'seconds': round(seconds, 2),
+            'requests_per_minute': round(requests / seconds * 60, 1),
+            'questions_per_minute': round(requests * args.questions / seconds * 60, 1),
+            'mean_batch_size': round(requests / batches, 2) if batches else 0.0
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк динамического батчинга ICEQ')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=2, help='запросов на одного клиента')
+    parser.add_argument('--questions', type=int, default=5)
+    parser.add_argument('--paragraphs', type=int, default=5)
+    parser.add_argument('--new-tokens', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.05)
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--model', default=None, help='модель Hugging Face вместо случайной')
+    parser.add_argument('--worker', choices=['sequential', 'batched'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, BENCH_DIR)
+        print('RESULT ' + json.dumps(run_worker(args)))
+        return
+
+    results = []
+    for mode in ('sequential', 'batched'):
+        command = [sys.executable, os.path.abspath(__file__), '--worker', mode] + sys.argv[1:]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        line = next(line for line in output.splitlines() if line.startswith('RESULT '))
+        results.extend(json.loads(line[len('RESULT '):]))
+
+    header = f'{"режим":>11} {"клиентов":>9} {"время, с":>9} {"запросов/мин":>13} {"вопросов/мин":>13} {"ср. батч":>9}'
+    print(header)
+    print('-' * len(header))
+    for r in sorted(results, key=lambda r: (r['concurrency'], r['mode'])):
+        print(f'{r["mode"]:>11} {r["concurrency"]:>9} {r["seconds"]:>9} {r["requests_per_minute"]:>13} '
+              f'{r["questions_per_minute"]:>13} {r["mean_batch_size"]:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''
+ICEQ (2025) - Бенчмарк остановки генерации ICEQ по количеству вопросов
+
+Сравнивает генерацию по основному промпту ICEQ с остановкой по количеству
+вопросов (QuestionsStoppingCriteria) и без неё:
+- сгенерированные токены и время на запрос
+- количество разобранных вопросов в ответе и причины остановки
+- паритет: ответ с остановкой - начало ответа без остановки (жадное декодирование)
+- лимит токенов по измеренному количеству токенов на вопрос
+
+Маленькая LM дообучается (--fit-steps) писать больше вопросов, чем
+запрошено (--extra-questions), как модель, которая не останавливается
+после последнего вопроса.
+
+Код возврата 1, если ответ с остановкой не совпадает с началом ответа
+без остановки или в нём меньше вопросов, чем запрошено.
+
+Запуск:
+    >>> python benchmarks/bench_iceq_early_stopping.py --requests 4 --questions 3 --extra-questions 3
+'''
+
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк остановки генерации ICEQ по количеству вопросов')
+    parser.add_argument('--requests', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=3)
+    parser.add_argument('--extra-questions', type=int, default=3, help='лишних вопросов в ответах модели')
+    parser.add_argument('--paragraphs', type=int, default=5)
+    parser.add_argument('--fit-steps', type=int, default=400, help='шагов дообучения маленькой LM')
+    parser.add_argument('--hidden-size', type=int, default=128)
+    parser.add_argument('--layers', type=int, default=2)
+    args = parser.parse_args()
+
+    sys.path[:0] = [SRC_DIR, BENCH_DIR]
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    import io
+    import contextlib
+
+    from synthetic import make_text, make_tiny_causal_lm
+    from bench_prompt_lookup import make_reference_answer, fit_to_answers
+
+    import generation
+    from generation import QuestionsGenerator, ICEQ_MODEL_KEY
+    from early_stopping import QuestionsStoppingCriteria
+    from question_parser import IncrementalQuestionParser
+
+    class WithoutQuestionsStop(QuestionsStoppingCriteria):
+        """Критерий без остановки по количеству вопросов (только лимит токенов)"""
+
+        def __init__(self, tokenizer, prompt_length, questions_nums, token_limits):
+            super().__init__(tokenizer, prompt_length, [sys.maxsize] * len(questions_nums), token_limits)
+
+    generator = QuestionsGenerator(embedding_cache_dir=None, response_cache_dir=None, time_estimator_path=None)
+    render = generator._QuestionsGenerator__render_iceq_prompt
+    total_questions = args.questions + args.extra_questions
+    texts = [make_text(args.paragraphs, seed=i) for i in range(args.requests)]
+    references = [make_reference_answer(text, total_questions, seed=i) for i, text in enumerate(texts)]
+    corpus = []
+    for name in ('system_prompt.txt', 'user_prompt.txt'):
+        with open(name, encoding='utf8') as f:
+            corpus.append(f.read())
+    iceq_model = make_tiny_causal_lm(corpus + texts + references, hidden_size=args.hidden_size, layers=args.layers)
+    tokenizer, model = iceq_model['tokenizer'], iceq_model['model']
+
+    # Промпт запрашивает args.questions вопросов, а модель учится писать total_questions
+    sequences = [
+        (tokenizer(render(tokenizer, text, args.questions))['input_ids'],
+         tokenizer(reference)['input_ids'] + [tokenizer.eos_token_id])
+        for text, reference in zip(texts, references)
+    ]
+    start = time.perf_counter()
+    loss = fit_to_answers(model, sequences, args.fit_steps)
+    print(f'Дообучение: {total_questions} вопросов в ответе при запросе {args.questions}, '
+          f'{args.fit_steps} шагов, loss {loss:.4f}, {time.perf_counter() - start:.1f} сек')
+
+    model.generation_config.do_sample = False
+    generator.models.register(ICEQ_MODEL_KEY, lambda: iceq_model)
+    run = generator._QuestionsGenerator__run_iceq_requests
+    shards = [(text, args.questions) for text in texts]
+
+    def count_questions(response: str) -> int:
+        question_parser = IncrementalQuestionParser(record_failures=False)
+        return len(question_parser.feed(response)) + len(question_parser.close())
+
+    def measure() -> dict:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(shards[:1])  # прогрев
+            responses, seconds = [], 0.0
+            for shard in shards:
+                start = time.perf_counter()
+                responses += run([shard])
+                seconds += time.perf_counter() - start
+        return {
+            'responses': responses,
+            'tokens': [len(tokenizer(response, add_special_tokens=False)['input_ids']) for response in responses],
+            'questions': [count_questions(response) for response in responses],
+            'seconds': seconds
+        }
+
+    budgets = generator._QuestionsGenerator__iceq_token_budgets
+    results = {}
+    generation.QuestionsStoppingCriteria = WithoutQuestionsStop
+    results[False] = measure()
+    generation.QuestionsStoppingCriteria = QuestionsStoppingCriteria
+    stops_before = dict(budgets['main'].stats()['stops'])
+    results[True] = measure()
+    stops = {reason: count - stops_before[reason] for reason, count in budgets['main'].stats()['stops'].items()}
+
+    header = f'{"остановка":>10} {"токенов на запрос":>18} {"вопросов на запрос":>19} {"мс на запрос":>13}'
+    print(header)
+    print('-' * len(header))
+    for enabled, label in ((False, 'нет'), (True, 'да')):
+        r = results[enabled]
+        print(f'{label:>10} {sum(r["tokens"]) / len(shards):>18.1f} {sum(r["questions"]) / len(shards):>19.1f} '
+              f'{r["seconds"] * 1000 / len(shards):>13.1f}')
+
+    saved = 1 - sum(results[True]['tokens']) / sum(results[False]['tokens'])
+    print(f'\nСэкономлено токенов: {saved:.1%}; причины остановки: {stops}')
+    budget = budgets['main'].stats()
+    print(f'Токенов на вопрос: {budget["tokens_per_question"]} ({budget["samples"]} замеров); '
+          f'лимит для {args.questions} вопросов: {budgets["main"].limit(args.questions, generation.ICEQ_MAX_NEW_TOKENS)} токенов')
+
+    # Сравнение по токенам: декодирование может по-другому расставить пробелы
+    prefix = all(
+        tokenizer(full, add_special_tokens=False)['input_ids'][:len(tokenizer(stopped, add_special_tokens=False)['input_ids'])]
+        == tokenizer(stopped, add_special_tokens=False)['input_ids']
+        for stopped, full in zip(results[True]['responses'], results[False]['responses'])
+    )
+    enough = all(questions >= args.questions for questions in results[True]['questions'])
+    print(f'Ответ с остановкой - начало ответа без остановки: {"✅" if prefix else "❌"}; '
+          f'запрошенное количество вопросов в каждом ответе: {"✅" if enough else "❌"}')
+    if not (prefix and enough):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
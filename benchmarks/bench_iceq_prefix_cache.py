@@ -0,0 +1,119 @@
+'''
+ICEQ (2025) - Бенчмарк KV-кэша общего префикса промпта ICEQ
+
+Сравнивает запросы к ICEQ по основному промпту с кэшем префикса
+(iceq_prefix_cache=True) и без него:
+- prefill: токены, вычисляемые в каждом запросе, и время генерации
+  одного токена (почти целиком prefill) на запрос
+- паритет: при жадном декодировании ответы с кэшем и без него совпадают
+  (по одному запросу и батчем)
+
+Вместо ICEQ используется маленькая causal LM со случайными весами
+(или модель из --model). Код возврата 1, если ответы различаются.
+
+Запуск:
+    >>> python benchmarks/bench_iceq_prefix_cache.py --requests 8 --new-tokens 32
+'''
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк KV-кэша префикса промпта ICEQ')
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--questions', type=int, default=5)
+    parser.add_argument('--paragraphs', type=int, default=5)
+    parser.add_argument('--new-tokens', type=int, default=32, help='длина ответа при проверке паритета')
+    parser.add_argument('--repeats', type=int, default=3, help='повторов замера prefill')
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--model', default=None, help='модель Hugging Face вместо случайной')
+    args = parser.parse_args()
+
+    sys.path[:0] = [SRC_DIR, BENCH_DIR]
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    import io
+    import contextlib
+
+    from synthetic import make_text, make_tiny_causal_lm
+
+    import generation
+    from generation import QuestionsGenerator, ICEQ_MODEL_KEY
+
+    generator = QuestionsGenerator(embedding_cache_dir=None, response_cache_dir=None, time_estimator_path=None)
+    texts = [make_text(args.paragraphs, seed=i) for i in range(args.requests)]
+    corpus = []
+    for name in ('system_prompt.txt', 'user_prompt.txt'):
+        with open(name, encoding='utf8') as f:
+            corpus.append(f.read())
+    iceq_model = make_tiny_causal_lm(corpus + texts, hidden_size=args.hidden_size, layers=args.layers, model_name=args.model)
+    iceq_model['model'].generation_config.do_sample = False
+    generator.models.register(ICEQ_MODEL_KEY, lambda: iceq_model)
+
+    run = generator._QuestionsGenerator__run_iceq_requests
+    shards = [(text, args.questions) for text in texts]
+
+    def quiet(fn):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+
+    # Prefill: генерация одного токена, минимальное время из repeats на каждый запрос
+    generation.ICEQ_MAX_NEW_TOKENS = 1
+    prefill_ms = {}
+    for enabled in (False, True):
+        generator.iceq_prefix_cache = enabled
+        quiet(lambda: run(shards[:1]))  # прогрев и расчёт кэша префикса
+        per_request = []
+        for shard in shards:
+            seconds = float('inf')
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                quiet(lambda: run([shard]))
+                seconds = min(seconds, time.perf_counter() - start)
+            per_request.append(seconds * 1000)
+        prefill_ms[enabled] = statistics.median(per_request)
+
+    # Паритет ответов при жадном декодировании
+    generation.ICEQ_MAX_NEW_TOKENS = args.new_tokens
+    responses = {}
+    for enabled in (False, True):
+        generator.iceq_prefix_cache = enabled
+        responses[enabled] = (
+            quiet(lambda: [run([shard])[0] for shard in shards]),
+            quiet(lambda: run(shards))
+        )
+
+    tokenizer = iceq_model['tokenizer']
+    prompt_tokens = statistics.median(
+        len(tokenizer(generator._QuestionsGenerator__render_iceq_prompt(tokenizer, *shard))['input_ids'])
+        for shard in shards
+    )
+    prefix = generator.models_status()['iceq_prefix_cache']
+
+    header = f'{"кэш префикса":>13} {"prefill, токенов":>17} {"1 токен, мс":>12}'
+    print(header)
+    print('-' * len(header))
+    print(f'{"нет":>13} {prompt_tokens:>17.0f} {prefill_ms[False]:>12.1f}')
+    print(f'{"да":>13} {prompt_tokens - prefix["tokens"]:>17.0f} {prefill_ms[True]:>12.1f}')
+    print()
+    print(f'Префикс: {prefix["tokens"]} токенов, prefill префикса {prefix["prefill_ms"]} мс; '
+          f'экономия на запрос: {prefill_ms[False] - prefill_ms[True]:.1f} мс (медиана)')
+
+    single_equal = responses[False][0] == responses[True][0]
+    batch_equal = responses[False][1] == responses[True][1]
+    print(f'Паритет (жадное декодирование, {args.new_tokens} токенов): '
+          f'по одному запросу - {"✅" if single_equal else "❌"}, батчем - {"✅" if batch_equal else "❌"}')
+    if not (single_equal and batch_equal):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
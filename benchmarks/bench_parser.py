@@ -0,0 +1,227 @@
+'''
+ICEQ (2025) - Бенчмарк разбора ответов модели
+
+Сравнивает прежний разбор (накопление ответа `+=` по дельтам потока и разбор
+строки целиком: json.loads, затем регулярные выражения) с инкрементальным
+IncrementalQuestionParser на синтетических ответах размером в мегабайты во
+всех трёх форматах: JSON (в том числе в ограждении ```json), нумерованный
+(+/-/!) и упрощённый формат ICEQ. Проверяет, что результаты совпадают, и
+показывает максимальный размер буфера парсера. Отдельно проверяет ответ в
+ограждении, разбитый на дельты по 1-4 символа (ограждение приходит по частям).
+
+Запуск:
+    >>> python benchmarks/bench_parser.py --megabytes 1 4 --delta-size 8
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from question_parser import IncrementalQuestionParser  # noqa: E402
+
+FORMATS = ('json', 'json-fenced', 'numbered', 'iceq')
+
+
+def legacy_parse_questions(text_questions: str) -> list[dict]:
+    """Прежняя реализация parse_questions из generation.py"""
+    try:
+        json_data = json.loads(text_questions)
+        if isinstance(json_data, list):
+            questions = []
+            for item in json_data:
+                if 'question' in item and 'options' in item and 'correct_answer' in item:
+                    answers = []
+                    for i, option in enumerate(item['options'], 1):
+                        answers.append({'answer': option, 'is_correct': (i == item['correct_answer'])})
+                    questions.append({
+                        'question': item['question'],
+                        'answers': answers,
+                        'explanation': item.get('explanation', '')
+                    })
+            return questions
+    except json.JSONDecodeError:
+        pass
+
+    question_block_pattern = re.compile(r'(?ms)^\s*(\d+)\.\s*(.+?)(?=^\s*\d+\.\s|\Z)')
+    answer_line_pattern = re.compile(r'^\s*([+-])\s*(.+)')
+    explanation_line_pattern = re.compile(r'^\s*!\s*(.+)')
+
+    questions = []
+    for number, block in question_block_pattern.findall(text_questions):
+        lines = block.splitlines()
+        if not lines:
+            continue
+        question_text = lines[0].strip()
+        answers = []
+        explanation = ""
+        for line in lines[1:]:
+            line = line.strip()
+            if not line:
+                continue
+            answer_match = answer_line_pattern.match(line)
+            explanation_match = explanation_line_pattern.match(line)
+            if answer_match:
+                sign, answer_text = answer_match.groups()
+                answers.append({'answer': answer_text.strip(), 'is_correct': (sign == '+')})
+            elif explanation_match:
+                explanation = explanation_match.group(1).strip()
+        if answers:
+            questions.append({'question': question_text, 'answers': answers, 'explanation': explanation})
+    return questions
+
+
+def legacy_parse_iceq_response(response: str) -> list[dict]:
+    """Прежняя реализация QuestionsGenerator.__parse_iceq_response (без ограничения количества)"""
+    questions = []
+    question_pattern = r'(\d+)\.\s*Вопрос:\s*(.+?)(?=\d+\.\s*Вопрос:|$)'
+    for question_num, question_block in re.findall(question_pattern, response, re.DOTALL | re.IGNORECASE):
+        lines = question_block.strip().split('\n')
+        question_text = lines[0].strip()
+        answers = []
+        correct_answer = None
+        for line in lines[1:]:
+            line = line.strip()
+            variant_match = re.match(r'([ABCD])\)\s*(.+)', line)
+            if variant_match:
+                letter, text = variant_match.groups()
+                answers.append({'answer': text.strip(), 'is_correct': False, 'letter': letter})
+            answer_match = re.match(r'Ответ:\s*([ABCD])', line)
+            if answer_match:
+                correct_answer = answer_match.group(1)
+        if correct_answer and answers:
+            for answer in answers:
+                if answer['letter'] == correct_answer:
+                    answer['is_correct'] = True
+                    break
+            for answer in answers:
+                del answer['letter']
+            questions.append({'question': question_text, 'answers': answers, 'explanation': ''})
+    return questions
+
+
+def make_response(response_format: str, megabytes: float, seed: int = 0) -> str:
+    """Синтетический ответ модели заданного формата и размера"""
+    rng = random.Random(seed)
+    words = 'клетка мембрана белок фермент ядро синтез энергия ткань организм реакция'.split()
+
+    def phrase(n: int) -> str:
+        return ' '.join(rng.choice(words) for _ in range(n))
+
+    blocks = []
+    size = 0
+    index = 1
+    while size < megabytes * 1024 * 1024:
+        question = phrase(12) + '?'
+        options = [phrase(5) for _ in range(4)]
+        correct = rng.randrange(4)
+        explanation = phrase(20) + ' "цитата" \\ конец'
+        match response_format:
+            case 'json' | 'json-fenced':
+                block = json.dumps({
+                    'question': question,
+                    'options': options,
+                    'correct_answer': correct + 1,
+                    'explanation': explanation
+                }, ensure_ascii=False)
+            case 'numbered':
+                lines = [f'{index}. {question}']
+                lines += [('+ ' if i == correct else '- ') + option for i, option in enumerate(options)]
+                lines.append('! ' + explanation)
+                block = '\n'.join(lines)
+            case 'iceq':
+                lines = [f'{index}. Вопрос: {question}']
+                lines += [f'{letter}) {option}' for letter, option in zip('ABCD', options)]
+                lines.append(f'Ответ: {"ABCD"[correct]}')
+                block = '\n'.join(lines)
+        blocks.append(block)
+        size += len(block.encode('utf8'))
+        index += 1
+
+    if response_format == 'json':
+        return '[' + ',\n'.join(blocks) + ']'
+    if response_format == 'json-fenced':
+        return '```json\n[' + ',\n'.join(blocks) + ']\n```'
+    return '\n\n'.join(blocks)
+
+
+def strip_fence(response: str) -> str:
+    """Убирает ограждение ```json: прежний разбор его не поддерживал"""
+    return response.strip().removeprefix('```json').removesuffix('```')
+
+
+def legacy_pipeline(response_format: str, deltas: list[str]) -> list[dict]:
+    full_response = ''
+    for delta in deltas:
+        full_response += delta
+    if response_format == 'iceq':
+        return legacy_parse_iceq_response(full_response)
+    if response_format == 'json-fenced':
+        full_response = strip_fence(full_response)
+    return legacy_parse_questions(full_response)
+
+
+def incremental_pipeline(deltas: list[str]) -> tuple[list[dict], int, float]:
+    parser = IncrementalQuestionParser()
+    questions = []
+    max_buffer = 0
+    first_question_at = None
+    start = time.perf_counter()
+    for delta in deltas:
+        questions.extend(parser.feed(delta))
+        max_buffer = max(max_buffer, parser.buffer_size)
+        if first_question_at is None and questions:
+            first_question_at = time.perf_counter() - start
+    questions.extend(parser.close())
+    return questions, max_buffer, first_question_at or 0.0
+
+
+def check_split_fence() -> None:
+    """Ответ в ограждении ```json, разбитый на мелкие дельты, разбирается так же, как целиком"""
+    response = make_response('json-fenced', 0.01)
+    expected = legacy_parse_questions(strip_fence(response))
+    for delta_size in (1, 2, 3, 4):
+        deltas = [response[i:i + delta_size] for i in range(0, len(response), delta_size)]
+        questions, _, _ = incremental_pipeline(deltas)
+        print(f'ограждение ```json, дельты по {delta_size} симв.: {len(questions)} из {len(expected)} вопросов, '
+              f'{"совпадает" if questions == expected else "НЕ СОВПАДАЕТ"}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк разбора ответов модели ICEQ')
+    parser.add_argument('--megabytes', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--delta-size', type=int, default=8, help='размер дельты потока, символов')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    args = parser.parse_args()
+
+    check_split_fence()
+    header = (f'{"формат":>11} {"МБ":>5} {"вопросов":>9} {"прежний, с":>11} {"инкр., с":>9} '
+              f'{"1-й вопрос, мс":>15} {"макс. буфер":>12} {"совпадает":>10}')
+    print(header)
+    print('-' * len(header))
+    for megabytes in args.megabytes:
+        for response_format in args.formats:
+            response = make_response(response_format, megabytes)
+            deltas = [response[i:i + args.delta_size] for i in range(0, len(response), args.delta_size)]
+
+            start = time.perf_counter()
+            legacy = legacy_pipeline(response_format, deltas)
+            legacy_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            incremental, max_buffer, first_question_at = incremental_pipeline(deltas)
+            incremental_seconds = time.perf_counter() - start
+
+            print(f'{response_format:>11} {megabytes:>5g} {len(incremental):>9} {legacy_seconds:>11.2f} '
+                  f'{incremental_seconds:>9.2f} {first_question_at * 1000:>15.2f} {max_buffer:>12} '
+                  f'{"да" if legacy == incremental else "НЕТ":>10}')
+
+
+if __name__ == '__main__':
+    main()
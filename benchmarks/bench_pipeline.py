@@ -0,0 +1,274 @@
+'''
+ICEQ (2025) - Бенчмарк стадий конвейера генерации
+
+Измеряет время и пиковое потребление памяти (tracemalloc) каждой стадии
+QuestionsGenerator по отдельности на синтетических текстах от 1 тыс. до
+200 тыс. абзацев:
+- split: однопроходное разбиение на чанки (chunking) и фильтрация
+- clustering_encode: эмбеддинги для кластеризации (через кэш эмбеддингов)
+- kmeans: кластеризация
+- central: выбор центральных чанков
+- packing: упаковка центральных чанков в бюджет токенов промпта (context_packing)
+- search_encode: эмбеддинги документов и вопросов для поиска объяснений
+- faiss_build / faiss_search: индекс центральных чанков и поиск по нему
+- parse: разбор ответа LLM (parse_questions)
+- generate: весь запрос целиком
+
+Энкодеры заменяются StubEncoder, LLM - FakeLLMClient, поэтому бенчмарк
+работает без сети и GPU. Результаты сравниваются с сохранённым базовым
+замером; код возврата 1 при регрессии.
+
+Запуск:
+    >>> python benchmarks/bench_pipeline.py --sizes 1000 10000 50000 200000
+    >>> python benchmarks/bench_pipeline.py --save-baseline  # обновить базовый замер
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+# Базовый замер по умолчанию
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'pipeline.json')
+# Допустимое замедление (и рост памяти) относительно базового замера
+DEFAULT_TOLERANCE = 0.3
+# Размер текста для прогрева
+WARMUP_PARAGRAPHS = 500
+# Разница меньше этой (секунд / МБ) не считается регрессией - шум измерений
+MIN_SECONDS_DELTA = 0.005
+MIN_MEMORY_DELTA_MB = 1.0
+
+
+def measure(fn, repeats: int, setup=None):
+    """
+    Измеряет стадию: минимальное время из repeats запусков и пиковую память
+
+    Args:
+        fn (Callable): стадия без аргументов
+        repeats (int): количество запусков для замера времени
+        setup (Callable | None): подготовка перед каждым запуском (не измеряется)
+
+    Returns:
+        tuple: (результат стадии, секунд, пиковая память в МБ)
+    """
+    seconds = float('inf')
+    result = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    # Память измеряется отдельным запуском: tracemalloc замедляет код
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def run_size(generator, paragraphs: int, args) -> dict:
+    """Измеряет все стадии на тексте из paragraphs абзацев"""
+    import faiss
+    import numpy as np
+
+    from synthetic import make_text, make_questions, make_llm_response
+    from chunking import chunk_source
+    from context_packing import DEFAULT_CONTEXT_TOKEN_BUDGET, cluster_priorities, get_token_counter, pack_chunks
+    from generation import parse_questions, DATA_PART, MIN_CLUSTERS_NUM, MAX_CLUSTERS_NUM
+
+    text = make_text(paragraphs, seed=paragraphs)
+    questions = make_questions(args.questions)
+    response = make_llm_response(args.questions)
+    clear_cache = generator.embedding_cache.clear_memory
+    engine = generator._QuestionsGenerator__clustering_engine
+    clusters_num = min(MAX_CLUSTERS_NUM, max(MIN_CLUSTERS_NUM, int(len(text.split('\n')) * DATA_PART)))
+
+    results = {}
+
+    def record(stage: str, fn, setup=None):
+        result, seconds, peak_mb = measure(fn, args.repeats, setup)
+        results[stage] = {'seconds': round(seconds, 5), 'peak_mb': round(peak_mb, 2)}
+        return result
+
+    chunks = record('split', lambda: generator._QuestionsGenerator__split_chunks(chunk_source(text)))
+    embeddings = record(
+        'clustering_encode',
+        lambda: generator._QuestionsGenerator__get_clustering_embeddings(chunks),
+        setup=clear_cache
+    )
+    clustering = record('kmeans', lambda: engine.fit(embeddings, clusters_num))
+    central_indices = record('central', lambda: generator._QuestionsGenerator__get_central_indices(clustering))
+    target_chunks = chunks[central_indices]
+    priorities = cluster_priorities(clustering, central_indices)
+    record(
+        'packing',
+        lambda: pack_chunks(target_chunks, get_token_counter(None), DEFAULT_CONTEXT_TOKEN_BUDGET, priorities)
+    )
+
+    def search_encode():
+        documents = generator._QuestionsGenerator__get_document_embeddings(target_chunks, embeddings[central_indices])
+        queries = generator._QuestionsGenerator__get_query_embeddings(questions)
+        return np.ascontiguousarray(documents, dtype=np.float32), np.ascontiguousarray(queries, dtype=np.float32)
+
+    documents, queries = record('search_encode', search_encode, setup=clear_cache)
+
+    def faiss_build():
+        index = faiss.IndexFlatIP(documents.shape[1])
+        index.add(documents)
+        return index
+
+    index = record('faiss_build', faiss_build)
+    record('faiss_search', lambda: index.search(queries, 1))
+    record('parse', lambda: parse_questions(response))
+    record(
+        'generate',
+        lambda: generator.generate(text, args.questions, llm='deepseek', use_cache=False),
+        setup=clear_cache
+    )
+    return results
+
+
+def run_benchmark(args) -> dict:
+    sys.path.insert(0, SRC_DIR)
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'benchmark')
+    # Без сети: токенизатор LLM не скачивается, токены контекста оцениваются по символам
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+
+    from synthetic import StubEncoder, FakeLLMClient
+    from generation import QuestionsGenerator, CLUSTERING_MODEL_KEY, SEARCH_MODEL_KEY
+
+    generator = QuestionsGenerator(
+        embedding_cache_dir=None,
+        response_cache_dir=None,
+        clustering_backend=args.backend,
+        encoder_mode=args.encoder_mode,
+        llm_client=FakeLLMClient()
+    )
+    encoder = StubEncoder(dim=args.dim)
+    generator.models.register(CLUSTERING_MODEL_KEY, lambda: encoder)
+    generator.models.register(SEARCH_MODEL_KEY, lambda: encoder)
+
+    # Прогрев: ленивые импорты (torch, sklearn, faiss) не должны попасть в замер
+    run_size(generator, WARMUP_PARAGRAPHS, argparse.Namespace(**{**vars(args), 'repeats': 1}))
+
+    results = {}
+    for paragraphs in args.sizes:
+        results[str(paragraphs)] = run_size(generator, paragraphs, args)
+        print_size(paragraphs, results[str(paragraphs)], None)
+    return results
+
+
+def benchmark_config(args) -> dict:
+    """Параметры, при которых замеры сравнимы с базовыми"""
+    return {
+        'dim': args.dim,
+        'backend': args.backend,
+        'encoder_mode': args.encoder_mode,
+        'questions': args.questions
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнивает замеры с базовыми
+
+    Returns:
+        list[str]: описания регрессий
+    """
+    regressions = []
+    for size, stages in current.items():
+        for stage, values in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            if (values['seconds'] > base['seconds'] * (1 + tolerance)
+                    and values['seconds'] - base['seconds'] > MIN_SECONDS_DELTA):
+                regressions.append(f'{size} абзацев, {stage}: время {base["seconds"]:.4f} → {values["seconds"]:.4f} с')
+            if (values['peak_mb'] > base['peak_mb'] * (1 + tolerance)
+                    and values['peak_mb'] - base['peak_mb'] > MIN_MEMORY_DELTA_MB):
+                regressions.append(f'{size} абзацев, {stage}: память {base["peak_mb"]:.1f} → {values["peak_mb"]:.1f} МБ')
+    return regressions
+
+
+def print_size(paragraphs: int, stages: dict, baseline: dict | None) -> None:
+    header = f'{"абзацев":>8} {"стадия":>18} {"время, мс":>11} {"память, МБ":>11}'
+    if baseline is not None:
+        header += f' {"база, мс":>10} {"×":>6}'
+    print(header)
+    print('-' * len(header))
+    for stage, values in stages.items():
+        line = f'{paragraphs:>8} {stage:>18} {values["seconds"] * 1000:>11.2f} {values["peak_mb"]:>11.2f}'
+        base = (baseline or {}).get(stage)
+        if base is not None:
+            ratio = values['seconds'] / base['seconds'] if base['seconds'] else 0.0
+            line += f' {base["seconds"] * 1000:>10.2f} {ratio:>6.2f}'
+        print(line)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк стадий конвейера генерации ICEQ')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 50_000, 200_000])
+    parser.add_argument('--dim', type=int, default=1024, help='размерность эмбеддингов (e5-large: 1024)')
+    parser.add_argument('--backend', default='kmeans', help='алгоритм кластеризации')
+    parser.add_argument('--encoder-mode', default='dual', choices=['dual', 'single'])
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=3, help='запусков на стадию (берётся минимум)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='файл базового замера')
+    parser.add_argument('--save-baseline', action='store_true', help='сохранить замер как базовый')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='допустимый рост (0.3 = 30%%)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCH_DIR)
+    baseline_path = os.path.abspath(args.baseline)
+    results = run_benchmark(args)
+    config = benchmark_config(args)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf8') as f:
+            json.dump({'config': config, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'✅ Базовый замер сохранён: {baseline_path}')
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f'ℹ️ Базовый замер не найден ({baseline_path}), сравнение пропущено')
+        return
+
+    with open(baseline_path, 'r', encoding='utf8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print(f'⚠️ Базовый замер снят с другими параметрами ({baseline.get("config")}), сравнение пропущено')
+        return
+
+    print('Сравнение с базовым замером:')
+    for size, stages in results.items():
+        if size in baseline['results']:
+            print_size(int(size), stages, baseline['results'][size])
+
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        for regression in regressions:
+            print(f'❌ {regression}')
+        sys.exit(1)
+    print('✅ Регрессий нет')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+'''
+ICEQ (2025) - Бенчмарк памяти pre-fork сервера
+
+Сравнивает потребление памяти N рабочих процессов pre-fork сервера
+(модели загружены до fork и общие, модуль prefork) и N независимых
+процессов (как N копий python app.py, каждая со своими моделями):
+- RSS, PSS и USS каждого процесса (/proc/<pid>/smaps_rollup, только Linux)
+- суммарный PSS - реальное потребление памяти всеми процессами
+
+RSS учитывает общие страницы в каждом процессе, поэтому у рабочих
+процессов он почти такой же, как у независимых: сравнивать нужно USS
+(собственная память процесса) и суммарный PSS.
+
+Серверы запускаются в отдельных процессах с моделью ICEQ - маленькой
+causal LM со случайными весами (--hidden-size, --layers задают размер) и
+заглушками энкодеров. До замера каждому серверу отправляются запросы
+/generate с model=iceq, чтобы модели поработали в рабочих процессах.
+
+Запуск:
+    >>> python benchmarks/bench_prefork_memory.py --workers 4 --hidden-size 1024 --layers 8
+'''
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+# Сколько ждать запуска сервера, секунд
+STARTUP_TIMEOUT = 300
+
+
+def serve(args) -> None:
+    """Запускает сервер ICEQ с маленькой моделью (вызывается в дочернем процессе бенчмарка)"""
+    sys.path[:0] = [SRC_DIR, BENCH_DIR]
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    from synthetic import make_text, make_tiny_causal_lm, StubEncoder
+
+    import app
+    import generation
+    from generation import CLUSTERING_MODEL_KEY, SEARCH_MODEL_KEY, ICEQ_MODEL_KEY
+    from prefork import PreforkServer
+
+    generator = app.question_generator
+    corpus = [make_text(args.paragraphs, seed=0)]
+    for name in ('system_prompt.txt', 'user_prompt.txt'):
+        with open(name, encoding='utf8') as f:
+            corpus.append(f.read())
+    encoder = StubEncoder(dim=args.dim)
+    generator.models.register(CLUSTERING_MODEL_KEY, lambda: encoder)
+    generator.models.register(SEARCH_MODEL_KEY, lambda: encoder)
+    generator.models.register(
+        ICEQ_MODEL_KEY,
+        lambda: make_tiny_causal_lm(corpus, hidden_size=args.hidden_size, layers=args.layers)
+    )
+    generation.ICEQ_MAX_NEW_TOKENS = args.new_tokens
+
+    def load_models():
+        generator.warm_up([CLUSTERING_MODEL_KEY, SEARCH_MODEL_KEY, ICEQ_MODEL_KEY])
+
+    if args.serve == 'prefork':
+        server = PreforkServer(app.app, port=args.port, workers=args.workers, preload=load_models)
+        server.run()
+    else:
+        from werkzeug.serving import make_server
+
+        load_models()
+        make_server('127.0.0.1', args.port, app.app, threaded=True).serve_forever()
+
+
+def request_json(url: str, payload: dict | None = None) -> dict:
+    data = json.dumps(payload).encode('utf8') if payload is not None else None
+    headers = {'Content-Type': 'application/json'} if data is not None else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=600) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(port: int, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Сервер на порту {port} завершился с кодом {process.returncode}')
+        try:
+            request_json(f'http://127.0.0.1:{port}/health')
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f'Сервер на порту {port} не запустился за {STARTUP_TIMEOUT} сек')
+
+
+def children(pid: int) -> list[int]:
+    with open(f'/proc/{pid}/task/{pid}/children', encoding='utf8') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def start_server(args, mode: str, port: int, workers: int) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port), '--workers', str(workers),
+        '--hidden-size', str(args.hidden_size), '--layers', str(args.layers), '--dim', str(args.dim),
+        '--paragraphs', str(args.paragraphs), '--new-tokens', str(args.new_tokens)
+    ]
+    env = dict(os.environ, HF_HUB_OFFLINE='1', DEEPSEEK_API_KEY=os.getenv('DEEPSEEK_API_KEY', 'benchmark'))
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def load(args, ports: list[int]) -> set[int]:
+    """
+    Отправляет запросы генерации на серверы
+
+    Returns:
+        set[int]: pid процессов, ответивших на /health во время нагрузки
+    """
+    sys.path[:0] = [BENCH_DIR]
+    from synthetic import make_text
+
+    payloads = [
+        {'text': make_text(args.paragraphs, seed=i), 'questionNumber': 3, 'model': 'iceq', 'noCache': True}
+        for i in range(args.requests)
+    ]
+    pids = set()
+
+    def send(i: int) -> None:
+        port = ports[i % len(ports)]
+        request_json(f'http://127.0.0.1:{port}/generate', payloads[i])
+        pids.add(request_json(f'http://127.0.0.1:{port}/health')['pid'])
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(send, range(args.requests)))
+    return pids
+
+
+def measure(args, mode: str) -> dict:
+    sys.path[:0] = [SRC_DIR]
+    from prefork import process_memory_mb
+
+    if mode == 'prefork':
+        servers = [start_server(args, 'prefork', args.port, args.workers)]
+        ports = [args.port]
+    else:
+        ports = [args.port + i for i in range(args.workers)]
+        servers = [start_server(args, 'single', port, 1) for port in ports]
+    try:
+        for port, server in zip(ports, servers):
+            wait_ready(port, server)
+        served = load(args, ports)
+
+        if mode == 'prefork':
+            workers = children(servers[0].pid)
+            processes = {'parent': [servers[0].pid], 'workers': workers}
+        else:
+            processes = {'parent': [], 'workers': [server.pid for server in servers]}
+        memory = {role: [process_memory_mb(pid) for pid in pids] for role, pids in processes.items()}
+        return {
+            'memory': memory,
+            'served': len(served & set(processes['workers'])),
+            'total_pss': sum(m['pss'] for role in memory.values() for m in role)
+        }
+    finally:
+        for server in servers:
+            server.send_signal(signal.SIGTERM)
+        for server in servers:
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк памяти pre-fork сервера ICEQ')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=16)
+    parser.add_argument('--hidden-size', type=int, default=1024)
+    parser.add_argument('--layers', type=int, default=8)
+    parser.add_argument('--dim', type=int, default=1024, help='размерность эмбеддингов заглушки энкодера')
+    parser.add_argument('--paragraphs', type=int, default=20)
+    parser.add_argument('--new-tokens', type=int, default=16, help='длина ответа ICEQ')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--serve', choices=['prefork', 'single'], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args)
+        return
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print('❌ Нужен Linux с /proc/<pid>/smaps_rollup')
+        sys.exit(1)
+
+    results = {mode: measure(args, mode) for mode in ('independent', 'prefork')}
+
+    header = f'{"режим":>12} {"процесс":>10} {"RSS, МБ":>9} {"PSS, МБ":>9} {"USS, МБ":>9}'
+    print(header)
+    print('-' * len(header))
+    for mode, label in (('independent', 'независимые'), ('prefork', 'pre-fork')):
+        for role, memories in results[mode]['memory'].items():
+            for m in memories:
+                name = 'родитель' if role == 'parent' else 'рабочий'
+                print(f'{label:>12} {name:>10} {m["rss"]:>9.0f} {m["pss"]:>9.0f} {m["uss"]:>9.0f}')
+
+    independent, prefork = results['independent'], results['prefork']
+    print(f'\nСуммарный PSS {args.workers} процессов: независимые {independent["total_pss"]:.0f} МБ, '
+          f'pre-fork {prefork["total_pss"]:.0f} МБ (с родителем), '
+          f'экономия {1 - prefork["total_pss"] / independent["total_pss"]:.0%}')
+    print(f'Рабочих процессов pre-fork, ответивших на запросы: {prefork["served"]} из {args.workers}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+'''
+ICEQ (2025) - Бенчмарк prompt lookup decoding для ICEQ
+
+Сравнивает генерацию по основному промпту ICEQ с обычным декодированием
+и с prompt lookup decoding (iceq_prompt_lookup_tokens > 0):
+- токенов в секунду и токенов на проход модели
+- доля принятых токенов черновика (acceptance rate) и средняя длина черновика
+- паритет: при жадном декодировании ответы совпадают с обычным декодированием
+
+Случайная модель не цитирует текст, как ICEQ, поэтому маленькая LM
+дообучается (--fit-steps) воспроизводить эталонные ответы в формате ICEQ:
+варианты ответов и объяснения цитируют фрагменты исходного текста. Так
+черновики из промпта принимаются примерно так же, как у настоящей модели.
+С --model используется указанная модель без дообучения.
+
+Проход маленькой LM занимает доли миллисекунды, поэтому её токены в секунду
+определяются накладными расходами шага assisted decoding в transformers, а не
+моделью: ускорение проявляется, когда проход модели дороже этих расходов
+(для ICEQ на CPU - на порядки), и тогда стремится к токенам на проход.
+
+Код возврата 1, если ответы различаются.
+
+Запуск:
+    >>> python benchmarks/bench_prompt_lookup.py --requests 4 --draft-tokens 4 10
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+
+
+def make_reference_answer(text: str, questions_num: int, seed: int) -> str:
+    """
+    Эталонный ответ ICEQ по тексту: правильный вариант и объяснение - цитаты
+
+    Args:
+        text (str): исходный текст
+        questions_num (int): количество вопросов
+        seed (int): зерно генератора случайных чисел
+
+    Returns:
+        str: ответ в нумерованном формате (+/-/!)
+    """
+    rng = random.Random(seed)
+    words = text.split()
+    blocks = []
+    for i in range(1, questions_num + 1):
+        start = rng.randrange(len(words) - 20)
+        wrong = [' '.join(rng.sample(words, 5)) for _ in range(3)]
+        blocks.append('\n'.join([
+            f'{i}. Что в тексте сказано о "{" ".join(words[start:start + 3])}"?',
+            f'- {wrong[0]}',
+            f'+ {" ".join(words[start + 3:start + 9])}',
+            f'- {wrong[1]}',
+            f'- {wrong[2]}',
+            f'! Правильный ответ подтверждается фразой из текста: "{" ".join(words[start:start + 12])}". '
+            f'Это показывает, что именно этот вариант соответствует описанию в источнике.'
+        ]))
+    return '\n\n'.join(blocks)
+
+
+def fit_to_answers(model, sequences: list[tuple[list[int], list[int]]], steps: int) -> float:
+    """
+    Дообучает модель воспроизводить ответы по промптам (loss только по ответу)
+
+    Returns:
+        float: loss последнего шага
+    """
+    import torch
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=3e-3)
+    model.train()
+    loss = None
+    for step in range(steps):
+        prompt, answer = sequences[step % len(sequences)]
+        input_ids = torch.tensor([prompt + answer])
+        labels = input_ids.clone()
+        labels[0, :len(prompt)] = -100
+        loss = model(input_ids=input_ids, labels=labels).loss
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    model.eval()
+    return loss.item() if loss is not None else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк prompt lookup decoding ICEQ')
+    parser.add_argument('--requests', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=3)
+    parser.add_argument('--paragraphs', type=int, default=5)
+    parser.add_argument('--draft-tokens', type=int, nargs='+', default=[4, 10], help='длина черновика')
+    parser.add_argument('--ngram', type=int, default=None, help='максимальная длина n-граммы поиска')
+    parser.add_argument('--fit-steps', type=int, default=400, help='шагов дообучения маленькой LM')
+    parser.add_argument('--hidden-size', type=int, default=128)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--model', default=None, help='модель Hugging Face вместо маленькой LM')
+    args = parser.parse_args()
+
+    sys.path[:0] = [SRC_DIR, BENCH_DIR]
+    os.chdir(SRC_DIR)  # промпты читаются относительно src
+
+    import io
+    import contextlib
+
+    from transformers.generation import utils as generation_utils
+    from transformers.generation.candidate_generator import PromptLookupCandidateGenerator
+
+    from synthetic import make_text, make_tiny_causal_lm
+
+    import generation
+    from generation import QuestionsGenerator, ICEQ_MODEL_KEY
+
+    # Подсчёт токенов черновика и принятых токенов: generate создаёт генератор черновиков сам
+    drafts = {'drafted': 0, 'accepted': 0, 'steps': 0}
+
+    class CountingCandidateGenerator(PromptLookupCandidateGenerator):
+        def get_candidates(self, input_ids):
+            candidates, logits = super().get_candidates(input_ids)
+            drafts['drafted'] += candidates.shape[1] - input_ids.shape[1]
+            drafts['steps'] += 1
+            return candidates, logits
+
+        def update_candidate_strategy(self, input_ids, scores, num_matches):
+            drafts['accepted'] += int(num_matches)
+            super().update_candidate_strategy(input_ids, scores, num_matches)
+
+    generation_utils.PromptLookupCandidateGenerator = CountingCandidateGenerator
+    if args.ngram is not None:
+        generation.ICEQ_PROMPT_LOOKUP_NGRAM = args.ngram
+
+    generator = QuestionsGenerator(embedding_cache_dir=None, response_cache_dir=None, time_estimator_path=None)
+    render = generator._QuestionsGenerator__render_iceq_prompt
+    texts = [make_text(args.paragraphs, seed=i) for i in range(args.requests)]
+    references = [make_reference_answer(text, args.questions, seed=i) for i, text in enumerate(texts)]
+    corpus = []
+    for name in ('system_prompt.txt', 'user_prompt.txt'):
+        with open(name, encoding='utf8') as f:
+            corpus.append(f.read())
+    iceq_model = make_tiny_causal_lm(corpus + texts + references, hidden_size=args.hidden_size, layers=args.layers, model_name=args.model)
+    tokenizer, model = iceq_model['tokenizer'], iceq_model['model']
+
+    if args.model is None:
+        sequences = [
+            (tokenizer(render(tokenizer, text, args.questions))['input_ids'],
+             tokenizer(reference)['input_ids'] + [tokenizer.eos_token_id])
+            for text, reference in zip(texts, references)
+        ]
+        start = time.perf_counter()
+        loss = fit_to_answers(model, sequences, args.fit_steps)
+        print(f'Дообучение на эталонных ответах: {args.fit_steps} шагов, loss {loss:.4f}, '
+              f'{time.perf_counter() - start:.1f} сек')
+        generation.ICEQ_MAX_NEW_TOKENS = max(len(answer) for _, answer in sequences) + 16
+    else:
+        generation.ICEQ_MAX_NEW_TOKENS = 512
+
+    model.generation_config.do_sample = False
+    generator.models.register(ICEQ_MODEL_KEY, lambda: iceq_model)
+    run = generator._QuestionsGenerator__run_iceq_requests
+    shards = [(text, args.questions) for text in texts]
+
+    def quiet(fn):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+
+    results = []
+    baseline = None
+    for draft_tokens in [0] + args.draft_tokens:
+        generator.iceq_prompt_lookup_tokens = draft_tokens
+        quiet(lambda: run(shards[:1]))  # прогрев
+        drafts.update(drafted=0, accepted=0, steps=0)
+
+        responses = []
+        seconds = 0.0
+        for shard in shards:
+            start = time.perf_counter()
+            responses += quiet(lambda: run([shard]))
+            seconds += time.perf_counter() - start
+
+        tokens = sum(len(tokenizer(response, add_special_tokens=False)['input_ids']) for response in responses)
+        if baseline is None:
+            baseline = responses
+            # Сравнение по токенам: декодирование может по-другому расставить пробелы
+            matched = sum(
+                tokenizer(response, add_special_tokens=False)['input_ids'] == tokenizer(reference, add_special_tokens=False)['input_ids']
+                for response, reference in zip(responses, references)
+            )
+        results.append({
+            'draft_tokens': draft_tokens,
+            'tokens_per_second': tokens / seconds,
+            'tokens_per_step': tokens / drafts['steps'] if drafts['steps'] else 1.0,
+            'acceptance': drafts['accepted'] / drafts['drafted'] if drafts['drafted'] else None,
+            'draft_per_step': drafts['drafted'] / drafts['steps'] if drafts['steps'] else None,
+            'equal': responses == baseline
+        })
+
+    header = (f'{"черновик, токенов":>18} {"токенов/с":>10} {"ускорение":>10} {"токенов на проход":>18} '
+              f'{"черновик на шаг":>16} {"принято":>8} {"паритет":>8}')
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        mode = str(r['draft_tokens']) if r['draft_tokens'] else 'нет'
+        acceptance = f'{r["acceptance"]:.1%}' if r['acceptance'] is not None else '-'
+        draft_per_step = f'{r["draft_per_step"]:.2f}' if r['draft_per_step'] is not None else '-'
+        print(f'{mode:>18} {r["tokens_per_second"]:>10.1f} {r["tokens_per_second"] / results[0]["tokens_per_second"]:>9.2f}x '
+              f'{r["tokens_per_step"]:>18.2f} {draft_per_step:>16} {acceptance:>8} {"✅" if r["equal"] else "❌":>8}')
+
+    if args.model is None:
+        print(f'\nОтветы совпадают с эталоном (цитаты из текста): {matched}/{len(references)}')
+    if not all(r['equal'] for r in results):
+        print('❌ Ответы с prompt lookup decoding отличаются от обычного декодирования')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+ICEQ (2025) - Бенчмарк клиента API провайдеров
+
+Сравнивает накладные расходы на запрос к LLM API на локальном stub-сервере:
+- legacy: как раньше - новый цикл событий, новая aiohttp-сессия (новое
+  TCP-соединение) и чтение промптов с диска на каждый запрос
+- pooled: ProviderClient - общий фоновый цикл, keep-alive соединения,
+  промпты из кэша
+
+Запросы выполняются последовательно и из нескольких потоков (как потоки Flask).
+Время генерации на stub-сервере нулевое, поэтому разница - это именно
+накладные расходы клиента. TLS не используется; с настоящим HTTPS API
+выигрыш keep-alive больше на время TLS-рукопожатия.
+
+Запуск:
+    >>> python benchmarks/bench_provider_client.py --requests 200 --threads 1 8
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import question_generator_api  # noqa: E402
+from question_generator_api import ProviderClient, stream_questions  # noqa: E402
+from stub_llm_server import StubLLMServer  # noqa: E402
+from synthetic import make_text  # noqa: E402
+
+RESPONSE_TEXT = '[' + ', '.join(
+    f'{{"question": "Вопрос {i}?", "options": ["a", "b", "c", "d"], "correct_answer": 1, "explanation": "..."}}'
+    for i in range(10)
+) + ']'
+
+
+def legacy_request(api_url: str, text: str) -> str:
+    """Прежний путь: цикл событий, сессия и чтение промптов на каждый запрос"""
+    question_generator_api._load_prompts.cache_clear()
+
+    async def collect():
+        return ''.join([content async for content in stream_questions('deepseek', text, 10, api_url=api_url)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(collect())
+    finally:
+        loop.close()
+
+
+def run(name: str, request_fn, requests: int, threads: int) -> dict:
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        response = request_fn()
+        latencies.append(time.perf_counter() - start)
+        assert response == RESPONSE_TEXT
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(timed, range(requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        'name': name,
+        'threads': threads,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p95_ms': sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000,
+        'rps': requests / wall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк клиента API провайдеров ICEQ')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--chunks', type=int, default=100, help='количество SSE-событий в ответе')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'stub')
+    text = make_text(20)
+
+    print(f'{"клиент":>8} {"потоков":>8} {"среднее, мс":>12} {"p95, мс":>9} {"запросов/с":>11} {"соединений":>11}')
+    for threads in args.threads:
+        for name in ('legacy', 'pooled'):
+            server = StubLLMServer(RESPONSE_TEXT, chunks=args.chunks)
+            url = server.start()
+            client = ProviderClient(api_url=url)
+
+            if name == 'legacy':
+                request_fn = lambda: legacy_request(url, text)  # noqa: E731
+            else:
+                request_fn = lambda: client.generate('deepseek', text, 10)  # noqa: E731
+
+            request_fn()  # прогрев
+            result = run(name, request_fn, args.requests, threads)
+            print(f'{name:>8} {threads:>8} {result["mean_ms"]:>12.2f} {result["p95_ms"]:>9.2f} '
+                  f'{result["rps"]:>11.0f} {server.connections:>11}')
+
+            client.close()
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+ICEQ (2025) - Проверка времени импорта модулей
+
+Запускает `python -X importtime -c "import <module>"` для модулей из src
+и проверяет, что:
+- тяжёлые библиотеки (torch, faiss, transformers, ...) не импортируются
+  при импорте модуля, а загружаются лениво
+- суммарное время импорта не превышает бюджет
+
+Код возврата 1 при нарушении - скрипт можно использовать в CI.
+
+Запуск:
+    >>> python benchmarks/check_import_time.py
+    >>> python benchmarks/check_import_time.py --modules app --budget-ms 1500
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Библиотеки, которые не должны загружаться при импорте модулей приложения
+HEAVY_MODULES = (
+    'torch',
+    'faiss',
+    'transformers',
+    'peft',
+    'sentence_transformers',
+    'openai',
+    'sklearn',
+    'aiohttp',
+)
+DEFAULT_MODULES = ('generation', 'question_generator_api', 'app')
+# Бюджет на импорт одного модуля, мс
+DEFAULT_BUDGET_MS = 1500
+
+
+def measure_import(module: str) -> list[tuple[str, int, int]]:
+    """
+    Импортирует модуль в отдельном процессе с -X importtime
+
+    Args:
+        module (str): имя модуля в src
+
+    Returns:
+        list[tuple[str, int, int]]: (имя модуля, собственное время, накопленное время) в мкс
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, 'ICEQ_STARTUP_MODE': 'lazy'}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Не удалось импортировать {module}:\n{result.stderr[-2000:]}')
+
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        records.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка времени импорта модулей ICEQ')
+    parser.add_argument('--modules', nargs='+', default=list(DEFAULT_MODULES))
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=10, help='сколько самых медленных импортов показать')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        records = measure_import(module)
+        # Модули верхнего уровня в выводе importtime не имеют отступа
+        top_level = [(name.strip(), cumulative) for name, _, cumulative in records if not name.startswith('  ')]
+        total_ms = sum(cumulative for _, cumulative in top_level) / 1000
+        imported = {name.strip().split('.')[0] for name, _, _ in records}
+        heavy = sorted(imported.intersection(HEAVY_MODULES))
+
+        status = '✅'
+        if heavy or total_ms > args.budget_ms:
+            status = '❌'
+            failed = True
+
+        print(f'{status} import {module}: {total_ms:.0f} мс (бюджет {args.budget_ms:.0f} мс)')
+        if heavy:
+            print(f'   Тяжёлые библиотеки импортируются сразу: {", ".join(heavy)}')
+        # Самые медленные импорты по собственному времени
+        for name, self_us, _ in sorted(records, key=lambda item: -item[1])[:args.top]:
+            print(f'   {self_us / 1000:8.1f} мс  {name.strip()}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+ICEQ (2025) - Локальный stub-сервер OpenAI-совместимого API
+
+Отдаёт заранее заданный ответ потоком SSE (как llm.chutes.ai) без обращения
+к сети. Используется в бенчмарках вместо настоящего провайдера.
+
+Пример использования:
+    >>> server = StubLLMServer(response_text, chunks=50)
+    >>> url = server.start()
+    >>> client = ProviderClient(api_url=url)
+    >>> server.connections  # сколько TCP-соединений открыли клиенты
+'''
+
+import json
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+class StubLLMServer:
+    """
+    Stub-сервер chat/completions в отдельном потоке
+
+    Args:
+        response_text (str): ответ модели, отдаваемый каждому запросу
+        chunks (int): на сколько SSE-событий разбить ответ
+        chunk_delay (float): пауза между событиями, секунд
+        first_token_delay (float): пауза перед первым событием, секунд
+    """
+
+    def __init__(self, response_text: str, chunks: int = 50, chunk_delay: float = 0.0, first_token_delay: float = 0.0):
+        self.response_text = response_text
+        self.chunks = max(1, chunks)
+        self.chunk_delay = chunk_delay
+        self.first_token_delay = first_token_delay
+
+        self.requests = 0
+        self.__peers = set()
+        self.__loop = asyncio.new_event_loop()
+        self.__runner = None
+        self.__ready = threading.Event()
+        self.__port = None
+
+    @property
+    def connections(self) -> int:
+        """Количество различных TCP-соединений, по которым пришли запросы"""
+        return len(self.__peers)
+
+    async def __handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        self.__peers.add(request.transport.get_extra_info('peername'))
+        await request.read()
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+
+        step = -(-len(self.response_text) // self.chunks)
+        for start in range(0, len(self.response_text), step):
+            event = {'choices': [{'delta': {'content': self.response_text[start:start + step]}}]}
+            await response.write(f'data: {json.dumps(event, ensure_ascii=False)}\n\n'.encode('utf8'))
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+        await response.write(b'data: [DONE]\n\n')
+        await response.write_eof()
+        return response
+
+    async def __start(self) -> None:
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.__handle)
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, '127.0.0.1', 0)
+        await site.start()
+        self.__port = site._server.sockets[0].getsockname()[1]
+
+    def __run(self) -> None:
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_until_complete(self.__start())
+        self.__ready.set()
+        self.__loop.run_forever()
+
+    def start(self) -> str:
+        """
+        Запускает сервер на свободном порту
+
+        Returns:
+            str: адрес chat/completions
+        """
+        threading.Thread(target=self.__run, name='stub-llm-server', daemon=True).start()
+        self.__ready.wait()
+        return f'http://127.0.0.1:{self.__port}/v1/chat/completions'
+
+    def stop(self) -> None:
+        """Останавливает сервер"""
+        asyncio.run_coroutine_threadsafe(self.__runner.cleanup(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
@@ -0,0 +1,258 @@
+'''
+ICEQ (2025) - Синтетические данные для бенчмарков
+
+Основной функционал:
+- Генерация синтетических текстов из заданного количества абзацев
+- Фиктивные вопросы в формате QuestionsGenerator.generate
+- Измерение потребления памяти процессом
+- Маленькая случайная causal LM вместо ICEQ (без скачивания весов)
+- Заглушки энкодера SentenceTransformer и клиента LLM для запуска без сети
+'''
+
+import os
+import zlib
+import time
+import random
+import resource
+
+import numpy as np
+
+# Словарь для синтетических абзацев (тематические группы слов)
+TOPICS = [
+    'клетка мембрана белок фермент ядро митохондрия синтез энергия ткань организм',
+    'империя реформа война договор династия восстание столица армия налог власть',
+    'функция производная интеграл предел ряд матрица вектор уравнение график точка',
+    'атом молекула реакция кислота основание соль раствор электрон связь валентность',
+    'рынок спрос предложение цена инфляция бюджет кредит налог прибыль капитал',
+    'роман поэма герой сюжет автор глава стих метафора композиция жанр',
+    'алгоритм программа массив функция цикл условие переменная память процессор данные',
+    'климат рельеф река материк океан широта осадки почва население климатический',
+]
+
+
+def make_text(paragraphs: int, seed: int = 0, words_per_paragraph: tuple = (25, 70)) -> str:
+    """
+    Генерирует синтетический текст из абзацев, разделённых переносом строки
+
+    Args:
+        paragraphs (int): количество абзацев
+        seed (int): зерно генератора случайных чисел
+        words_per_paragraph (tuple): минимальное и максимальное количество слов
+
+    Returns:
+        str: синтетический текст
+    """
+    rng = random.Random(seed)
+    topics = [topic.split() for topic in TOPICS]
+    lines = []
+    for _ in range(paragraphs):
+        words = topics[rng.randrange(len(topics))]
+        length = rng.randint(*words_per_paragraph)
+        sentence = ' '.join(rng.choice(words) for _ in range(length))
+        lines.append(sentence.capitalize() + '.')
+    return '\n'.join(lines)
+
+
+def make_questions(questions_num: int) -> list[dict]:
+    """
+    Возвращает фиктивные вопросы в формате QuestionsGenerator.generate
+
+    Args:
+        questions_num (int): количество вопросов
+
+    Returns:
+        list[dict]: вопросы без объяснений
+    """
+    return [
+        {
+            'question': f'Какой процесс описан в разделе {i + 1}?',
+            'answers': [
+                {'answer': 'Синтез белка', 'is_correct': True},
+                {'answer': 'Распад крахмала', 'is_correct': False},
+                {'answer': 'Деление ядра', 'is_correct': False},
+                {'answer': 'Перенос ионов', 'is_correct': False},
+            ],
+            'explanation': ''
+        }
+        for i in range(questions_num)
+    ]
+
+
+def make_llm_response(questions_num: int) -> str:
+    """
+    Возвращает ответ LLM в нумерованном формате (+/-/!) для make_questions
+
+    Args:
+        questions_num (int): количество вопросов
+
+    Returns:
+        str: текст ответа
+    """
+    blocks = []
+    for i, question in enumerate(make_questions(questions_num), 1):
+        lines = [f'{i}. {question["question"]}']
+        lines += [f'{"+" if answer["is_correct"] else "-"} {answer["answer"]}' for answer in question['answers']]
+        lines.append(f'! Ответ следует из раздела {i}.')
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks)
+
+
+class StubEncoder:
+    """
+    Заглушка SentenceTransformer: детерминированные эмбеддинги без модели
+
+    Вектор абзаца - направление его темы (по первому слову) плюс шум,
+    зависящий от всего текста, поэтому абзацы одной темы близки и
+    кластеризация получает осмысленные данные. Стоимость - два crc32 на
+    текст, так что в замерах видны накладные расходы конвейера, а не модели.
+
+    Args:
+        dim (int): размерность эмбеддингов
+        table_size (int): количество различных векторов тем и шума
+        seed (int): зерно генератора случайных чисел
+    """
+
+    def __init__(self, dim: int = 1024, table_size: int = 4096, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.__topics = rng.standard_normal((table_size, dim)).astype(np.float32)
+        self.__noise = 0.5 * rng.standard_normal((table_size, dim)).astype(np.float32)
+
+    def encode(self, sentences, prompt: str | None = None, **kwargs) -> np.ndarray:
+        """Принимает те же именованные аргументы, что и SentenceTransformer.encode"""
+        sentences = list(sentences)
+        if prompt:
+            sentences = [prompt + sentence for sentence in sentences]
+        size = len(self.__topics)
+        topic_ids = [zlib.crc32(sentence.split(maxsplit=1)[0].lower().encode('utf8')) % size if sentence.strip() else 0
+                     for sentence in sentences]
+        noise_ids = [zlib.crc32(sentence.encode('utf8')) % size for sentence in sentences]
+        embeddings = self.__topics[topic_ids] + self.__noise[noise_ids]
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+class FakeLLMClient:
+    """
+    Заглушка ProviderClient: мгновенно отвечает make_llm_response
+
+    Args:
+        delay (float): задержка ответа, секунд
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = 0
+
+    def generate(self, provider: str, text: str, num_questions: int = 5) -> str:
+        self.requests += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return make_llm_response(num_questions)
+
+    def generate_many(self, provider: str, requests: list[tuple[str, int]], concurrency: int = 4) -> list:
+        return [self.generate(provider, text, num_questions) for text, num_questions in requests]
+
+    def stream(self, provider: str, text: str, num_questions: int = 5):
+        yield self.generate(provider, text, num_questions)
+
+    def close(self) -> None:
+        pass
+
+
+def rss_mb() -> dict:
+    """
+    Возвращает текущий и пиковый RSS процесса в мегабайтах
+
+    Returns:
+        dict: {'rss_mb': ..., 'peak_rss_mb': ...}
+    """
+    current = peak = None
+    try:
+        with open(f'/proc/{os.getpid()}/status', 'r', encoding='utf8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if peak is None:
+        # ru_maxrss в килобайтах на Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'rss_mb': round(current if current is not None else peak, 1),
+        'peak_rss_mb': round(peak, 1)
+    }
+
+
+# Упрощённый chat template для маленькой модели
+TINY_CHAT_TEMPLATE = "{% for message in messages %}{{ message['content'] }}\n{% endfor %}"
+
+
+def make_tiny_causal_lm(
+        corpus: list[str],
+        hidden_size: int = 128,
+        layers: int = 2,
+        model_name: str | None = None,
+        seed: int = 0
+) -> dict:
+    """
+    Создаёт маленькую causal LM со случайными весами в формате ICEQ
+
+    Токенизатор - по словам, обучается на corpus. Если задан model_name,
+    вместо случайной модели загружается указанная модель Hugging Face.
+
+    Args:
+        corpus (list[str]): тексты для словаря токенизатора (промпты, абзацы)
+        hidden_size (int): размер скрытого слоя
+        layers (int): количество слоёв
+        model_name (str | None): имя или путь модели Hugging Face
+        seed (int): зерно инициализации весов
+
+    Returns:
+        dict: {'tokenizer': ..., 'model': ...} как у загруженной ICEQ
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    if model_name is not None:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+        if tokenizer.chat_template is None:
+            tokenizer.chat_template = TINY_CHAT_TEMPLATE
+        return {'tokenizer': tokenizer, 'model': model}
+
+    from tokenizers import Regex, Tokenizer, models, pre_tokenizers, trainers
+
+    word_tokenizer = Tokenizer(models.WordLevel(unk_token='[UNK]'))
+    # Как Whitespace, но перевод строки и номер вопроса ("1.") - отдельные токены:
+    # после декодирования ответ в формате ICEQ разбирается парсером вопросов
+    word_tokenizer.pre_tokenizer = pre_tokenizers.Split(Regex(r'\d+\.|\w+|[^\w\s]+|\n'), behavior='removed', invert=True)
+    word_tokenizer.train_from_iterator(corpus, trainers.WordLevelTrainer(special_tokens=['[UNK]', '[PAD]', '[EOS]']))
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=word_tokenizer,
+        unk_token='[UNK]',
+        pad_token='[PAD]',
+        eos_token='[EOS]',
+        # Как у токенизатора ICEQ: без token_type_ids, которые generate не принимает
+        model_input_names=['input_ids', 'attention_mask']
+    )
+    tokenizer.chat_template = TINY_CHAT_TEMPLATE
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=8192,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    model = LlamaForCausalLM(config).eval()
+    return {'tokenizer': tokenizer, 'model': model}
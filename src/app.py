@@ -7,26 +7,225 @@ ICEQ (2025) - Веб-интерфейс приложения
 - Отображение результатов в удобном формате
 
 Запуск:
-    >>> python app.py
+    >>> python app.py  # один процесс, сервер разработки
+    >>> python serve.py  # несколько рабочих процессов с общими моделями
+
+Режим запуска задаётся переменной окружения ICEQ_STARTUP_MODE:
+    - background (по умолчанию): сервер отвечает сразу, модели загружаются в фоне
+    - eager: модели загружаются до запуска сервера
+    - lazy: модели загружаются при первом запросе на генерацию
 '''
 
 import os
 import json
 import csv
 import io
+import shutil
+import pathlib
+import tempfile
+import threading
 from datetime import datetime
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 
-from generation import QuestionsGenerator
+from generation import QuestionsGenerator, GENERATION_STAGES
+from question_generator_api import ProviderClient, LLMS, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_POOL_SIZE
+from batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+from response_cache import DEFAULT_TTL as RESPONSE_CACHE_TTL
+from deduplication import DEFAULT_DEDUP_THRESHOLD
+from context_packing import DEFAULT_CONTEXT_TOKEN_BUDGET
+from jobs import JobManager, JobQueueFull, JOB_DONE, JOB_ERROR
+from metrics import REGISTRY, CONTENT_TYPE, REQUESTS_IN_FLIGHT, GENERATIONS, JOBS, STAGE_SECONDS
+from document_loader import UnsupportedDocument, document_format, extract_text_file, DEFAULT_PDF_WORKERS
 
 # Отключаем автоматическую загрузку .env Flask-ом, чтобы избежать проблем с кодировкой
 os.environ.setdefault('FLASK_SKIP_DOTENV', '1')
 
 app = Flask(__name__)
+# Максимальный размер загружаемого документа (POST /upload)
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.getenv('ICEQ_MAX_UPLOAD_MB', '200')) * 2 ** 20)
+# Количество процессов для параллельного извлечения страниц PDF
+PDF_WORKERS = int(os.getenv('ICEQ_PDF_WORKERS', DEFAULT_PDF_WORKERS))
+
+
+def _env_float(name: str) -> float | None:
+    """Читает числовой параметр из переменной окружения (None, если не задан)"""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+# Инициализация генератора вопросов (поддержка DeepSeek и Qwen API).
+# Модели загружаются при первом обращении и выгружаются по простою/бюджету памяти
+question_generator = QuestionsGenerator(
+    init_llms=['deepseek'],
+    idle_timeout=_env_float('ICEQ_MODEL_IDLE_TIMEOUT'),
+    memory_budget_mb=_env_float('ICEQ_MODEL_MEMORY_BUDGET_MB'),
+    encoder_backend=os.getenv('ICEQ_ENCODER_BACKEND', 'torch'),
+    llm_client=ProviderClient(
+        connect_timeout=float(os.getenv('ICEQ_LLM_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(os.getenv('ICEQ_LLM_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+        pool_size=int(os.getenv('ICEQ_LLM_POOL_SIZE', DEFAULT_POOL_SIZE))
+    ),
+    fanout_groups=int(os.getenv('ICEQ_FANOUT_GROUPS', '1')),
+    fanout_concurrency=int(os.getenv('ICEQ_FANOUT_CONCURRENCY', '4')),
+    iceq_max_batch_size=int(os.getenv('ICEQ_BATCH_MAX_SIZE', DEFAULT_MAX_BATCH_SIZE)),
+    iceq_max_wait=float(os.getenv('ICEQ_BATCH_MAX_WAIT', DEFAULT_MAX_WAIT)),
+    iceq_prefix_cache=os.getenv('ICEQ_PREFIX_CACHE', '1') != '0',
+    iceq_prompt_lookup_tokens=int(os.getenv('ICEQ_PROMPT_LOOKUP_TOKENS', '0')),
+    response_cache_ttl=float(os.getenv('ICEQ_RESPONSE_CACHE_TTL', RESPONSE_CACHE_TTL)),
+    # Пустое значение или 0 - без удаления похожих вопросов и дозапроса
+    dedup_threshold=float(os.getenv('ICEQ_DEDUP_THRESHOLD', DEFAULT_DEDUP_THRESHOLD) or 0) or None,
+    # 0 - без ограничения
+    context_token_budget=int(os.getenv('ICEQ_CONTEXT_TOKEN_BUDGET', DEFAULT_CONTEXT_TOKEN_BUDGET)) or None,
+    # Не задано - cuda, если доступна
+    device=os.getenv('ICEQ_DEVICE') or None,
+    download_tokenizers=os.getenv('ICEQ_DOWNLOAD_TOKENIZERS', '0') == '1'
+)
+
+# Очередь задач генерации: ограниченный пул потоков и ограниченная очередь.
+# С несколькими рабочими процессами состояние задач хранится в общей директории
+job_manager = JobManager(
+    max_workers=int(os.getenv('ICEQ_JOB_WORKERS', '2')),
+    max_pending=int(os.getenv('ICEQ_JOB_QUEUE_SIZE', '32')),
+    state_dir=os.getenv('ICEQ_JOB_STATE_DIR') or None
+)
+
+
+def _collect_job_metrics():
+    """Обновляет gauge задач очереди перед выдачей /metrics"""
+    for status, count in job_manager.stats().items():
+        JOBS.set(count, status=status)
+
+
+# Метрики кэшей, моделей и очереди читаются из их статистики при каждом запросе /metrics
+REGISTRY.add_collector(question_generator.update_metrics)
+REGISTRY.add_collector(_collect_job_metrics)
+
+
+def _tracked_generate(endpoint: str, text_content: str | pathlib.Path, questions_num: int, llm: str, **kwargs):
+    """
+    Вызывает question_generator.generate, учитывая запрос в метриках
+    
+    Args:
+        endpoint (str): метка запроса в iceq_requests_in_flight
+        text_content (str): текст для генерации вопросов (или pathlib.Path файла с текстом)
+        questions_num (int): количество вопросов
+        llm (str): модель для генерации
+        **kwargs: прочие параметры generate
+    
+    Returns:
+        list[dict]: сгенерированные вопросы
+    
+    Raises:
+        ValueError: неизвестная LLM (в метриках не учитывается)
+    """
+    question_generator.check_llm(llm)
+    with REQUESTS_IN_FLIGHT.track_inprogress(endpoint=endpoint):
+        try:
+            return question_generator.generate(text_content, questions_num, llm=llm, **kwargs)
+        except Exception:
+            GENERATIONS.inc(llm=llm, status='error')
+            raise
+
+
+def _text_file_length(path: str) -> int:
+    """Количество символов текстового файла (читается блоками)"""
+    with open(path, 'r', encoding='utf8') as f:
+        return sum(len(block) for block in iter(lambda: f.read(2 ** 20), ''))
+
+
+def _generate_from_document(
+        upload_dir: str,
+        document_path: str,
+        fmt: str,
+        questions_num: int,
+        llm: str,
+        max_length: int | None = None,
+        progress_callback=None,
+        **kwargs
+):
+    """
+    Извлекает текст загруженного документа и генерирует по нему вопросы
+    
+    Текст пишется в файл и передаётся в генерацию путём: он не собирается
+    в одну строку. Временная директория загрузки удаляется после генерации.
+    Длина текста проверяется после извлечения: до него длина PDF и DOCX
+    неизвестна.
+    
+    Args:
+        upload_dir (str): временная директория загрузки
+        document_path (str): путь к документу
+        fmt (str): формат документа ('pdf', 'docx', 'txt')
+        questions_num (int): количество вопросов
+        llm (str): модель для генерации
+        max_length (int | None): максимальная длина извлечённого текста, символов
+            (None - без ограничения)
+        progress_callback (Callable | None): передаётся из JobManager
+        **kwargs: прочие параметры generate
+    
+    Returns:
+        list[dict]: сгенерированные вопросы
+    
+    Raises:
+        ValueError: текст документа длиннее max_length
+    """
+    try:
+        if progress_callback is not None:
+            progress_callback('extraction', GENERATION_STAGES['extraction'])
+        with REQUESTS_IN_FLIGHT.track_inprogress(endpoint='upload'), STAGE_SECONDS.time(stage='extraction', llm=llm):
+            text_path = extract_text_file(
+                document_path,
+                os.path.join(upload_dir, 'text.txt'),
+                fmt,
+                workers=PDF_WORKERS
+            )
+        if max_length is not None:
+            text_length = _text_file_length(text_path)
+            if text_length > max_length:
+                raise ValueError(
+                    f'Текст документа ({text_length} символов) превышает лимит в {max_length} символов'
+                )
+        return _tracked_generate(
+            'upload',
+            pathlib.Path(text_path),
+            questions_num,
+            llm,
+            progress_callback=progress_callback,
+            **kwargs
+        )
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+STARTUP_MODES = ('background', 'eager', 'lazy')
+STARTUP_MODE = os.getenv('ICEQ_STARTUP_MODE', 'background')
+# Событие завершения предварительной загрузки моделей
+models_ready = threading.Event()
+
+
+def _warm_up_models():
+    """Загружает энкодеры заранее, чтобы первый запрос на генерацию не ждал их"""
+    try:
+        question_generator.warm_up()
+    except Exception as e:
+        print(f'⚠️ Ошибка предварительной загрузки моделей: {e}')
+    finally:
+        models_ready.set()
 
-# Инициализация генератора вопросов (поддержка DeepSeek и Qwen API)
-question_generator = QuestionsGenerator(init_llms=['deepseek'])
+
+def start_warm_up(mode: str = STARTUP_MODE):
+    """
+    Запускает предварительную загрузку моделей согласно режиму запуска
+    
+    Args:
+        mode (str): режим запуска ('background', 'eager' или 'lazy')
+    """
+    if mode not in STARTUP_MODES:
+        raise ValueError(f"Неизвестный режим запуска '{mode}'. Доступные значения: {', '.join(STARTUP_MODES)}")
+
+    if mode == 'eager':
+        _warm_up_models()
+    elif mode == 'background':
+        threading.Thread(target=_warm_up_models, name='iceq-warm-up', daemon=True).start()
 
 @app.route('/')
 def index():
@@ -46,23 +245,31 @@ def estimate_time():
     Принимает POST запрос с JSON содержащим:
         - text: текст для анализа
         - questionNumber: количество вопросов
+        - model: модель для генерации (необязательно, по умолчанию 'iceq')
     
     Returns:
-        JSON: статус и оценка времени генерации
+        JSON: статус и оценка времени генерации (с 90% интервалом, если
+            оценка обучена на замерах этой модели); 400 при неизвестной модели
     """
     try:
         # Get data from request
         data = request.get_json()
         text_content = data.get('text', '')
         questions_num = int(data.get('questionNumber', 10))
+        model = question_generator.check_llm(data.get('model', 'iceq'))
         
         # Получаем оценку времени
-        time_estimate = question_generator.estimate_generation_time(text_content, questions_num, 'iceq')
+        time_estimate = question_generator.estimate_generation_time(text_content, questions_num, model)
         
         return jsonify({
             'status': 'success',
             'estimate': time_estimate
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -78,9 +285,13 @@ def generate_questions():
         - text: текст для генерации вопросов
         - questionNumber: количество вопросов
         - model: модель для генерации ('deepseek', 'qwen', 'iceq')
+        - noCache: не использовать кэш ответов LLM (необязательно)
+        - documentId: идентификатор документа (необязательно) - при повторной генерации
+          после правки пересчитываются только изменённые части, см. QuestionsGenerator.generate
     
     Returns:
-        JSON: статус и сгенерированные вопросы
+        JSON: статус и сгенерированные вопросы; 400 при неизвестной модели
+            или идентификаторе документа
     """
     try:
         # Получаем данные из запроса
@@ -89,20 +300,345 @@ def generate_questions():
         questions_num = int(data.get('questionNumber', 10))
         model = data.get('model', 'deepseek')  # По умолчанию используем deepseek
 
+        use_cache = not data.get('noCache', False)
+        document_id = data.get('documentId') or None
+        if document_id is not None:
+            question_generator.document_versions.check_id(document_id)
+
         # Используем генератор вопросов
-        formatted_questions = question_generator.generate(text_content, questions_num, llm=model)
+        formatted_questions = _tracked_generate(
+            'generate', text_content, questions_num, model, use_cache=use_cache, document_id=document_id
+        )
 
         # Возвращаем результат на фронтенд
         return jsonify({
             'status': 'success',
             'questions': formatted_questions
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+def _sse_event(event: str, data: dict) -> str:
+    """Форматирует событие Server-Sent Events"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+@app.route('/generate-stream', methods=['POST'])
+def generate_questions_stream():
+    """
+    Потоковая генерация вопросов по тексту (Server-Sent Events)
+    
+    Принимает POST запрос с JSON как у /generate. Каждый вопрос отправляется
+    событием question, как только LLM закончила его генерировать.
+    
+    Returns:
+        text/event-stream: события progress, question, done и error;
+            JSON 400 при неизвестной модели или нечисловом количестве вопросов
+    """
+    data = request.get_json() or {}
+    text_content = data.get('text', '')
+    model = data.get('model', 'deepseek')
+    use_cache = not data.get('noCache', False)
+    try:
+        # Проверяем до начала потока, пока можно вернуть код ответа
+        questions_num = int(data.get('questionNumber', 10))
+        question_generator.check_llm(model)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    def events():
+        with REQUESTS_IN_FLIGHT.track_inprogress(endpoint='generate-stream'):
+            try:
+                for event in question_generator.generate_stream(text_content, questions_num, llm=model, use_cache=use_cache):
+                    yield _sse_event(event['type'], event)
+            except Exception as e:
+                GENERATIONS.inc(llm=model, status='error')
+                yield _sse_event('error', {'type': 'error', 'message': str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Отключаем буферизацию ответа в nginx
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Постановка задачи генерации вопросов в очередь
+    
+    Принимает POST запрос с JSON содержащим:
+        - text: текст для генерации вопросов
+        - questionNumber: количество вопросов
+        - model: модель для генерации ('deepseek', 'qwen', 'iceq')
+        - noCache: не использовать кэш ответов LLM (необязательно)
+        - documentId: идентификатор документа (необязательно) - при повторной генерации
+          после правки пересчитываются только изменённые части, см. QuestionsGenerator.generate
+    
+    Returns:
+        JSON: статус и идентификатор задачи (202), 400 при неизвестной модели
+            или идентификаторе документа, 503 при переполненной очереди
+    """
+    try:
+        data = request.get_json()
+        text_content = data.get('text', '')
+        questions_num = int(data.get('questionNumber', 10))
+        model = question_generator.check_llm(data.get('model', 'deepseek'))
+        use_cache = not data.get('noCache', False)
+        document_id = data.get('documentId') or None
+        if document_id is not None:
+            question_generator.document_versions.check_id(document_id)
+
+        # Прогноз длительности нужен для оценки ожидания следующих задач в очереди
+        time_estimate = question_generator.estimate_generation_time(text_content, questions_num, model)
+        job_id = job_manager.submit(
+            _tracked_generate,
+            'jobs',
+            text_content,
+            questions_num,
+            model,
+            use_cache=use_cache,
+            document_id=document_id,
+            estimated_seconds=time_estimate['estimated_seconds']
+        )
+
+        return jsonify({
+            'status': 'success',
+            'job_id': job_id
+        }), 202
+    except JobQueueFull as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/upload', methods=['POST'])
+def upload_document():
+    """
+    Загрузка документа и постановка генерации вопросов по нему в очередь
+    
+    Текст извлекается на сервере (страницы PDF - параллельно в рабочих
+    процессах) с сохранением абзацев. Принимает multipart/form-data:
+        - file: документ (.pdf, .docx, .txt)
+        - questionNumber: количество вопросов
+        - model: модель для генерации ('deepseek', 'qwen', 'iceq')
+        - noCache: не использовать кэш ответов LLM (необязательно)
+        - documentId: идентификатор документа (необязательно) - при повторной генерации
+          после правки пересчитываются только изменённые части, см. QuestionsGenerator.generate
+        - maxLength: максимальная длина извлечённого текста, символов (необязательно) -
+          задача завершается ошибкой, если текст документа длиннее
+    
+    Returns:
+        JSON: статус и идентификатор задачи (202) - как у /jobs;
+            400 при неподдерживаемом формате, неизвестной модели или идентификаторе
+            документа, 503 при переполненной очереди
+    """
+    upload_dir = None
+    try:
+        document = request.files.get('file')
+        if document is None or not document.filename:
+            return jsonify({'status': 'error', 'message': 'Файл не передан'}), 400
+
+        fmt = document_format(document.filename)
+        questions_num = int(request.form.get('questionNumber', 10))
+        model = question_generator.check_llm(request.form.get('model', 'deepseek'))
+        use_cache = request.form.get('noCache', 'false').lower() not in ('1', 'true')
+        document_id = request.form.get('documentId') or None
+        if document_id is not None:
+            question_generator.document_versions.check_id(document_id)
+        max_length = int(request.form['maxLength']) if request.form.get('maxLength') else None
+
+        # Имя файла пользователя не используется в пути
+        upload_dir = tempfile.mkdtemp(prefix='iceq-upload-')
+        document_path = os.path.join(upload_dir, f'document.{fmt}')
+        document.save(document_path)
+
+        job_id = job_manager.submit(
+            _generate_from_document,
+            upload_dir,
+            document_path,
+            fmt,
+            questions_num,
+            model,
+            max_length=max_length,
+            use_cache=use_cache,
+            document_id=document_id
+        )
+        # Директорию удалит задача
+        upload_dir = None
+
+        return jsonify({
+            'status': 'success',
+            'job_id': job_id
+        }), 202
+    except UnsupportedDocument as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except JobQueueFull as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+    finally:
+        if upload_dir is not None:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Состояние задачи генерации
+    
+    Returns:
+        JSON: статус задачи (queued/running/done/error), стадия и прогресс
+    """
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    Результат задачи генерации
+    
+    Returns:
+        JSON: сгенерированные вопросы (как у /generate); 409, если задача ещё выполняется
+    """
+    job = job_manager.result(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+
+    if job['status'] == JOB_ERROR:
+        return jsonify({'status': 'error', 'message': job['error']}), 500
+
+    if job['status'] != JOB_DONE:
+        return jsonify({
+            'status': 'error',
+            'message': 'Задача ещё выполняется',
+            'job_status': job['status']
+        }), 409
+
+    return jsonify({
+        'status': 'success',
+        'questions': job['result']
+    })
+
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Проверка готовности сервера
+    
+    Returns:
+        JSON: режим запуска, признак завершения загрузки моделей и pid
+            обработавшего запрос процесса
+    """
+    return jsonify({
+        'status': 'success',
+        'startup_mode': STARTUP_MODE,
+        'models_ready': models_ready.is_set(),
+        'pid': os.getpid()
+    })
+
+@app.route('/models', methods=['GET'])
+def models_status():
+    """
+    Состояние резидентности моделей (для мониторинга)
+    
+    Returns:
+        JSON: какие модели загружены, их размер и время простоя
+    """
+    return jsonify({
+        'status': 'success',
+        'models': question_generator.models_status()
+    })
+
+@app.route('/cache', methods=['GET'])
+def cache_status():
+    """
+    Статистика кэшей (для мониторинга)
+    
+    Returns:
+        JSON: попадания и промахи кэша эмбеддингов и кэша ответов LLM (по каждой LLM)
+    """
+    return jsonify({
+        'status': 'success',
+        'embeddings': question_generator.embedding_cache.stats(),
+        'responses': question_generator.response_cache.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Метрики в текстовом формате Prometheus
+    
+    Returns:
+        text/plain: длительность стадий, задержки LLM (включая время до первого токена),
+            размеры запросов, ошибки разбора, попадания в кэши, выполняющиеся
+            запросы и резидентность моделей
+    """
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/cache/responses', methods=['DELETE'])
+def invalidate_response_cache():
+    """
+    Очистка кэша ответов LLM
+    
+    Принимает необязательный параметр запроса model - очистить только ответы этой LLM
+    
+    Returns:
+        JSON: количество удалённых из памяти записей; 400 при неизвестной LLM
+    """
+    model = request.args.get('model')
+    if model is not None and model not in LLMS:
+        return jsonify({
+            'status': 'error',
+            'message': f"Неизвестная модель '{model}'. Доступные значения: {', '.join(LLMS)}"
+        }), 400
+    removed = question_generator.response_cache.invalidate(llm=model)
+    return jsonify({
+        'status': 'success',
+        'removed': removed
+    })
+
 @app.route('/export', methods=['POST'])
 def export_test():
     """
@@ -297,4 +833,9 @@ def export_txt(questions, user_answers=None):
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8080, host='127.0.0.1')
+    debug = True
+    # С debug=True модуль выполняется ещё и в процессе-наблюдателе reloader-а,
+    # модели загружаем только в рабочем процессе
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up()
+    app.run(debug=debug, port=8080, host='127.0.0.1')
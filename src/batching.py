@@ -0,0 +1,134 @@
+'''
+ICEQ (2025) - Динамическое объединение запросов в батчи
+
+Основной функционал:
+- Сбор запросов, пришедших из разных потоков в течение короткого окна
+- Выполнение их одним батчем (одним вызовом model.generate)
+- Возврат каждому вызывающему его собственного результата
+- Статистика размеров батчей
+
+Пример использования:
+    >>> batcher = DynamicBatcher(run_batch, max_batch_size=8, max_wait=0.05)
+    >>> response = batcher.run((text, questions_num))  # из любого потока
+'''
+
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+import time
+import queue
+import threading
+
+# Максимальное количество запросов в одном батче
+DEFAULT_MAX_BATCH_SIZE = 8
+# Сколько ждать следующих запросов после первого, секунд
+DEFAULT_MAX_WAIT = 0.05
+
+
+class DynamicBatcher:
+    """
+    Объединяет одновременные запросы в батчи
+
+    Рабочий поток ждёт первый запрос, затем не дольше max_wait секунд
+    собирает следующие (но не больше max_batch_size) и передаёт их в
+    run_batch одним списком. run_batch должна вернуть список результатов
+    той же длины и в том же порядке. Исключение run_batch передаётся
+    всем запросам батча.
+
+    Attributes:
+        max_batch_size (int): максимальный размер батча
+        max_wait (float): окно сбора батча, секунд
+    """
+
+    def __init__(
+            self,
+            run_batch: Callable[[List[Any]], List[Any]],
+            max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+            max_wait: float = DEFAULT_MAX_WAIT,
+            name: str = 'batcher'
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+
+        self.__run_batch = run_batch
+        self.__queue: queue.Queue = queue.Queue()
+        self.__name = name
+        self.__worker: threading.Thread | None = None
+        self.__lock = threading.Lock()
+
+        self.__batches = 0
+        self.__items = 0
+        self.__max_observed = 0
+
+    def submit(self, item: Any) -> Future:
+        """
+        Ставит запрос в очередь на ближайший батч
+
+        Args:
+            item: аргумент запроса для run_batch
+
+        Returns:
+            Future: результат запроса
+        """
+        self.__ensure_worker()
+        future = Future()
+        self.__queue.put((item, future))
+        return future
+
+    def run(self, item: Any) -> Any:
+        """Ставит запрос в очередь и ждёт его результат"""
+        return self.submit(item).result()
+
+    def __ensure_worker(self) -> None:
+        # Рабочий поток запускается при первом запросе
+        with self.__lock:
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__loop, name=self.__name, daemon=True)
+                self.__worker.start()
+
+    def __collect(self) -> list:
+        batch = [self.__queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __loop(self) -> None:
+        while True:
+            batch = self.__collect()
+            # Запросы, отменённые до начала выполнения, в батч не попадают
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            with self.__lock:
+                self.__batches += 1
+                self.__items += len(batch)
+                self.__max_observed = max(self.__max_observed, len(batch))
+
+            try:
+                results = self.__run_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f'Батч из {len(batch)} запросов вернул {len(results)} результатов')
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Количество батчей, запросов и средний размер батча"""
+        with self.__lock:
+            return {
+                'batches': self.__batches,
+                'items': self.__items,
+                'mean_batch_size': round(self.__items / self.__batches, 2) if self.__batches else 0.0,
+                'max_batch_size': self.__max_observed,
+                'queued': self.__queue.qsize()
+            }
@@ -0,0 +1,309 @@
+'''
+ICEQ (2025) - Однопроходное разбиение текста на чанки
+
+Основной функционал:
+- Разбиение текста на строки-чанки за один проход без копирования всего текста
+- Источник - строка, bytes, memory-mapped файл или путь к файлу
+- Смещения и количество слов каждого чанка, статистика текста (строки,
+  абзацы, средняя длина строки) в том же проходе
+- Фильтрация слишком коротких чанков по собранной статистике: строки
+  материализуются только для оставшихся чанков
+
+Пример использования:
+    >>> chunked = chunk_source(pathlib.Path('lecture.txt'))
+    >>> chunked.lines_num, chunked.paragraphs_num
+    >>> chunks = chunked.chunks()  # np.ndarray строк, прошедших фильтр
+    >>> for chunk in chunked:
+    ...     print(chunk.offset, chunk.words, chunk.text)
+'''
+
+from array import array
+from typing import Iterator, NamedTuple, Optional, Union
+
+import os
+import mmap
+
+import numpy as np
+
+# Порог количества слов в чанке - доля средней длины строки (в символах)
+MIN_WORDS_RATIO = 0.15
+# Строка длиннее этого количества слов считается смысловым блоком при проверке текста
+MIN_BLOCK_WORDS = 5
+# Кодировка файлов и байтовых буферов
+SOURCE_ENCODING = 'utf-8'
+
+TextSource = Union[str, bytes, bytearray, mmap.mmap, os.PathLike, 'ChunkedText']
+
+
+class Chunk(NamedTuple):
+    """
+    Чанк текста
+
+    Attributes:
+        index (int): номер строки в тексте
+        offset (int): смещение начала строки в источнике (байт для файлов и буферов, символов для str)
+        length (int): длина строки в тех же единицах
+        words (int): количество слов
+        text (str): текст строки
+    """
+    index: int
+    offset: int
+    length: int
+    words: int
+    text: str
+
+
+class ChunkedText:
+    """
+    Результат разбиения текста: смещения строк и статистика без копий самих строк
+
+    Хранит ссылку на источник и компактные массивы смещений, длин и количества
+    слов каждой строки (8 байт на значение). Текст чанка извлекается из
+    источника срезом только при обращении к нему.
+
+    Attributes:
+        source: исходная строка или байтовый буфер
+        source_length (int): длина источника (байт для файлов и буферов, символов для str)
+        offsets (np.ndarray): смещения строк в источнике
+        lengths (np.ndarray): длины строк в единицах источника
+        char_lengths (np.ndarray): длины строк в символах
+        word_counts (np.ndarray): количество слов в строках
+        paragraphs_num (int): количество абзацев (блоков, разделённых пустой строкой)
+        blocks_num (int): количество строк длиннее MIN_BLOCK_WORDS слов
+    """
+
+    def __init__(
+            self,
+            source: Union[str, bytes, bytearray, mmap.mmap],
+            offsets: np.ndarray,
+            lengths: np.ndarray,
+            char_lengths: np.ndarray,
+            word_counts: np.ndarray,
+            paragraphs_num: int,
+            blocks_num: int,
+            owned_file: Optional[mmap.mmap] = None
+    ):
+        self.source = source
+        self.source_length = len(source)
+        self.offsets = offsets
+        self.lengths = lengths
+        self.char_lengths = char_lengths
+        self.word_counts = word_counts
+        self.paragraphs_num = paragraphs_num
+        self.blocks_num = blocks_num
+        self.__owned_file = owned_file
+        self.__selected: Optional[np.ndarray] = None
+
+    @property
+    def lines_num(self) -> int:
+        """Количество строк (как у text.split('\\n'))"""
+        return len(self.offsets)
+
+    @property
+    def text_length(self) -> int:
+        """Длина текста в символах (как len(text) для str)"""
+        return int(self.char_lengths.sum()) + self.lines_num - 1
+
+    @property
+    def words_num(self) -> int:
+        """Количество слов во всём тексте"""
+        return int(self.word_counts.sum())
+
+    @property
+    def mean_line_length(self) -> float:
+        """Средняя длина строки в символах"""
+        return float(self.char_lengths.mean()) if self.lines_num else 0.0
+
+    @property
+    def min_words(self) -> float:
+        """Чанк проходит фильтр, если в нём больше слов, чем это значение"""
+        return self.mean_line_length * MIN_WORDS_RATIO
+
+    @property
+    def selected(self) -> np.ndarray:
+        """Номера строк, прошедших фильтр по количеству слов"""
+        if self.__selected is None:
+            self.__selected = np.flatnonzero(self.word_counts > self.min_words)
+        return self.__selected
+
+    @property
+    def chunks_num(self) -> int:
+        """Количество чанков после фильтрации"""
+        return len(self.selected)
+
+    def line(self, index: int) -> str:
+        """Текст строки с номером index"""
+        start = int(self.offsets[index])
+        return self.__decode(self.source[start:start + int(self.lengths[index])])
+
+    def chunks(self) -> np.ndarray:
+        """
+        Материализует чанки, прошедшие фильтр
+
+        Returns:
+            np.ndarray: массив строк (dtype=object, без выравнивания по самой длинной строке)
+        """
+        chunks = np.empty(self.chunks_num, dtype=object)
+        for i, index in enumerate(self.selected):
+            chunks[i] = self.line(index)
+        return chunks
+
+    def __iter__(self) -> Iterator[Chunk]:
+        """Чанки, прошедшие фильтр, по порядку"""
+        for index in self.selected:
+            yield Chunk(
+                int(index),
+                int(self.offsets[index]),
+                int(self.lengths[index]),
+                int(self.word_counts[index]),
+                self.line(index)
+            )
+
+    def text(self, limit: Optional[int] = None) -> str:
+        """
+        Исходный текст целиком или его начало
+
+        Args:
+            limit (int | None): максимальная длина в единицах источника
+        """
+        return self.__decode(self.source[:limit])
+
+    def close(self) -> None:
+        """Закрывает отображённый в память файл (если он открыт chunk_source)"""
+        if self.__owned_file is not None:
+            self.source = b''
+            self.__owned_file.close()
+            self.__owned_file = None
+
+    def __enter__(self) -> 'ChunkedText':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def __decode(part) -> str:
+        if isinstance(part, str):
+            return part
+        return part.decode(SOURCE_ENCODING, errors='replace')
+
+
+def chunk_text(source: Union[str, bytes, bytearray, mmap.mmap]) -> ChunkedText:
+    """
+    Разбивает текст на строки за один проход
+
+    Строки не копируются целиком в список: для каждой запоминаются смещение,
+    длина и количество слов, а статистика (абзацы, смысловые блоки) считается
+    в том же проходе. Результат совпадает с text.split('\\n') и фильтрацией
+    по доле средней длины строки.
+
+    Args:
+        source (str | bytes | bytearray | mmap.mmap): текст или буфер в кодировке UTF-8
+
+    Returns:
+        ChunkedText: смещения строк и статистика
+    """
+    return _scan(source)
+
+
+def _scan(source: Union[str, bytes, bytearray, mmap.mmap], owned_file: Optional[mmap.mmap] = None) -> ChunkedText:
+    is_text = isinstance(source, str)
+    newline = '\n' if is_text else b'\n'
+    size = len(source)
+
+    offsets = array('q')
+    lengths = array('q')
+    char_lengths = array('q')
+    word_counts = array('q')
+
+    # Абзацы - как непустые части text.split('\n\n'): группы строк между пустыми строками
+    paragraphs_num = 0
+    blocks_num = 0
+    in_group = False
+    group_has_words = False
+
+    start = 0
+    while True:
+        end = source.find(newline, start)
+        if end == -1:
+            end = size
+
+        line = source[start:end]
+        if not is_text:
+            line = line.decode(SOURCE_ENCODING, errors='replace')
+        words = len(line.split())
+
+        offsets.append(start)
+        lengths.append(end - start)
+        char_lengths.append(len(line))
+        word_counts.append(words)
+
+        if words > MIN_BLOCK_WORDS:
+            blocks_num += 1
+        if line:
+            in_group = True
+            group_has_words = group_has_words or words > 0
+        else:
+            if in_group and group_has_words:
+                paragraphs_num += 1
+            in_group = group_has_words = False
+
+        if end == size:
+            break
+        start = end + 1
+
+    if in_group and group_has_words:
+        paragraphs_num += 1
+
+    return ChunkedText(
+        source,
+        np.frombuffer(offsets, dtype=np.int64),
+        np.frombuffer(lengths, dtype=np.int64),
+        np.frombuffer(char_lengths, dtype=np.int64),
+        np.frombuffer(word_counts, dtype=np.int64),
+        paragraphs_num,
+        blocks_num,
+        owned_file
+    )
+
+
+def chunk_file(path: Union[str, os.PathLike]) -> ChunkedText:
+    """
+    Разбивает текстовый файл (UTF-8), отображая его в память
+
+    Файл не читается в память целиком: страницы подгружаются ОС по мере
+    прохода. Отображение закрывается ChunkedText.close().
+
+    Args:
+        path (str | os.PathLike): путь к файлу
+
+    Returns:
+        ChunkedText: смещения строк и статистика
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Пустой файл нельзя отобразить в память
+            return chunk_text(b'')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return _scan(mapped, owned_file=mapped)
+
+
+def chunk_source(source: TextSource) -> ChunkedText:
+    """
+    Разбивает текст из любого поддерживаемого источника
+
+    Args:
+        source: str (текст), bytes / bytearray / mmap.mmap (буфер UTF-8),
+            os.PathLike (путь к файлу) или уже готовый ChunkedText
+
+    Returns:
+        ChunkedText: смещения строк и статистика
+    """
+    if isinstance(source, ChunkedText):
+        return source
+    if isinstance(source, os.PathLike):
+        return chunk_file(source)
+    if isinstance(source, (str, bytes, bytearray, mmap.mmap)):
+        return chunk_text(source)
+    raise TypeError(f'Неподдерживаемый источник текста: {type(source).__name__}')
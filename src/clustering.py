@@ -0,0 +1,171 @@
+'''
+ICEQ (2025) - Движки кластеризации чанков
+
+Основной функционал:
+- Выбор алгоритма кластеризации: точный KMeans, MiniBatchKMeans, faiss.Kmeans
+- Векторизованный выбор центрального чанка в каждом кластере за один проход
+- Тёплый старт с заданных центроидов (например, предыдущей версии документа)
+
+Пример использования:
+    >>> engine = ClusteringEngine('minibatch')
+    >>> result = engine.fit(embeddings, n_clusters=50)
+    >>> central_indices = select_central_indices(result)
+'''
+
+from dataclasses import dataclass
+from typing import Literal
+
+import numpy as np
+
+ClusteringBackend = Literal['kmeans', 'minibatch', 'faiss']
+
+CLUSTERING_BACKENDS = ('kmeans', 'minibatch', 'faiss')
+# Размер батча MiniBatchKMeans
+MINIBATCH_SIZE = 4096
+# Количество итераций faiss.Kmeans
+FAISS_KMEANS_NITER = 25
+
+
+@dataclass
+class ClusteringResult:
+    """
+    Результат кластеризации
+
+    Attributes:
+        labels (np.ndarray): номер кластера для каждого объекта, shape (n,)
+        distances (np.ndarray): расстояние от объекта до центроида его кластера, shape (n,)
+        centroids (np.ndarray): центроиды кластеров, shape (k, d)
+    """
+    labels: np.ndarray
+    distances: np.ndarray
+    centroids: np.ndarray
+
+    @property
+    def n_clusters(self) -> int:
+        return self.centroids.shape[0]
+
+
+def select_central_indices(result: ClusteringResult) -> np.ndarray:
+    '''
+    Находит индекс самого центрального объекта в каждом кластере
+
+    Вместо цикла по кластерам с булевой маской по всем меткам (O(k·n))
+    используется один проход: минимум расстояния по кластеру через
+    np.minimum.at и первый объект, достигающий этого минимума.
+
+    Параметры:
+        result (ClusteringResult): результат кластеризации
+
+    Возвращаемое значение:
+        np.ndarray: индексы центральных объектов, упорядоченные по номеру кластера
+            (пустые кластеры пропускаются)
+    '''
+    labels = result.labels
+    distances = result.distances
+
+    best = np.full(result.n_clusters, np.inf, dtype=distances.dtype)
+    np.minimum.at(best, labels, distances)
+
+    candidates = np.flatnonzero(distances == best[labels])
+    _, first = np.unique(labels[candidates], return_index=True)
+    return candidates[first]
+
+
+class ClusteringEngine:
+    """
+    Кластеризация эмбеддингов с выбираемым алгоритмом
+
+    Доступные алгоритмы:
+        - kmeans: точный sklearn.cluster.KMeans
+        - minibatch: sklearn.cluster.MiniBatchKMeans, быстрее на больших входах
+        - faiss: faiss.Kmeans, самый быстрый на книжных объёмах
+
+    Attributes:
+        backend (str): используемый алгоритм
+        random_state (int): зерно генератора случайных чисел
+    """
+
+    def __init__(self, backend: ClusteringBackend = 'kmeans', random_state: int = 42):
+        if backend not in CLUSTERING_BACKENDS:
+            raise ValueError(
+                f"Неизвестный алгоритм кластеризации '{backend}'. "
+                f"Доступные значения: {', '.join(CLUSTERING_BACKENDS)}"
+            )
+        self.backend = backend
+        self.random_state = random_state
+
+    def fit(
+            self,
+            embeddings: np.ndarray,
+            n_clusters: int,
+            init_centroids: np.ndarray | None = None
+    ) -> ClusteringResult:
+        '''
+        Кластеризует эмбеддинги
+
+        Параметры:
+            embeddings (np.ndarray): матрица эмбеддингов, shape (n, d)
+            n_clusters (int): количество кластеров
+            init_centroids (np.ndarray | None): начальные центроиды, shape (n_clusters, d).
+                Одна инициализация с них вместо k-means++ с несколькими запусками:
+                близкие к ним кластеры сходятся за несколько итераций и сохраняют
+                нумерацию. None - обычная инициализация
+
+        Возвращаемое значение:
+            ClusteringResult: метки, расстояния до центроидов и центроиды
+        '''
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if init_centroids is not None:
+            init_centroids = np.ascontiguousarray(init_centroids, dtype=np.float32)
+            if init_centroids.shape != (n_clusters, embeddings.shape[1]):
+                raise ValueError(
+                    f'Начальные центроиды должны иметь shape ({n_clusters}, {embeddings.shape[1]}), '
+                    f'получено {init_centroids.shape}'
+                )
+        # Параметры инициализации sklearn: заданные центроиды - один запуск
+        init = {'init': init_centroids, 'n_init': 1} if init_centroids is not None else {}
+
+        match self.backend:
+            case 'kmeans':
+                from sklearn.cluster import KMeans
+
+                kmeans = KMeans(n_clusters=n_clusters, random_state=self.random_state, **init)
+                kmeans.fit(embeddings)
+                return self.__sklearn_result(kmeans, embeddings)
+
+            case 'minibatch':
+                from sklearn.cluster import MiniBatchKMeans
+
+                kmeans = MiniBatchKMeans(
+                    n_clusters=n_clusters,
+                    random_state=self.random_state,
+                    batch_size=MINIBATCH_SIZE,
+                    **(init or {'n_init': 3})
+                )
+                kmeans.fit(embeddings)
+                return self.__sklearn_result(kmeans, embeddings)
+
+            case 'faiss':
+                import faiss
+
+                kmeans = faiss.Kmeans(
+                    embeddings.shape[1],
+                    n_clusters,
+                    niter=FAISS_KMEANS_NITER,
+                    seed=self.random_state,
+                    verbose=False
+                )
+                kmeans.train(embeddings, init_centroids=init_centroids)
+                # Поиск ближайшего центроида сразу даёт и метки, и квадраты расстояний
+                squared_distances, labels = kmeans.index.search(embeddings, 1)
+                return ClusteringResult(
+                    labels=labels[:, 0].astype(np.int64),
+                    distances=np.sqrt(np.maximum(squared_distances[:, 0], 0)),
+                    centroids=kmeans.centroids
+                )
+
+    def __sklearn_result(self, kmeans, embeddings: np.ndarray) -> ClusteringResult:
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        labels = kmeans.labels_
+        distances = np.linalg.norm(embeddings - centroids[labels], axis=1)
+        return ClusteringResult(labels=labels, distances=distances, centroids=centroids)
@@ -0,0 +1,225 @@
+'''
+ICEQ (2025) - Упаковка контекста промпта в бюджет токенов
+
+Основной функционал:
+- Подсчёт токенов токенизатором выбранной LLM (ICEQ - токенизатор T-lite,
+  DeepSeek и Qwen - токенизаторы их моделей на Hugging Face) из локального
+  кэша Hugging Face (скачивание - по запросу); без токенизатора -
+  консервативная оценка по количеству символов
+- Отбор чанков в бюджет токенов по приоритету: сначала центральные чанки
+  больших кластеров, при равном размере - ближайшие к центроиду
+- Обрезка текста, не помещающегося в бюджет, по границе токена
+
+Пример использования:
+    >>> counter = get_token_counter('Qwen/Qwen3-235B-A22B')
+    >>> priorities = cluster_priorities(clustering, central_indices)
+    >>> context = pack_chunks(target_chunks, counter, budget=8000, priorities=priorities)
+    >>> context.text, context.tokens, context.candidate_tokens, context.dropped
+'''
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import numpy as np
+
+from clustering import ClusteringResult
+
+# Бюджет токенов контекста (чанков, подставляемых в промпт) по умолчанию
+DEFAULT_CONTEXT_TOKEN_BUDGET = 8000
+# Разделитель чанков в контексте
+CHUNK_SEPARATOR = '\n\n'
+# Символов на токен для оценки без токенизатора; для русского текста
+# BPE-токенизаторы дают 3-4 символа на токен, поэтому оценка завышена
+CHARS_PER_TOKEN = 3.0
+
+
+class TokenCounter:
+    """
+    Подсчёт токенов текста токенизатором LLM или оценкой по символам
+
+    Attributes:
+        tokenizer: токенизатор transformers (None - оценка по CHARS_PER_TOKEN)
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    @property
+    def exact(self) -> bool:
+        """Считаются ли токены настоящим токенизатором"""
+        return self.tokenizer is not None
+
+    def count(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Количество токенов каждого текста (без специальных токенов)
+
+        Returns:
+            np.ndarray: количество токенов, shape (len(texts),)
+        """
+        if not len(texts):
+            return np.zeros(0, dtype=np.int64)
+        if self.tokenizer is None:
+            lengths = np.fromiter((len(text) for text in texts), dtype=np.float64, count=len(texts))
+            return np.ceil(lengths / CHARS_PER_TOKEN).astype(np.int64)
+
+        input_ids = self.tokenizer([str(text) for text in texts], add_special_tokens=False)['input_ids']
+        return np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Начало текста не длиннее max_tokens токенов"""
+        if self.tokenizer is None:
+            return text[:int(max_tokens * CHARS_PER_TOKEN)]
+
+        input_ids = self.tokenizer(text, add_special_tokens=False)['input_ids']
+        return self.tokenizer.decode(input_ids[:max_tokens])
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(tokenizer_name: Optional[str], download: bool = False) -> TokenCounter:
+    """
+    Счётчик токенов для токенизатора модели (загружается один раз)
+
+    По умолчанию токенизатор берётся только из локального кэша Hugging Face:
+    без него сразу используется оценка по количеству символов, а не попытки
+    скачать его с Hub. Если токенизатор не удаётся загрузить (нет transformers,
+    файлов в кэше или доступа к Hub), используется оценка по символам.
+
+    Args:
+        tokenizer_name (str | None): имя токенизатора на Hugging Face Hub
+            (None - только оценка по символам)
+        download (bool): скачивать токенизатор с Hub, если его нет в локальном кэше
+    """
+    if tokenizer_name is None:
+        return TokenCounter()
+
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=not download)
+    except Exception as e:
+        print(f'⚠️ Токенизатор {tokenizer_name} недоступен ({e}), токены оцениваются по количеству символов')
+        return TokenCounter()
+
+    print(f'Токенизатор {tokenizer_name} загружен.')
+    return TokenCounter(tokenizer)
+
+
+@dataclass
+class PackedContext:
+    """
+    Контекст промпта, упакованный в бюджет токенов
+
+    Attributes:
+        text (str): чанки, объединённые через CHUNK_SEPARATOR
+        indices (np.ndarray): номера вошедших чанков в порядке входа
+        tokens (int): токенов в контексте (сумма по чанкам и разделителям)
+        candidate_tokens (int): токенов во всех чанках-кандидатах
+        candidates_num (int): количество кандидатов
+        budget (int | None): бюджет токенов (None - без ограничения)
+        truncated (bool): контекст - обрезанный первый по приоритету чанк
+        exact (bool): токены посчитаны токенизатором LLM, а не оценены
+    """
+    text: str
+    indices: np.ndarray
+    tokens: int
+    candidate_tokens: int
+    candidates_num: int
+    budget: Optional[int]
+    truncated: bool
+    exact: bool
+
+    @property
+    def dropped(self) -> int:
+        """Сколько чанков не вошло в контекст"""
+        return self.candidates_num - len(self.indices)
+
+
+def cluster_priorities(clustering: ClusteringResult, central_indices: np.ndarray) -> np.ndarray:
+    '''
+    Приоритеты центральных чанков для упаковки контекста
+
+    Главный критерий - размер кластера (большие кластеры покрывают большую
+    часть текста), при равном размере выше приоритет чанка, ближе лежащего
+    к центроиду своего кластера.
+
+    Параметры:
+        clustering (ClusteringResult): результат кластеризации
+        central_indices (np.ndarray): индексы центральных чанков
+
+    Возвращаемое значение:
+        np.ndarray: приоритет каждого центрального чанка (больше - важнее)
+    '''
+    central_labels = clustering.labels[central_indices]
+    sizes = np.bincount(clustering.labels, minlength=clustering.n_clusters)[central_labels]
+    distances = clustering.distances[central_indices].astype(np.float64)
+    # Поправка на расстояние меньше 1, поэтому не меняет порядок кластеров разного размера
+    centrality = 0.5 * distances / (distances.max() + 1e-12) if len(distances) else distances
+    return sizes.astype(np.float64) - centrality
+
+
+def pack_chunks(
+        chunks: Sequence[str],
+        counter: TokenCounter,
+        budget: Optional[int],
+        priorities: Optional[np.ndarray] = None
+) -> PackedContext:
+    '''
+    Отбирает чанки в бюджет токенов
+
+    Чанки перебираются по убыванию приоритета, и каждый, который ещё
+    помещается в бюджет, добавляется в контекст (более короткие чанки с
+    меньшим приоритетом могут заполнить остаток бюджета). В тексте чанки
+    идут в исходном порядке. Если в бюджет не помещается даже первый по
+    приоритету чанк, в контекст попадает его начало.
+
+    Параметры:
+        chunks (Sequence[str]): чанки-кандидаты
+        counter (TokenCounter): счётчик токенов LLM
+        budget (int | None): бюджет токенов (None - все чанки)
+        priorities (np.ndarray | None): приоритет каждого чанка
+            (None - порядок входа)
+
+    Возвращаемое значение:
+        PackedContext: текст контекста и статистика по токенам
+    '''
+    token_counts = counter.count(chunks)
+    separator_tokens = int(counter.count([CHUNK_SEPARATOR])[0])
+    candidate_tokens = int(token_counts.sum()) + separator_tokens * max(0, len(chunks) - 1)
+
+    def packed(indices: np.ndarray, text: str, tokens: int, truncated: bool = False) -> PackedContext:
+        return PackedContext(
+            text=text,
+            indices=indices,
+            tokens=tokens,
+            candidate_tokens=candidate_tokens,
+            candidates_num=len(chunks),
+            budget=budget,
+            truncated=truncated,
+            exact=counter.exact
+        )
+
+    def joined(indices: np.ndarray) -> PackedContext:
+        tokens = int(token_counts[indices].sum()) + separator_tokens * max(0, len(indices) - 1)
+        return packed(indices, CHUNK_SEPARATOR.join(str(chunks[i]) for i in indices), tokens)
+
+    if budget is None or candidate_tokens <= budget:
+        return joined(np.arange(len(chunks)))
+
+    # Стабильная сортировка: при равном приоритете раньше идёт чанк, раньше стоящий во входе
+    order = np.arange(len(chunks)) if priorities is None else np.argsort(-np.asarray(priorities), kind='stable')
+    selected = []
+    used = 0
+    for i in order:
+        cost = int(token_counts[i]) + (separator_tokens if selected else 0)
+        if used + cost <= budget:
+            selected.append(i)
+            used += cost
+
+    if not selected:
+        first = int(order[0])
+        text = counter.truncate(str(chunks[first]), budget)
+        # Декодирование обрезанных токенов может дать на токен-другой больше
+        return packed(np.array([first]), text, min(budget, int(counter.count([text])[0])), truncated=True)
+
+    return joined(np.sort(np.array(selected, dtype=np.int64)))
@@ -0,0 +1,48 @@
+'''
+ICEQ (2025) - Семантическая дедупликация вопросов
+
+Основной функционал:
+- Поиск почти одинаковых вопросов одним матричным умножением эмбеддингов
+- Жадный отбор: из группы похожих вопросов остаётся первый
+
+Пример использования:
+    >>> keep = find_unique_questions(query_embeddings, threshold=0.95)
+    >>> questions = [q for q, k in zip(questions, keep) if k]
+'''
+
+import numpy as np
+
+# Косинусное сходство, начиная с которого вопросы считаются дубликатами
+DEFAULT_DEDUP_THRESHOLD = 0.95
+
+
+def find_unique_questions(embeddings: np.ndarray, threshold: float = DEFAULT_DEDUP_THRESHOLD) -> np.ndarray:
+    """
+    Находит вопросы, не являющиеся дубликатами более ранних
+
+    Сходство всех пар считается одним умножением нормализованных матриц.
+    Вопрос отбрасывается, если он похож на уже оставленный вопрос с
+    меньшим номером, поэтому порядок задаёт приоритет.
+
+    Args:
+        embeddings (np.ndarray): эмбеддинги вопросов (n, dim)
+        threshold (float): порог косинусного сходства
+
+    Returns:
+        np.ndarray: булева маска (n,) оставляемых вопросов
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    count = embeddings.shape[0]
+    if count < 2:
+        return np.ones(count, dtype=bool)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+    # Только пары (i, j) с i < j: вопрос сравнивается с более ранними
+    similar = np.triu(normalized @ normalized.T >= threshold, k=1)
+
+    keep = np.ones(count, dtype=bool)
+    for i in np.flatnonzero(similar.any(axis=1)):
+        if keep[i]:
+            keep[similar[i]] = False
+    return keep
@@ -0,0 +1,313 @@
+'''
+ICEQ (2025) - Извлечение текста из документов на сервере
+
+Основной функционал:
+- Извлечение текста из PDF, DOCX и TXT
+- Параллельное извлечение страниц PDF в рабочих процессах
+- Восстановление абзацев PDF: строки, перенесённые при вёрстке (в том числе
+  с переносом слова и через границу страницы), склеиваются в один абзац
+- Потоковая запись текста в файл: документ не собирается в одну строку,
+  результат передаётся в генерацию как путь к файлу (см. chunking)
+
+Пример использования:
+    >>> text_path = extract_text_file('textbook.pdf', 'textbook.txt')
+    >>> questions = generator.generate(pathlib.Path(text_path), 10)
+'''
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import os
+import re
+import codecs
+import zipfile
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+
+# Поддерживаемые форматы (по расширению файла)
+SUPPORTED_FORMATS = ('pdf', 'docx', 'txt')
+# Количество страниц PDF в одной задаче рабочего процесса
+PDF_PAGES_PER_TASK = 8
+# PDF с меньшим количеством страниц извлекается в текущем процессе
+PDF_PARALLEL_MIN_PAGES = 2 * PDF_PAGES_PER_TASK
+# Количество рабочих процессов извлечения PDF по умолчанию
+DEFAULT_PDF_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# Размер блока при чтении текстовых файлов, байт
+TEXT_BLOCK_SIZE = 1 << 20
+# Кодировка TXT, если файл не в UTF-8 и без BOM
+FALLBACK_ENCODING = 'cp1251'
+# Строка PDF короче этой доли типичной длины строки страницы завершает абзац
+SHORT_LINE_RATIO = 0.7
+# Символы, которыми обычно заканчивается абзац
+PARAGRAPH_END_CHARS = '.!?:;…»"\')'
+# Строка, состоящая только из номера страницы
+PAGE_NUMBER_PATTERN = re.compile(r'^\s*[-–—]?\s*\d{1,4}\s*[-–—]?\s*$')
+# Пространство имён WordprocessingML
+DOCX_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_pdf_executor: Optional[Executor] = None
+_pdf_executor_lock = threading.Lock()
+
+
+class UnsupportedDocument(ValueError):
+    """Формат документа не поддерживается или файл повреждён"""
+
+
+def document_format(filename: str) -> str:
+    """
+    Определяет формат документа по расширению
+
+    Raises:
+        UnsupportedDocument: если формат не входит в SUPPORTED_FORMATS
+    """
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension not in SUPPORTED_FORMATS:
+        raise UnsupportedDocument(
+            f"Неподдерживаемый тип файла '{extension or filename}'. "
+            f"Поддерживаются: {', '.join('.' + fmt for fmt in SUPPORTED_FORMATS)}"
+        )
+    return extension
+
+
+def reflow_lines(lines: List[str]) -> List[str]:
+    """
+    Склеивает строки страницы, перенесённые при вёрстке, в абзацы
+
+    Строка продолжает предыдущую, если предыдущая не заканчивается знаком
+    конца абзаца и либо следующая начинается со строчной буквы, либо
+    предыдущая не короче SHORT_LINE_RATIO типичной (медианной) длины строки.
+    Перенос слова по дефису перед строчной буквой убирается.
+
+    Args:
+        lines (list[str]): строки страницы
+
+    Returns:
+        list[str]: абзацы
+    """
+    lines = [line.strip() for line in lines]
+    lengths = sorted(len(line) for line in lines if line)
+    typical_length = lengths[len(lengths) // 2] if lengths else 0
+
+    paragraphs = []
+    current = ''
+    current_line = ''
+    for line in lines:
+        if not line or PAGE_NUMBER_PATTERN.match(line):
+            if current:
+                paragraphs.append(current)
+            current = current_line = ''
+            continue
+
+        if not current:
+            current = current_line = line
+            continue
+
+        ends_paragraph = current_line.endswith(tuple(PARAGRAPH_END_CHARS))
+        starts_lower = line[0].islower()
+        if current_line.endswith('-') and len(current_line) > 1 and current_line[-2].isalpha() and starts_lower:
+            current = current[:-1] + line
+        elif not ends_paragraph and (starts_lower or len(current_line) >= typical_length * SHORT_LINE_RATIO):
+            current += ' ' + line
+        else:
+            paragraphs.append(current)
+            current = line
+        current_line = line
+
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
+
+def _continues(previous: str, paragraph: str) -> bool:
+    """Продолжает ли первый абзац страницы последний абзац предыдущей"""
+    return (
+        bool(previous) and bool(paragraph)
+        and not previous.endswith(tuple(PARAGRAPH_END_CHARS))
+        and paragraph[0].islower()
+    )
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> List[List[str]]:
+    """
+    Извлекает абзацы страниц [start, end) (выполняется в рабочем процессе)
+
+    Returns:
+        list[list[str]]: абзацы каждой страницы
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reflow_lines((reader.pages[i].extract_text() or '').split('\n')) for i in range(start, end)]
+
+
+def _get_pdf_executor(workers: int) -> Executor:
+    """Пул процессов извлечения PDF, создаётся при первом использовании и переиспользуется"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # spawn: процесс веб-сервера многопоточный, fork в нём небезопасен
+            _pdf_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_executor
+
+
+def shutdown_pdf_workers() -> None:
+    """Останавливает рабочие процессы извлечения PDF"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        executor, _pdf_executor = _pdf_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _iter_pdf_paragraphs(path: str, workers: int) -> Iterator[str]:
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        raise UnsupportedDocument('Для извлечения текста из PDF установите пакет pypdf: pip install pypdf')
+
+    try:
+        pages_num = len(PdfReader(path).pages)
+    except (PdfReadError, ValueError, OSError) as e:
+        raise UnsupportedDocument(f'Не удалось прочитать PDF: {e}')
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, pages_num)) for start in range(0, pages_num, PDF_PAGES_PER_TASK)]
+    if pages_num < PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        batches = (_extract_pdf_pages(path, start, end) for start, end in ranges)
+    else:
+        # map сохраняет порядок страниц; результаты забираются по мере готовности
+        batches = _get_pdf_executor(workers).map(
+            _extract_pdf_pages,
+            [path] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges]
+        )
+
+    # Последний абзац страницы придерживается: он может продолжаться на следующей
+    pending = ''
+    for batch in batches:
+        for paragraphs in batch:
+            if not paragraphs:
+                continue
+            if _continues(pending, paragraphs[0]):
+                paragraphs = [pending + ' ' + paragraphs[0]] + paragraphs[1:]
+            elif pending:
+                yield pending
+            yield from paragraphs[:-1]
+            pending = paragraphs[-1]
+    if pending:
+        yield pending
+
+
+def _iter_docx_paragraphs(path: str) -> Iterator[str]:
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise UnsupportedDocument('Файл не является документом DOCX (старый формат .doc не поддерживается)')
+
+    with archive:
+        if 'word/document.xml' not in archive.namelist():
+            raise UnsupportedDocument('В архиве DOCX нет основного документа (word/document.xml)')
+
+        with archive.open('word/document.xml') as document:
+            # Потоковый разбор: обработанные абзацы удаляются из дерева
+            for _, element in ET.iterparse(document, events=('end',)):
+                if element.tag != f'{DOCX_NAMESPACE}p':
+                    continue
+                parts = []
+                for node in element.iter():
+                    if node.tag == f'{DOCX_NAMESPACE}t':
+                        parts.append(node.text or '')
+                    elif node.tag == f'{DOCX_NAMESPACE}tab':
+                        parts.append('\t')
+                    elif node.tag in (f'{DOCX_NAMESPACE}br', f'{DOCX_NAMESPACE}cr'):
+                        parts.append(' ')
+                element.clear()
+                paragraph = ''.join(parts).strip()
+                if paragraph:
+                    yield paragraph
+
+
+def _text_encoding(path: str) -> str:
+    """Определяет кодировку TXT: BOM, затем проверка UTF-8 по блокам, иначе FALLBACK_ENCODING"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return 'utf-16'
+
+        f.seek(0)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            while block := f.read(TEXT_BLOCK_SIZE):
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return FALLBACK_ENCODING
+    return 'utf-8'
+
+
+def iter_paragraphs(path: str, fmt: Optional[str] = None, workers: int = DEFAULT_PDF_WORKERS) -> Iterator[str]:
+    """
+    Извлекает абзацы документа по мере чтения
+
+    Args:
+        path (str): путь к документу
+        fmt (str | None): формат ('pdf', 'docx', 'txt'; None - по расширению)
+        workers (int): количество рабочих процессов для страниц PDF
+
+    Returns:
+        Iterator[str]: абзацы (для TXT - строки файла как есть)
+    """
+    match fmt or document_format(path):
+        case 'pdf':
+            yield from _iter_pdf_paragraphs(path, workers)
+        case 'docx':
+            yield from _iter_docx_paragraphs(path)
+        case 'txt':
+            with open(path, 'r', encoding=_text_encoding(path), errors='replace', newline=None) as f:
+                for line in f:
+                    yield line.rstrip('\n')
+        case other:
+            raise UnsupportedDocument(f"Неподдерживаемый тип файла '{other}'")
+
+
+def extract_text_file(
+        path: str,
+        output_path: str,
+        fmt: Optional[str] = None,
+        workers: int = DEFAULT_PDF_WORKERS
+) -> str:
+    """
+    Извлекает текст документа в файл UTF-8 для генерации
+
+    Абзацы PDF и DOCX записываются через пустую строку, TXT сохраняет
+    свои строки. Файл TXT в UTF-8 не копируется.
+
+    Args:
+        path (str): путь к документу
+        output_path (str): куда записать текст
+        fmt (str | None): формат (None - по расширению)
+        workers (int): количество рабочих процессов для страниц PDF
+
+    Returns:
+        str: путь к файлу с текстом (output_path или path для TXT в UTF-8)
+
+    Raises:
+        UnsupportedDocument: если формат не поддерживается или файл не читается
+    """
+    fmt = fmt or document_format(path)
+    if fmt == 'txt' and _text_encoding(path) == 'utf-8':
+        return path
+
+    separator = '\n' if fmt == 'txt' else '\n\n'
+    with open(output_path, 'w', encoding='utf8', newline='\n') as f:
+        first = True
+        for paragraph in iter_paragraphs(path, fmt, workers):
+            if not first:
+                f.write(separator)
+            f.write(paragraph)
+            first = False
+    return output_path
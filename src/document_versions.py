@@ -0,0 +1,316 @@
+'''
+ICEQ (2025) - Версии документов для инкрементальной перегенерации
+
+Основной функционал:
+- Состояние последней генерации по документу: хэши чанков, их эмбеддинги
+  кластеризации, центроиды кластеров и вопросы с центральными чанками их кластеров
+- Сравнение версий документа по хэшам чанков: кодируются только изменённые
+- Начальные центроиды кластеризации новой версии из центроидов предыдущей
+- In-memory LRU слой и дисковый слой (общий для рабочих процессов) с временем жизни
+- Статистика переиспользования чанков, кластеров и вопросов
+
+Пример использования:
+    >>> store = DocumentVersionStore('.cache/documents')
+    >>> previous = store.get('lecture-1')
+    >>> positions = match_chunks(previous.chunk_hashes, hashes) if previous else None
+    >>> store.put('lecture-1', DocumentVersion(hashes, embeddings, centroids, centers, questions, question_centers,
+    ...                                        'deepseek', prompts, encoder))
+'''
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import os
+import re
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Директория состояния по умолчанию (в корне проекта)
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.cache',
+    'documents'
+)
+# Максимальное количество документов в in-memory слое
+DEFAULT_MEMORY_DOCUMENTS = 32
+# Время жизни версии, секунд (неделя)
+DEFAULT_TTL = 7 * 24 * 3600
+# Идентификатор документа - имя файла дискового слоя
+DOCUMENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Учитываемые объекты переиспользования
+REUSE_ITEMS = ('chunks', 'clusters', 'questions')
+
+
+@dataclass
+class DocumentVersion:
+    """
+    Состояние последней генерации по документу
+
+    Attributes:
+        chunk_hashes (list[str]): хэши чанков (embedding_cache.chunk_hash) в порядке текста
+        embeddings (np.ndarray): эмбеддинги кластеризации чанков, shape (n, d)
+        centroids (np.ndarray): центроиды кластеров, shape (k, d)
+        central_hashes (list[str]): хэши центральных чанков кластеров
+        questions (list[dict]): итоговые вопросы с объяснениями
+        question_centers (list[str]): хэш центрального чанка кластера каждого вопроса
+        llm (str): LLM, которой сгенерированы вопросы
+        prompts (str): версия промптов генерации
+        encoder (str): модель и бэкенд энкодера, которым получены embeddings
+        created_at (float): время сохранения версии
+    """
+    chunk_hashes: List[str]
+    embeddings: np.ndarray
+    centroids: np.ndarray
+    central_hashes: List[str]
+    questions: List[dict]
+    question_centers: List[str]
+    llm: str
+    prompts: str
+    encoder: str
+    created_at: float = field(default_factory=time.time)
+
+
+def match_chunks(previous_hashes: List[str], hashes: List[str]) -> np.ndarray:
+    '''
+    Сопоставляет чанки новой версии документа с предыдущей по хэшам
+
+    Параметры:
+        previous_hashes (list[str]): хэши чанков предыдущей версии
+        hashes (list[str]): хэши чанков новой версии
+
+    Возвращаемое значение:
+        np.ndarray: номер такого же чанка в предыдущей версии для каждого
+            чанка новой версии, -1 - чанк изменён или добавлен
+    '''
+    positions = {chunk_hash: i for i, chunk_hash in enumerate(previous_hashes)}
+    return np.fromiter((positions.get(chunk_hash, -1) for chunk_hash in hashes), dtype=np.int64, count=len(hashes))
+
+
+def warm_start_centroids(
+        previous_centroids: np.ndarray,
+        embeddings: np.ndarray,
+        n_clusters: int,
+        changed: np.ndarray
+) -> Optional[np.ndarray]:
+    '''
+    Начальные центроиды кластеризации новой версии документа
+
+    Центроиды предыдущей версии берутся как есть. Если кластеров стало
+    больше, недостающие центроиды - эмбеддинги изменённых чанков (затем
+    остальных): новые темы документа получают свои кластеры.
+
+    Параметры:
+        previous_centroids (np.ndarray): центроиды предыдущей версии, shape (k, d)
+        embeddings (np.ndarray): эмбеддинги чанков новой версии, shape (n, d)
+        n_clusters (int): количество кластеров новой версии
+        changed (np.ndarray): маска изменённых чанков, shape (n,)
+
+    Возвращаемое значение:
+        np.ndarray | None: центроиды, shape (n_clusters, d);
+            None - размерность эмбеддингов изменилась
+    '''
+    if previous_centroids.shape[1] != embeddings.shape[1]:
+        return None
+
+    centroids = previous_centroids[:n_clusters]
+    missing_num = n_clusters - len(centroids)
+    if missing_num > 0:
+        candidates = np.concatenate([np.flatnonzero(changed), np.flatnonzero(~changed)])
+        centroids = np.concatenate([centroids, embeddings[candidates[:missing_num]]])
+    return np.asarray(centroids, dtype=np.float32)
+
+
+class DocumentVersionStore:
+    """
+    Хранилище последних версий документов с in-memory LRU и дисковым слоем
+
+    Для каждого документа хранится только последняя версия. Дисковый слой
+    (.npz-файл на документ) общий для рабочих процессов: версия, сохранённая
+    одним процессом, читается другим. Версии старше ttl секунд считаются
+    отсутствующими. Вопросы возвращаются копией.
+
+    Attributes:
+        cache_dir (str | None): директория дискового слоя (None - только память)
+        ttl (float | None): время жизни версии, секунд (None - без ограничения)
+        max_memory_documents (int): ёмкость in-memory слоя
+    """
+
+    def __init__(
+            self,
+            cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+            ttl: Optional[float] = DEFAULT_TTL,
+            max_memory_documents: int = DEFAULT_MEMORY_DOCUMENTS
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_memory_documents = max_memory_documents
+
+        # document_id -> (версия, mtime файла дискового слоя)
+        self.__memory: 'OrderedDict[str, tuple[DocumentVersion, float | None]]' = OrderedDict()
+        self.__counters = {'hits': 0, 'misses': 0, 'updates': 0}
+        self.__reuse = {item: {'reused': 0, 'recomputed': 0} for item in REUSE_ITEMS}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def check_id(document_id: str) -> str:
+        """
+        Проверяет идентификатор документа
+
+        Raises:
+            ValueError: идентификатор не из латинских букв, цифр, '-' и '_' или длиннее 64 символов
+        """
+        if not isinstance(document_id, str) or not DOCUMENT_ID_PATTERN.match(document_id):
+            raise ValueError(
+                'Некорректный идентификатор документа: допустимы латинские буквы, цифры, "-" и "_" (до 64 символов)'
+            )
+        return document_id
+
+    def __path(self, document_id: str) -> str:
+        return os.path.join(self.cache_dir, document_id + '.npz')
+
+    def __expired(self, version: DocumentVersion) -> bool:
+        return self.ttl is not None and time.time() - version.created_at > self.ttl
+
+    def __disk_mtime(self, document_id: str) -> Optional[float]:
+        if self.cache_dir is None:
+            return None
+        try:
+            return os.stat(self.__path(document_id)).st_mtime
+        except OSError:
+            return None
+
+    def __remember(self, document_id: str, version: DocumentVersion, mtime: Optional[float]) -> None:
+        self.__memory[document_id] = (version, mtime)
+        self.__memory.move_to_end(document_id)
+        while len(self.__memory) > self.max_memory_documents:
+            self.__memory.popitem(last=False)
+
+    def __read_disk(self, document_id: str) -> Optional[DocumentVersion]:
+        path = self.__path(document_id)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                return DocumentVersion(
+                    chunk_hashes=meta['chunk_hashes'],
+                    embeddings=data['embeddings'],
+                    centroids=data['centroids'],
+                    central_hashes=meta['central_hashes'],
+                    questions=meta['questions'],
+                    question_centers=meta['question_centers'],
+                    llm=meta['llm'],
+                    prompts=meta['prompts'],
+                    # Версии, сохранённые до учёта энкодера, считаются полученными другим энкодером
+                    encoder=meta.get('encoder', ''),
+                    created_at=meta['created_at']
+                )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f'⚠️ Версия документа повреждена ({path}): {e}')
+            return None
+
+    def __write_disk(self, document_id: str, version: DocumentVersion) -> Optional[float]:
+        path = self.__path(document_id)
+        meta = {
+            'chunk_hashes': version.chunk_hashes,
+            'central_hashes': version.central_hashes,
+            'questions': version.questions,
+            'question_centers': version.question_centers,
+            'llm': version.llm,
+            'prompts': version.prompts,
+            'encoder': version.encoder,
+            'created_at': version.created_at
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    embeddings=version.embeddings,
+                    centroids=version.centroids,
+                    meta=np.array(json.dumps(meta, ensure_ascii=False))
+                )
+            os.replace(tmp_path, path)
+            return os.stat(path).st_mtime
+        except OSError as e:
+            print(f'⚠️ Не удалось сохранить версию документа на диск: {e}')
+            return None
+
+    def get(self, document_id: str) -> Optional[DocumentVersion]:
+        """
+        Возвращает последнюю версию документа
+
+        Версия из памяти перечитывается с диска, если её сохранил другой процесс.
+
+        Args:
+            document_id (str): идентификатор документа
+
+        Returns:
+            DocumentVersion | None: копия версии или None, если документ ещё не генерировался
+        """
+        self.check_id(document_id)
+        with self.__lock:
+            version, mtime = self.__memory.get(document_id, (None, None))
+            disk_mtime = self.__disk_mtime(document_id)
+            if disk_mtime is not None and disk_mtime != mtime:
+                version = self.__read_disk(document_id)
+                if version is not None:
+                    self.__remember(document_id, version, disk_mtime)
+
+            if version is None or self.__expired(version):
+                self.__memory.pop(document_id, None)
+                self.__counters['misses'] += 1
+                return None
+
+            self.__memory.move_to_end(document_id)
+            self.__counters['hits'] += 1
+            return copy.deepcopy(version)
+
+    def put(self, document_id: str, version: DocumentVersion) -> None:
+        """
+        Сохраняет версию документа вместо предыдущей
+
+        Args:
+            document_id (str): идентификатор документа
+            version (DocumentVersion): новая версия (сохраняется копия)
+        """
+        self.check_id(document_id)
+        version = copy.deepcopy(version)
+        mtime = self.__write_disk(document_id, version) if self.cache_dir is not None else None
+        with self.__lock:
+            self.__remember(document_id, version, mtime)
+            self.__counters['updates'] += 1
+
+    def record(self, item: str, reused: int, recomputed: int) -> None:
+        """
+        Учитывает переиспользование при перегенерации документа
+
+        Args:
+            item (str): объект (см. REUSE_ITEMS)
+            reused (int): сколько взято из предыдущей версии
+            recomputed (int): сколько вычислено заново
+        """
+        with self.__lock:
+            self.__reuse[item]['reused'] += reused
+            self.__reuse[item]['recomputed'] += recomputed
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику хранилища
+
+        Returns:
+            dict: попадания и промахи поиска версий, количество сохранений,
+                документов в памяти и переиспользование по объектам
+        """
+        with self.__lock:
+            return {
+                **self.__counters,
+                'memory_documents': len(self.__memory),
+                'reuse': copy.deepcopy(self.__reuse)
+            }
@@ -0,0 +1,231 @@
+'''
+ICEQ (2025) - Остановка генерации ICEQ по количеству вопросов
+
+Основной функционал:
+- Критерий остановки generate: ответ разбирается по мере декодирования
+  (IncrementalQuestionParser), и последовательность останавливается, как
+  только в ней есть запрошенное количество завершённых вопросов
+- Лимит новых токенов по количеству вопросов и измеренному количеству
+  токенов на вопрос (вместо фиксированного max_new_tokens)
+- Причина остановки каждого запроса: questions (набрано нужное количество
+  вопросов), eos (модель закончила ответ), max_tokens (исчерпан лимит)
+
+Пример использования:
+    >>> budget = TokenBudget(default_tokens_per_question=250)
+    >>> limits = [budget.limit(questions_num, max_tokens=32_000) for questions_num in nums]
+    >>> criteria = QuestionsStoppingCriteria(tokenizer, prompt_length, nums, limits)
+    >>> model.generate(**inputs, max_new_tokens=max(limits), stopping_criteria=[criteria])
+    >>> criteria.stop_reason(0), criteria.tokens[0], criteria.questions[0]
+'''
+
+from collections import deque
+from typing import List, Literal, Optional, Sequence
+
+import math
+import threading
+
+import numpy as np
+
+from question_parser import IncrementalQuestionParser
+
+# Причины остановки генерации
+StopReason = Literal['questions', 'eos', 'max_tokens']
+STOP_REASONS = ('questions', 'eos', 'max_tokens')
+
+# Запас лимита относительно измеренного количества токенов на вопрос
+TOKEN_LIMIT_MARGIN = 1.5
+# Токены сверх вопросов (вступление модели, разделители)
+TOKEN_LIMIT_OVERHEAD = 64
+# Квантиль измеренных токенов на вопрос, по которому считается лимит
+TOKENS_PER_QUESTION_QUANTILE = 0.9
+# Минимальное количество замеров для лимита по измерениям
+DEFAULT_MIN_SAMPLES = 5
+# Сколько последних замеров хранить
+DEFAULT_MAX_SAMPLES = 200
+
+
+class TokenBudget:
+    """
+    Лимит новых токенов по количеству вопросов
+
+    Лимит - TOKEN_LIMIT_OVERHEAD + questions_num × токенов на вопрос ×
+    TOKEN_LIMIT_MARGIN. Токены на вопрос - TOKENS_PER_QUESTION_QUANTILE
+    последних замеров (завершённых ответов), пока замеров меньше
+    min_samples - default_tokens_per_question.
+
+    Args:
+        default_tokens_per_question (float): оценка до накопления замеров
+        min_samples (int): минимальное количество замеров
+        max_samples (int): сколько последних замеров хранить
+    """
+
+    def __init__(
+            self,
+            default_tokens_per_question: float,
+            min_samples: int = DEFAULT_MIN_SAMPLES,
+            max_samples: int = DEFAULT_MAX_SAMPLES
+    ):
+        self.default_tokens_per_question = default_tokens_per_question
+        self.min_samples = min_samples
+        self.__samples = deque(maxlen=max_samples)
+        self.__stops = {reason: 0 for reason in STOP_REASONS}
+        self.__lock = threading.Lock()
+
+    @property
+    def tokens_per_question(self) -> float:
+        """Токенов на вопрос для расчёта лимита"""
+        with self.__lock:
+            if len(self.__samples) < self.min_samples:
+                return float(self.default_tokens_per_question)
+            return float(np.quantile(np.fromiter(self.__samples, dtype=np.float64), TOKENS_PER_QUESTION_QUANTILE))
+
+    def limit(self, questions_num: int, max_tokens: int) -> int:
+        """
+        Лимит новых токенов для запроса
+
+        Args:
+            questions_num (int): количество вопросов
+            max_tokens (int): верхняя граница лимита
+
+        Returns:
+            int: лимит новых токенов
+        """
+        tokens = TOKEN_LIMIT_OVERHEAD + max(1, questions_num) * self.tokens_per_question * TOKEN_LIMIT_MARGIN
+        return max(1, min(max_tokens, math.ceil(tokens)))
+
+    def record(self, tokens: int, questions: int, reason: StopReason) -> None:
+        """
+        Записывает завершённый ответ
+
+        Токены на вопрос измеряются только по ответам, которые не упёрлись
+        в лимит: обрезанный ответ занижал бы оценку.
+        """
+        with self.__lock:
+            self.__stops[reason] += 1
+            if reason != 'max_tokens' and questions > 0:
+                self.__samples.append(tokens / questions)
+
+    def stats(self) -> dict:
+        tokens_per_question = self.tokens_per_question
+        with self.__lock:
+            return {
+                'tokens_per_question': round(tokens_per_question, 1),
+                'samples': len(self.__samples),
+                'stops': dict(self.__stops)
+            }
+
+
+class _SequenceState:
+    """Разбор одной последовательности: токены, уже переданные парсеру, и количество вопросов"""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.pending: List[int] = []
+        self.parser = IncrementalQuestionParser(record_failures=False)
+        self.questions = 0
+
+
+class QuestionsStoppingCriteria:
+    """
+    Критерий остановки generate по количеству завершённых вопросов
+
+    Новые токены каждой последовательности декодируются и передаются
+    IncrementalQuestionParser. Последовательность останавливается, когда
+    в ней questions_num завершённых вопросов или token_limit новых токенов
+    (лимит generate общий для батча, а лимиты запросов разные).
+
+    Состояние разбора проверяется по токенам последовательности: при beam
+    search строки меняются местами, а при prompt lookup decoding критерий
+    вызывается и для черновика, который может быть отброшен, - тогда разбор
+    последовательности начинается заново.
+
+    Args:
+        tokenizer: токенизатор модели
+        prompt_length (int): длина промптов батча в токенах (после паддинга)
+        questions_nums (Sequence[int]): количество вопросов каждого запроса
+        token_limits (Sequence[int]): лимит новых токенов каждого запроса
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, questions_nums: Sequence[int], token_limits: Sequence[int]):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.questions_nums = list(questions_nums)
+        self.token_limits = list(token_limits)
+        self.questions = [0] * len(self.questions_nums)
+        self.tokens = [0] * len(self.questions_nums)
+        # Конец ответа: после EOS строка батча дополняется паддингом
+        self.__end_ids = sorted({token_id for token_id in (tokenizer.eos_token_id, tokenizer.pad_token_id) if token_id is not None})
+        self.__reasons: List[Optional[StopReason]] = [None] * len(self.questions_nums)
+        self.__states: dict[int, _SequenceState] = {}
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        import torch
+
+        rows = input_ids.shape[0]
+        # Строк может быть больше, чем запросов (beam search): строки запроса идут подряд
+        rows_per_request = max(1, rows // len(self.questions_nums))
+        generated = input_ids[:, self.prompt_length:]
+        # Длина ответа каждой строки до первого EOS (паддинга)
+        is_end = torch.isin(generated, torch.tensor(self.__end_ids, device=generated.device))
+        ended = is_end.any(dim=1).tolist()
+        lengths = torch.where(is_end.any(dim=1), is_end.int().argmax(dim=1), generated.shape[1]).tolist()
+
+        done = []
+        for row, ids in enumerate(generated.tolist()):
+            request = min(row // rows_per_request, len(self.questions_nums) - 1)
+            ids = ids[:lengths[row]]
+
+            questions = self.__parse(row, ids)
+            if rows_per_request == 1:
+                self.questions[request], self.tokens[request] = questions, len(ids)
+            else:
+                self.questions[request] = max(self.questions[request], questions)
+                self.tokens[request] = max(self.tokens[request], len(ids))
+
+            reason = None
+            if questions >= self.questions_nums[request]:
+                reason = 'questions'
+            elif len(ids) >= self.token_limits[request] and not ended[row]:
+                reason = 'max_tokens'
+            if rows_per_request == 1:
+                # Черновик prompt lookup decoding мог быть отброшен - причина пересчитывается
+                self.__reasons[request] = reason
+            elif reason is not None and self.__reasons[request] is None:
+                self.__reasons[request] = reason
+            done.append(reason is not None or ended[row])
+
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def __parse(self, row: int, ids: List[int]) -> int:
+        state = self.__states.get(row)
+        if state is None or ids[:len(state.ids)] != state.ids:
+            state = self.__states[row] = _SequenceState()
+
+        new_ids = ids[len(state.ids):]
+        if not new_ids:
+            return state.questions
+        state.ids.extend(new_ids)
+        state.pending.extend(new_ids)
+
+        text = self.tokenizer.decode(state.pending, skip_special_tokens=True)
+        # Незавершённый многобайтовый символ - ждём следующих токенов
+        if text.endswith('\ufffd'):
+            return state.questions
+        state.pending = []
+        state.questions += len(state.parser.feed(text))
+        return state.questions
+
+    def stop_reason(self, index: int) -> StopReason:
+        """
+        Причина остановки запроса (после generate)
+
+        Args:
+            index (int): номер запроса в батче
+
+        Returns:
+            str: questions, max_tokens или eos
+        """
+        reason = self.__reasons[index]
+        if reason is not None:
+            return reason
+        return 'max_tokens' if self.tokens[index] >= self.token_limits[index] else 'eos'
@@ -0,0 +1,329 @@
+'''
+ICEQ (2025) - Кэш эмбеддингов чанков
+
+Основной функционал:
+- Контентно-адресуемый кэш: ключ (имя модели, хэш нормализованного чанка)
+- In-memory LRU слой для горячих эмбеддингов
+- Дисковое хранилище векторов float32, читаемое через memory-map
+- Счётчики попаданий и промахов
+- Дисковое хранилище можно использовать из нескольких процессов
+  (рабочие процессы pre-fork сервера): запись - под файловой блокировкой
+
+Пример использования:
+    >>> cache = EmbeddingCache('.cache/embeddings')
+    >>> embeddings = cache.encode('intfloat/multilingual-e5-large-instruct', chunks, model.encode)
+    >>> cache.stats()
+'''
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: pre-fork сервер недоступен, хранилище используется одним процессом
+    fcntl = None
+
+# Директория кэша по умолчанию (в корне проекта)
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.cache',
+    'embeddings'
+)
+# Максимальное количество векторов в in-memory слое
+DEFAULT_MEMORY_ITEMS = 50_000
+
+VECTORS_FILE_NAME = 'vectors.f32'
+INDEX_FILE_NAME = 'index.json'
+LOCK_FILE_NAME = 'store.lock'
+
+
+def normalize_chunk(chunk: str) -> str:
+    """
+    Нормализует чанк перед хэшированием: Unicode NFC и схлопывание пробелов
+
+    Args:
+        chunk (str): фрагмент текста
+
+    Returns:
+        str: нормализованный фрагмент
+    """
+    return ' '.join(unicodedata.normalize('NFC', str(chunk)).split())
+
+
+def chunk_hash(chunk: str) -> str:
+    """
+    Вычисляет хэш нормализованного чанка
+
+    Args:
+        chunk (str): фрагмент текста
+
+    Returns:
+        str: hex-представление SHA-1
+    """
+    return hashlib.sha1(normalize_chunk(chunk).encode('utf-8')).hexdigest()
+
+
+class _DiskStore:
+    """
+    Дисковое хранилище векторов одной модели
+
+    Векторы дописываются в конец файла vectors.f32, а соответствие
+    хэш -> номер строки хранится в index.json. Чтение выполняется
+    через np.memmap, поэтому в память попадают только нужные строки.
+
+    Запись выполняется под блокировкой store.lock и начинается с перечитывания
+    индекса, поэтому процессы не затирают строки друг друга. Векторы,
+    записанные другими процессами, находятся после изменения index.json.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.__vectors_path = os.path.join(directory, VECTORS_FILE_NAME)
+        self.__index_path = os.path.join(directory, INDEX_FILE_NAME)
+        self.__lock_path = os.path.join(directory, LOCK_FILE_NAME)
+        self.__memmap = None
+        self.__index_mtime: Optional[int] = None
+
+        self.dim: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self.__load_index()
+
+    @contextmanager
+    def __locked(self) -> Iterator[None]:
+        """Блокировка хранилища между процессами"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.__lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __index_changed(self) -> bool:
+        try:
+            return os.stat(self.__index_path).st_mtime_ns != self.__index_mtime
+        except OSError:
+            return False
+
+    def __load_index(self) -> None:
+        if not os.path.exists(self.__index_path):
+            return
+        try:
+            self.__index_mtime = os.stat(self.__index_path).st_mtime_ns
+            with open(self.__index_path, 'r', encoding='utf8') as f:
+                index = json.load(f)
+            dim = index['dim']
+            rows = index['rows']
+        except (OSError, ValueError, KeyError) as e:
+            print(f'⚠️ Индекс кэша эмбеддингов повреждён ({self.directory}): {e}')
+            return
+
+        # Строки, которые не успели дописаться в файл векторов, отбрасываем
+        vectors_size = os.path.getsize(self.__vectors_path) if os.path.exists(self.__vectors_path) else 0
+        available_rows = vectors_size // (dim * 4) if dim else 0
+        self.dim = dim
+        self.rows = {key: row for key, row in rows.items() if row < available_rows}
+
+    def __save_index(self) -> None:
+        tmp_path = self.__index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump({'dim': self.dim, 'rows': self.rows}, f)
+        os.replace(tmp_path, self.__index_path)
+        self.__index_mtime = os.stat(self.__index_path).st_mtime_ns
+
+    def get(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Возвращает найденные на диске векторы по списку ключей"""
+        if any(key not in self.rows for key in keys) and self.__index_changed():
+            # Векторы могли дописать другие процессы
+            self.__load_index()
+        found = [(key, self.rows[key]) for key in keys if key in self.rows]
+        if not found:
+            return {}
+
+        max_row = max(row for _, row in found)
+        if self.__memmap is None or self.__memmap.shape[0] <= max_row:
+            available_rows = os.path.getsize(self.__vectors_path) // (self.dim * 4)
+            self.__memmap = np.memmap(
+                self.__vectors_path,
+                dtype=np.float32,
+                mode='r',
+                shape=(available_rows, self.dim)
+            )
+        vectors = self.__memmap[[row for _, row in found]]
+        return {key: vector for (key, _), vector in zip(found, vectors)}
+
+    def put(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        """Дописывает новые векторы в хранилище"""
+        if all(key in self.rows for key in keys):
+            return
+
+        with self.__locked():
+            if self.__index_changed():
+                self.__load_index()
+            new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.rows]
+            if not new:
+                return
+
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif self.dim != vectors.shape[1]:
+                raise ValueError(
+                    f'Размерность эмбеддингов изменилась: {self.dim} -> {vectors.shape[1]}'
+                )
+
+            block = np.ascontiguousarray([vector for _, vector in new], dtype=np.float32)
+            with open(self.__vectors_path, 'ab') as f:
+                # Номер строки определяем по фактическому размеру файла
+                first_row = f.seek(0, os.SEEK_END) // (self.dim * 4)
+                f.write(block.tobytes())
+            for offset, (key, _) in enumerate(new):
+                self.rows[key] = first_row + offset
+            self.__save_index()
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов с in-memory LRU и дисковым memory-mapped слоем
+
+    Ключ кэша - пара (имя модели, хэш нормализованного чанка), поэтому
+    повторная отправка того же конспекта не требует повторного кодирования.
+    Кодируются только ранее не встречавшиеся абзацы.
+
+    Attributes:
+        cache_dir (str | None): директория дискового слоя (None - только память)
+        max_memory_items (int): ёмкость in-memory слоя
+    """
+
+    def __init__(
+            self,
+            cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+            max_memory_items: int = DEFAULT_MEMORY_ITEMS
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+
+        self.__memory: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+        self.__disk_stores: Dict[str, _DiskStore] = {}
+        self.__lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __disk_store(self, model_name: str) -> Optional[_DiskStore]:
+        if self.cache_dir is None:
+            return None
+        if model_name not in self.__disk_stores:
+            directory_name = re.sub(r'[^\w.-]+', '__', model_name)
+            try:
+                self.__disk_stores[model_name] = _DiskStore(os.path.join(self.cache_dir, directory_name))
+            except OSError as e:
+                print(f'⚠️ Дисковый кэш эмбеддингов недоступен: {e}')
+                self.cache_dir = None
+                return None
+        return self.__disk_stores[model_name]
+
+    def __remember(self, model_name: str, key: str, vector: np.ndarray) -> None:
+        self.__memory[(model_name, key)] = vector
+        self.__memory.move_to_end((model_name, key))
+        while len(self.__memory) > self.max_memory_items:
+            self.__memory.popitem(last=False)
+
+    def encode(
+            self,
+            model_name: str,
+            chunks: Sequence[str],
+            encode_fn: Callable[[List[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Возвращает эмбеддинги чанков, кодируя только отсутствующие в кэше
+
+        Args:
+            model_name (str): имя модели (и режима кодирования), часть ключа кэша
+            chunks (Sequence[str]): фрагменты текста
+            encode_fn (Callable): функция кодирования списка строк в np.ndarray
+
+        Returns:
+            np.ndarray: матрица эмбеддингов float32 в порядке chunks
+        """
+        keys = [chunk_hash(chunk) for chunk in chunks]
+        found: Dict[str, np.ndarray] = {}
+
+        with self.__lock:
+            for key in keys:
+                vector = self.__memory.get((model_name, key))
+                if vector is not None:
+                    self.__memory.move_to_end((model_name, key))
+                    found[key] = vector
+            memory_found = len(found)
+
+            store = self.__disk_store(model_name)
+            if store is not None:
+                disk_found = store.get([key for key in dict.fromkeys(keys) if key not in found])
+                for key, vector in disk_found.items():
+                    vector = np.array(vector)
+                    self.__remember(model_name, key, vector)
+                    found[key] = vector
+
+        # Одинаковые абзацы внутри одного документа кодируем один раз
+        missing = {}
+        for chunk, key in zip(chunks, keys):
+            if key not in found and key not in missing:
+                missing[key] = chunk
+
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            with self.__lock:
+                for key, vector in zip(missing, vectors):
+                    self.__remember(model_name, key, vector)
+                    found[key] = vector
+                if store is not None:
+                    try:
+                        store.put(list(missing), vectors)
+                    except (OSError, ValueError) as e:
+                        print(f'⚠️ Не удалось сохранить эмбеддинги на диск: {e}')
+
+        with self.__lock:
+            self.memory_hits += memory_found
+            self.disk_hits += len(found) - memory_found - len(missing)
+            self.misses += len(missing)
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику кэша
+
+        Returns:
+            dict: попадания (память/диск), промахи, доля попаданий и размер слоёв
+        """
+        with self.__lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'memory_items': len(self.__memory),
+                'disk_items': sum(len(store.rows) for store in self.__disk_stores.values())
+            }
+
+    def clear_memory(self) -> None:
+        """Очищает in-memory слой (дисковый слой сохраняется)"""
+        with self.__lock:
+            self.__memory.clear()
@@ -0,0 +1,137 @@
+'''
+ICEQ (2025) - Бэкенды энкодеров: PyTorch, ONNX Runtime и ONNX int8
+
+Основной функционал:
+- Загрузка SentenceTransformer с бэкендом torch (fp32), onnx или onnx-int8
+- Однократный экспорт модели в ONNX и динамическое квантование весов в int8
+  с сохранением на диск: следующие запуски загружают готовый файл
+- Выбор конфигурации квантования по инструкциям процессора
+  (AVX-512 VNNI, AVX-512, AVX2, ARM64)
+
+Пример использования:
+    >>> model = load_sentence_transformer('intfloat/multilingual-e5-large-instruct', 'onnx-int8')
+    >>> embeddings = model.encode(chunks, normalize_embeddings=True)
+'''
+
+from typing import Literal, Optional
+
+import os
+import shutil
+import platform
+import threading
+
+EncoderBackend = Literal['torch', 'onnx', 'onnx-int8']
+
+# Доступные бэкенды энкодеров
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+# Директория экспортированных моделей по умолчанию (в корне проекта)
+DEFAULT_ONNX_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.cache',
+    'onnx'
+)
+# Файл модели ONNX внутри сохранённой модели SentenceTransformer
+ONNX_MODEL_FILE = os.path.join('onnx', 'model.onnx')
+
+# Экспорт одной модели из нескольких потоков выполняется один раз
+_export_lock = threading.Lock()
+
+
+def quantization_config() -> str:
+    """
+    Конфигурация динамического квантования под текущий процессор
+
+    Returns:
+        str: 'arm64', 'avx512_vnni', 'avx512' или 'avx2'
+    """
+    if platform.machine().lower() in ('arm64', 'aarch64'):
+        return 'arm64'
+
+    flags = set()
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf8') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    flags = set(line.split(':', 1)[1].split())
+                    break
+    except OSError:
+        pass
+
+    if 'avx512_vnni' in flags:
+        return 'avx512_vnni'
+    if 'avx512bw' in flags:
+        return 'avx512'
+    return 'avx2'
+
+
+def onnx_model_dir(model_name: str, onnx_dir: str = DEFAULT_ONNX_DIR) -> str:
+    """Директория экспортированной модели"""
+    return os.path.join(onnx_dir, model_name.replace('/', '--'))
+
+
+def _export_onnx(model_name: str, model_dir: str) -> None:
+    """Экспортирует модель в ONNX и сохраняет её целиком (токенизатор, пулинг, промпты)"""
+    from sentence_transformers import SentenceTransformer
+
+    print(f'Экспорт модели {model_name} в ONNX...')
+    # Если в репозитории модели нет ONNX-файла, sentence-transformers экспортирует её через optimum
+    model = SentenceTransformer(model_name, device='cpu', backend='onnx')
+    tmp_dir = f'{model_dir}.{os.getpid()}.{threading.get_ident()}.tmp'
+    model.save(tmp_dir)
+    try:
+        os.replace(tmp_dir, model_dir)
+    except OSError:
+        # Модель уже экспортирована другим процессом
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f'Модель {model_name} экспортирована: {model_dir}')
+
+
+def load_sentence_transformer(
+        model_name: str,
+        backend: EncoderBackend = 'torch',
+        device: Optional[str] = None,
+        onnx_dir: str = DEFAULT_ONNX_DIR
+):
+    """
+    Загружает SentenceTransformer с выбранным бэкендом
+
+    Для onnx и onnx-int8 модель при первой загрузке экспортируется в
+    onnx_dir (int8 - динамическое квантование весов поверх экспорта),
+    дальше загружается готовый файл. ONNX-бэкенды работают на CPU.
+
+    Args:
+        model_name (str): имя модели на Hugging Face Hub
+        backend (str): 'torch' (fp32 PyTorch), 'onnx' (fp32 ONNX Runtime) или 'onnx-int8'
+        device (str | None): устройство для бэкенда torch
+        onnx_dir (str): директория экспортированных моделей
+
+    Returns:
+        SentenceTransformer: загруженная модель
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд энкодеров '{backend}'. Доступные значения: {', '.join(ENCODER_BACKENDS)}")
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name, device=device)
+
+    model_dir = onnx_model_dir(model_name, onnx_dir)
+    with _export_lock:
+        if not os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE)):
+            os.makedirs(onnx_dir, exist_ok=True)
+            _export_onnx(model_name, model_dir)
+
+        if backend == 'onnx':
+            return SentenceTransformer(model_dir, device='cpu', backend='onnx')
+
+        config = quantization_config()
+        quantized_file = os.path.join('onnx', f'model_qint8_{config}.onnx')
+        if not os.path.exists(os.path.join(model_dir, quantized_file)):
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            print(f'Квантование модели {model_name} в int8 ({config})...')
+            model = SentenceTransformer(model_dir, device='cpu', backend='onnx')
+            export_dynamic_quantized_onnx_model(model, config, model_dir)
+
+    return SentenceTransformer(model_dir, device='cpu', backend='onnx', model_kwargs={'file_name': quantized_file})
@@ -0,0 +1,80 @@
+'''
+ICEQ (2025) - Загрузка переменных окружения
+
+Основной функционал:
+- Однократная загрузка .env из корня проекта
+- Определение кодировки файла за одно чтение (BOM, UTF-8, cp1251)
+  вместо перебора кодировок повторными вызовами load_dotenv
+
+Пример использования:
+    >>> from env_loader import load_environment
+    >>> load_environment()
+'''
+
+import io
+import os
+import codecs
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+# Корень проекта (на уровень выше src)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_PATH = os.path.join(PROJECT_ROOT, '.env')
+
+
+def _decode_env(raw: bytes) -> str | None:
+    """
+    Декодирует содержимое .env, справляясь с BOM в Windows
+
+    Args:
+        raw (bytes): содержимое файла
+
+    Returns:
+        str | None: текст файла или None, если кодировку определить не удалось
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return raw[len(codecs.BOM_UTF8):].decode('utf-8')
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return raw.decode('utf-16')
+
+    for encoding in ('utf-8', 'cp1251'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def load_environment() -> None:
+    """
+    Загружает переменные окружения из .env (только при первом вызове)
+
+    Значения из .env заменяют уже заданные (override=True), как и раньше.
+    """
+    global _loaded
+
+    with _lock:
+        if _loaded:
+            return
+        _loaded = True
+
+        from dotenv import load_dotenv
+
+        try:
+            if os.path.exists(ENV_PATH):
+                with open(ENV_PATH, 'rb') as f:
+                    content = _decode_env(f.read())
+
+                if content is None or not load_dotenv(stream=io.StringIO(content), override=True):
+                    print("⚠️ Не удалось загрузить .env файл. Пожалуйста, сохраните его в кодировке UTF-8.")
+            else:
+                # Fallback, если .env не найден в корне
+                if load_dotenv(override=True):
+                    print("ℹ️ .env файл в корне не найден, используется стандартный поиск.")
+                else:
+                    print("⚠️ .env файл не найден ни в одном из стандартных мест.")
+
+        except Exception as e:
+            print(f"⚠️ Критическая ошибка при загрузке .env: {e}")
@@ -10,54 +10,74 @@ ICEQ (2025) - Модуль генерации вопросов
     >>> questions = generator.generate(text, 10)
 '''
 
-from typing import Literal, List, Dict
+from typing import Callable, Iterator, Literal, List, Dict
 
-import re
 import os
-import json
+import copy
+import time
+import hashlib
+import threading
 
-import torch
-import faiss
 import numpy as np
-from dotenv import load_dotenv
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import KMeans
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
-from question_generator_api import generate_questions_deepseek, generate_questions_qwen
-import asyncio
-
-# Загружаем переменные окружения с обработкой кодировок
-try:
-    # Явно указываем путь к .env в корневой директории
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    env_path = os.path.join(project_root, '.env')
-
-    if os.path.exists(env_path):
-        loaded_successfully = False
-        # Пробуем разные кодировки, чтобы справиться с BOM в Windows
-        for encoding in ['utf-8-sig', 'utf-16', 'utf-8', 'cp1251']:
-            try:
-                # override=True чтобы новые значения заменили старые, если они есть
-                if load_dotenv(dotenv_path=env_path, encoding=encoding, override=True):
-                    loaded_successfully = True
-                    break  # Выходим из цикла при успехе
-            except Exception:
-                continue # Пробуем следующую кодировку
-
-        if not loaded_successfully:
-            print("⚠️ Не удалось загрузить .env файл. Пожалуйста, сохраните его в кодировке UTF-8.")
-    else:
-        # Fallback, если .env не найден в корне
-        if load_dotenv(override=True):
-            print("ℹ️ .env файл в корне не найден, используется стандартный поиск.")
-        else:
-            print("⚠️ .env файл не найден ни в одном из стандартных мест.")
-
-except Exception as e:
-    print(f"⚠️ Критическая ошибка при загрузке .env: {e}")
+from question_generator_api import ProviderClient, PROVIDERS, LLMS
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_DIR, chunk_hash
+from response_cache import ResponseCache, DEFAULT_CACHE_DIR as RESPONSE_CACHE_DIR, DEFAULT_TTL as RESPONSE_CACHE_TTL
+from clustering import ClusteringEngine, ClusteringBackend, ClusteringResult, select_central_indices
+from model_registry import ModelRegistry
+from question_parser import IncrementalQuestionParser, parse_questions
+from batching import DynamicBatcher, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+from deduplication import find_unique_questions, DEFAULT_DEDUP_THRESHOLD
+from chunking import ChunkedText, TextSource, chunk_source
+from context_packing import (
+    PackedContext,
+    TokenCounter,
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    cluster_priorities,
+    get_token_counter,
+    pack_chunks
+)
+from encoder_backends import EncoderBackend, ENCODER_BACKENDS, load_sentence_transformer
+from time_estimator import GenerationTimeEstimator, DEFAULT_ESTIMATOR_PATH
+from prefix_cache import PromptPrefixCache, shared_prefix_ids
+from prompt_lookup import DecodingCounter, DecodingStats, DEFAULT_NGRAM_SIZE, prompt_lookup_kwargs
+from early_stopping import QuestionsStoppingCriteria, TokenBudget
+from document_versions import (
+    DocumentVersion,
+    DocumentVersionStore,
+    DEFAULT_CACHE_DIR as DOCUMENT_VERSIONS_DIR,
+    match_chunks,
+    warm_start_centroids
+)
+from metrics import (
+    StageTimer,
+    GENERATIONS,
+    REQUEST_ITEMS,
+    PROMPT_TOKENS,
+    LLM_REQUEST_SECONDS,
+    LLM_TTFT_SECONDS,
+    LLM_ERRORS,
+    CACHE_LOOKUPS,
+    CACHE_HIT_RATIO,
+    MODEL_RESIDENT,
+    MODEL_MEMORY_MB,
+    MODEL_LOADS,
+    MODEL_EVICTIONS,
+    BATCHES,
+    BATCH_ITEMS,
+    PREFIX_CACHE_REQUESTS,
+    PREFIX_CACHE_SAVED_TOKENS,
+    PROMPT_LOOKUP_TOKENS,
+    PROMPT_LOOKUP_STEPS,
+    ICEQ_STOPS,
+    DOCUMENT_REUSE
+)
+from env_loader import load_environment
+
+# Тяжёлые библиотеки (torch, faiss, transformers, sentence_transformers)
+# импортируются лениво - при первом обращении к соответствующим моделям
+
+# Загружаем переменные окружения (однократно для всех модулей)
+load_environment()
 
 # Часть данных для кластеризации
 DATA_PART = 0.01
@@ -72,85 +92,70 @@ QUESTIONS_NUM_PROMPT_TAG = '[QUESTIONS_NUM]'
 CHUNKS_PROMPT_TAG = '[CHUNKS]'
 
 ICEQ_MODEL_NAME = 'iceq_model'
-
-
-def parse_questions(text_questions: str) -> list[dict]:
-    """
-    Парсит JSON с вопросами и возвращает структурированный список
-    
-    Args:
-        text_questions (str): JSON текст с вопросами
-    
-    Returns:
-        list[dict]: Список структурированных вопросов
-    """
-    try:
-        # Пытаемся распарсить как JSON
-        json_data = json.loads(text_questions)
-        
-        if isinstance(json_data, list):
-            questions = []
-            for item in json_data:
-                if 'question' in item and 'options' in item and 'correct_answer' in item:
-                    # Конвертируем в нужный формат
-                    answers = []
-                    for i, option in enumerate(item['options'], 1):
-                        answers.append({
-                            'answer': option,
-                            'is_correct': (i == item['correct_answer'])
-                        })
-                    
-                    questions.append({
-                        'question': item['question'],
-                        'answers': answers,
-                        'explanation': item.get('explanation', '')
-                    })
-            return questions
-    except json.JSONDecodeError:
-        pass
-    
-    # Если JSON не парсится, пробуем старый формат
-    question_block_pattern = re.compile(r'(?ms)^\s*(\d+)\.\s*(.+?)(?=^\s*\d+\.\s|\Z)')
-    answer_line_pattern = re.compile(r'^\s*([+-])\s*(.+)')
-    explanation_line_pattern = re.compile(r'^\s*!\s*(.+)')
-
-    questions = []
-    blocks = question_block_pattern.findall(text_questions)
-    
-    for number, block in blocks:
-        lines = block.splitlines()
-        if not lines:
-            continue
-        
-        question_text = lines[0].strip()
-        answers = []
-        explanation = ""
-
-        for line in lines[1:]:
-            line = line.strip()
-            if not line:
-                continue
-            
-            answer_match = answer_line_pattern.match(line)
-            explanation_match = explanation_line_pattern.match(line)
-
-            if answer_match:
-                sign, answer_text = answer_match.groups()
-                answers.append({
-                    'answer': answer_text.strip(),
-                    'is_correct': (sign == '+')
-                })
-            elif explanation_match:
-                explanation = explanation_match.group(1).strip()
-
-        if answers:
-            questions.append({
-                'question': question_text,
-                'answers': answers,
-                'explanation': explanation
-            })
-            
-    return questions
+# Токенизатор модели ICEQ (дообученная T-lite)
+ICEQ_TOKENIZER_NAME = 't-tech/T-lite-it-1.0'
+# Модель для кластеризации чанков
+CLUSTERING_MODEL_NAME = 'intfloat/multilingual-e5-large-instruct'
+# Модель для семантического поиска объяснений
+SEARCH_MODEL_NAME = 'ai-forever/FRIDA'
+# Заявленный размер моделей в памяти, МБ: резервируется в бюджете памяти реестра
+# до загрузки (после загрузки уточняется по параметрам модели). Энкодеры - fp32
+# (560M и 823M параметров), ICEQ - fp16 (7.6B параметров, загрузка на CPU)
+MODEL_SIZES_MB = {
+    CLUSTERING_MODEL_NAME: 2140,
+    SEARCH_MODEL_NAME: 3140,
+    ICEQ_MODEL_NAME: 14_520,
+}
+# Доля размера fp32 для энкодеров по бэкендам (веса int8 в четыре раза меньше)
+ENCODER_SIZE_FACTORS = {
+    'torch': 1.0,
+    'onnx': 1.0,
+    'onnx-int8': 0.25,
+}
+# Стадии генерации и доля выполнения на момент начала каждой стадии
+# (сообщаются через progress_callback в QuestionsGenerator.generate;
+# extraction - извлечение текста из загруженного документа перед генерацией)
+GENERATION_STAGES = {
+    'extraction': 0.0,
+    'chunking': 0.05,
+    'embedding': 0.15,
+    'clustering': 0.35,
+    'generation': 0.45,
+    'explanations': 0.85,
+    'deduplication': 0.9,
+    'done': 1.0,
+}
+
+# Верхняя граница длины ответа ICEQ, токенов: лимит запроса считается по количеству
+# вопросов и измеренному количеству токенов на вопрос
+ICEQ_MAX_NEW_TOKENS = 32_000
+# Токенов на вопрос до накопления замеров: основной промпт (вопрос, четыре варианта
+# и объяснение с цитатой) и упрощённый промпт для коротких текстов (без объяснения)
+ICEQ_TOKENS_PER_QUESTION = 250
+ICEQ_SHORT_TOKENS_PER_QUESTION = 120
+# Бюджет текста в упрощённом промпте ICEQ, токенов: вместе с инструкцией
+# промпт должен уместиться в 1024 токена, иначе обрезка отрежет формат ответа
+ICEQ_SHORT_CONTEXT_TOKENS = 700
+# Сколько секунд ждать следующей части потокового ответа ICEQ, прежде чем считать
+# генерацию зависшей (первая часть ждёт ещё и обработку промпта)
+ICEQ_STREAM_TIMEOUT = 300
+# Максимальная длина n-граммы для поиска черновика в промпте (prompt lookup decoding)
+ICEQ_PROMPT_LOOKUP_NGRAM = DEFAULT_NGRAM_SIZE
+
+# Сколько раз догенерировать вопросы для групп, вернувших меньше запрошенного
+FANOUT_MAX_RETRIES = 1
+
+# Имена моделей в реестре
+CLUSTERING_MODEL_KEY = 'clustering'
+SEARCH_MODEL_KEY = 'search'
+ICEQ_MODEL_KEY = 'iceq'
+# Инструкция для запросов к multilingual-e5-large-instruct в режиме одного энкодера
+E5_QUERY_INSTRUCTION = 'Instruct: Given a question, retrieve passages that answer it\nQuery: '
+
+# Режимы работы энкодеров:
+#   - dual: отдельные модели для кластеризации и поиска объяснений
+#   - single: одна модель для обеих стадий
+EncoderMode = Literal['dual', 'single']
 
 
 class QuestionsGenerator:
@@ -165,8 +170,10 @@ class QuestionsGenerator:
     
     Attributes:
         device (str): Устройство для вычислений ('cuda' или 'cpu')
-        deepseek_client (OpenAI): Клиент для работы с DeepSeek API
-        iceq_model (dict): Локальная модель ICEQ с токенизатором
+        deepseek_client (bool): Наличие ключа DeepSeek API (проверяется при первом обращении)
+        iceq_model (dict): Локальная модель ICEQ с токенизатором (None, если не загружена)
+        embedding_cache (EmbeddingCache): Кэш эмбеддингов чанков
+        models (ModelRegistry): Реестр лениво загружаемых моделей
     
     Examples:
         >>> # Инициализация только с DeepSeek
@@ -194,7 +201,31 @@ class QuestionsGenerator:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, init_llms: list = []):
+    def __init__(
+            self,
+            init_llms: list = [],
+            embedding_cache_dir: str | None = DEFAULT_CACHE_DIR,
+            clustering_backend: ClusteringBackend = 'kmeans',
+            encoder_mode: EncoderMode = 'dual',
+            encoder_backend: EncoderBackend = 'torch',
+            idle_timeout: float | None = None,
+            memory_budget_mb: float | None = None,
+            llm_client: ProviderClient | None = None,
+            fanout_groups: int = 1,
+            fanout_concurrency: int = 4,
+            iceq_max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+            iceq_max_wait: float = DEFAULT_MAX_WAIT,
+            iceq_prefix_cache: bool = True,
+            iceq_prompt_lookup_tokens: int = 0,
+            response_cache_dir: str | None = RESPONSE_CACHE_DIR,
+            response_cache_ttl: float | None = RESPONSE_CACHE_TTL,
+            dedup_threshold: float | None = DEFAULT_DEDUP_THRESHOLD,
+            context_token_budget: int | None = DEFAULT_CONTEXT_TOKEN_BUDGET,
+            time_estimator_path: str | None = DEFAULT_ESTIMATOR_PATH,
+            document_versions_dir: str | None = DOCUMENT_VERSIONS_DIR,
+            device: str | None = None,
+            download_tokenizers: bool = False
+    ):
         """
         Инициализирует генератор вопросов
         
@@ -202,49 +233,290 @@ class QuestionsGenerator:
             init_llms (list): Список моделей для инициализации.
                 Доступные значения: ['deepseek', 'iceq']
                 По умолчанию модели загружаются лениво при первом использовании
+            embedding_cache_dir (str | None): Директория дискового кэша эмбеддингов.
+                None - кэш только в памяти
+            clustering_backend (str): Алгоритм кластеризации чанков.
+                Доступные значения: ['kmeans', 'minibatch', 'faiss']
+            encoder_mode (str): Режим энкодеров.
+                - dual: e5 для кластеризации и FRIDA для поиска объяснений
+                - single: e5 для обеих стадий, поиск переиспользует эмбеддинги
+                  кластеризации и кодирует только вопросы
+            encoder_backend (str): Бэкенд энкодеров.
+                - torch: fp32 PyTorch (CPU или GPU)
+                - onnx: fp32 ONNX Runtime на CPU
+                - onnx-int8: ONNX Runtime с динамически квантованными int8 весами на CPU
+                  (меньше памяти и быстрее на CPU-узлах); модели экспортируются
+                  при первой загрузке в .cache/onnx
+            idle_timeout (float | None): Через сколько секунд простоя выгружать модель.
+                None - модели не выгружаются по простою
+            memory_budget_mb (float | None): Бюджет памяти на модели, МБ. При превышении
+                выгружаются давно не использованные модели. None - без ограничения
+            llm_client (ProviderClient | None): Клиент API DeepSeek/Qwen с пулом соединений.
+                None - клиент с настройками по умолчанию
+            fanout_groups (int): На сколько групп делить центральные чанки для
+                параллельной генерации. 1 - один запрос к LLM со всеми чанками
+            fanout_concurrency (int): Максимальное количество одновременных запросов
+                к API при параллельной генерации
+            iceq_max_batch_size (int): Сколько одновременных запросов к ICEQ объединять
+                в один вызов generate
+            iceq_max_wait (float): Сколько секунд ждать следующих запросов для батча ICEQ
+            iceq_prefix_cache (bool): Переиспользовать KV-кэш общего префикса основного промпта
+                ICEQ (системный промпт и начало шаблона): prefill префикса выполняется один раз
+                для загруженной модели, а не в каждом запросе
+            iceq_prompt_lookup_tokens (int): Длина черновика prompt lookup decoding для
+                основного промпта ICEQ: продолжение копируется из промпта по совпадению
+                n-граммы и проверяется моделью за один проход. Запросы батча генерируются
+                по одному. 0 - обычное декодирование по одному токену
+            response_cache_dir (str | None): Директория дискового кэша ответов LLM.
+                None - кэш только в памяти
+            response_cache_ttl (float | None): Время жизни ответа в кэше, секунд.
+                None - без ограничения
+            dedup_threshold (float | None): Косинусное сходство, начиная с которого вопросы
+                считаются дубликатами; вместо удалённых догенерируются новые. None - не удалять
+            context_token_budget (int | None): Бюджет токенов чанков в промпте (по токенизатору
+                выбранной LLM). Центральные чанки отбираются по размеру кластера и близости
+                к центроиду. None - все центральные чанки
+            time_estimator_path (str | None): Файл замеров времени генерации, по которым
+                обучается оценка времени. None - замеры только в памяти
+            document_versions_dir (str | None): Директория последних версий документов для
+                инкрементальной перегенерации (generate с document_id). None - только в памяти
+            device (str | None): Устройство для вычислений ('cuda' или 'cpu').
+                None - 'cuda', если доступна (определяется при первой загрузке модели)
+            download_tokenizers (bool): Скачивать с Hugging Face Hub токенизаторы LLM для
+                подсчёта токенов контекста, если их нет в локальном кэше. False - без
+                токенизатора в кэше токены оцениваются по количеству символов
         """
         # Предотвращаем повторную инициализацию Singleton
         if QuestionsGenerator._initialized:
             return None
         QuestionsGenerator._initialized = True
 
-        # Определение и настройка вычислительного устройства
-        if torch.cuda.is_available():
-            self.device = 'cuda'
-            torch.cuda.empty_cache()
-            # Освобождаем неиспользуемую память
-            if hasattr(torch.cuda, 'reset_peak_memory_stats'):
-                torch.cuda.reset_peak_memory_stats()
-        else:
-            print('ВНИМАНИЕ: CUDA недоступна, используется CPU')
-            self.device = 'cpu'
-        print(f'Используемое устройство: {self.device}')
+        # Вычислительное устройство определяется при первой загрузке модели,
+        # чтобы создание генератора не требовало импорта torch
+        if device not in (None, 'cuda', 'cpu'):
+            raise ValueError(f"Неизвестное устройство '{device}'. Доступные значения: cuda, cpu")
+        self.__device = device
+
+        if encoder_mode not in ('dual', 'single'):
+            raise ValueError(f"Неизвестный режим энкодеров '{encoder_mode}'. Доступные значения: dual, single")
+        self.encoder_mode = encoder_mode
+
+        if encoder_backend not in ENCODER_BACKENDS:
+            raise ValueError(
+                f"Неизвестный бэкенд энкодеров '{encoder_backend}'. Доступные значения: {', '.join(ENCODER_BACKENDS)}"
+            )
+        self.encoder_backend = encoder_backend
+
+        # Реестр моделей: каждая модель загружается при первом обращении
+        self.models = ModelRegistry(idle_timeout=idle_timeout, memory_budget_mb=memory_budget_mb)
+        # Заявленные размеры нужны, чтобы освободить бюджет памяти до загрузки, а не после
+        encoder_size_factor = ENCODER_SIZE_FACTORS[encoder_backend]
+        self.models.register(
+            CLUSTERING_MODEL_KEY,
+            lambda: self.__load_sentence_transformer(CLUSTERING_MODEL_NAME),
+            size_mb=MODEL_SIZES_MB[CLUSTERING_MODEL_NAME] * encoder_size_factor
+        )
+        if encoder_mode == 'dual':
+            self.models.register(
+                SEARCH_MODEL_KEY,
+                lambda: self.__load_sentence_transformer(SEARCH_MODEL_NAME),
+                size_mb=MODEL_SIZES_MB[SEARCH_MODEL_NAME] * encoder_size_factor
+            )
+        self.models.register(ICEQ_MODEL_KEY, self.__init_iceq, size_mb=MODEL_SIZES_MB[ICEQ_MODEL_NAME])
 
         # Ленивая инициализация языковых моделей
         self.deepseek_available = self.__init_deepseek() if 'deepseek' in init_llms else False
         # Клиент DeepSeek будет инициализирован при первом обращении
         self.deepseek_client = None
-        self.iceq_model = self.__init_iceq() if 'iceq' in init_llms else None
-
-        # Загрузка моделей для обработки текста и эмбеддингов
-        print('Загрузка моделей для обработки текста...')
-        self.__clustering_model = SentenceTransformer(
-            'intfloat/multilingual-e5-large-instruct',  # Модель для кластеризации
-            device=self.device
+        # Общий клиент API: keep-alive соединения и один фоновый цикл событий
+        self.llm_client = llm_client if llm_client is not None else ProviderClient()
+        if 'iceq' in init_llms:
+            self.models.get(ICEQ_MODEL_KEY)
+
+        # Кэш эмбеддингов: повторно кодируются только новые абзацы
+        self.embedding_cache = EmbeddingCache(embedding_cache_dir)
+        # Кэш ответов LLM: одинаковые запросы (тот же текст, LLM и количество вопросов) не генерируются повторно
+        self.response_cache = ResponseCache(response_cache_dir, ttl=response_cache_ttl)
+        self.fanout_groups = max(1, fanout_groups)
+        self.fanout_concurrency = max(1, fanout_concurrency)
+        self.dedup_threshold = dedup_threshold
+        self.context_token_budget = context_token_budget
+        self.download_tokenizers = download_tokenizers
+        # Оценка времени генерации обучается на фактическом времени завершённых запросов
+        self.time_estimator = GenerationTimeEstimator(time_estimator_path)
+        # Последние версии документов: при перегенерации после правки пересчитываются только изменения
+        self.document_versions = DocumentVersionStore(document_versions_dir)
+
+        # Одновременные запросы к ICEQ объединяются в батчи (паддинг слева)
+        self.__iceq_batcher = DynamicBatcher(
+            lambda shards: self.__observe_iceq_batch(self.__run_iceq_requests, shards),
+            max_batch_size=iceq_max_batch_size,
+            max_wait=iceq_max_wait,
+            name='iceq-batcher'
         )
-        self.__search_model = SentenceTransformer(
-            'ai-forever/FRIDA',  # Модель для семантического поиска
-            device=self.device
+        self.__iceq_short_batcher = DynamicBatcher(
+            lambda items: self.__observe_iceq_batch(self.__run_iceq_short_requests, items),
+            max_batch_size=iceq_max_batch_size,
+            max_wait=iceq_max_wait,
+            name='iceq-short-batcher'
         )
-        print('Модели для обработки текста загружены.')
+        self.__clustering_engine = ClusteringEngine(clustering_backend)
+        self.iceq_prefix_cache = iceq_prefix_cache
+        self.__prefix_cache_lock = threading.Lock()
+        self.iceq_prompt_lookup_tokens = max(0, iceq_prompt_lookup_tokens)
+        self.__prompt_lookup_stats = DecodingStats()
+        # Лимиты новых токенов ICEQ по количеству вопросов: основной и упрощённый промпты
+        self.__iceq_token_budgets = {
+            'main': TokenBudget(ICEQ_TOKENS_PER_QUESTION),
+            'short': TokenBudget(ICEQ_SHORT_TOKENS_PER_QUESTION)
+        }
 
         # Загрузка промптов из файлов
         print('Загрузка промптов...')
         self.__user_prompt_template = self.__load_prompt('user_prompt.txt')
         self.__system_prompt = self.__load_prompt('system_prompt.txt')
+        # Версия промптов - часть ключа кэша ответов: изменение промпта делает старые ответы неактуальными
+        self.__prompts_version = hashlib.sha1(
+            (self.__system_prompt + self.__user_prompt_template).encode('utf-8')
+        ).hexdigest()[:12]
         print('Промпты загружены.')
         print('Инициализация генератора завершена.')
 
+    @property
+    def device(self) -> str:
+        """Устройство для вычислений ('cuda' или 'cpu'), определяется при первом обращении"""
+        if self.__device is None:
+            import torch
+
+            # Определение и настройка вычислительного устройства
+            if torch.cuda.is_available():
+                self.__device = 'cuda'
+                torch.cuda.empty_cache()
+                # Освобождаем неиспользуемую память
+                if hasattr(torch.cuda, 'reset_peak_memory_stats'):
+                    torch.cuda.reset_peak_memory_stats()
+            else:
+                print('ВНИМАНИЕ: CUDA недоступна, используется CPU')
+                self.__device = 'cpu'
+            print(f'Используемое устройство: {self.__device}')
+        return self.__device
+
+    def warm_up(self, model_keys: list[str] | None = None) -> None:
+        """
+        Заранее загружает модели (например, в фоне при старте веб-приложения)
+        и токенизаторы LLM для подсчёта токенов контекста
+        
+        Args:
+            model_keys (list[str] | None): имена моделей в реестре.
+                По умолчанию - энкодеры кластеризации и поиска
+        """
+        # Токенизаторы LLM для упаковки контекста: запрос не ждёт их загрузки
+        for llm in LLMS:
+            self.__token_counter(llm)
+
+        if model_keys is None:
+            model_keys = [key for key in (CLUSTERING_MODEL_KEY, SEARCH_MODEL_KEY) if key in self.models]
+        for key in model_keys:
+            self.models.get(key)
+
+    @property
+    def encoder_device(self) -> str:
+        """Устройство энкодеров: ONNX-бэкенды всегда работают на CPU"""
+        return self.device if self.encoder_backend == 'torch' else 'cpu'
+
+    def __encoder_id(self, model_name: str) -> str:
+        """Модель и бэкенд энкодера: эмбеддинги разных бэкендов (fp32 и int8) не смешиваются"""
+        return f'{model_name}@{self.encoder_backend}'
+
+    def __load_sentence_transformer(self, model_name: str):
+        """Загружает SentenceTransformer с выбранным бэкендом на выбранное устройство"""
+        return load_sentence_transformer(model_name, self.encoder_backend, device=self.encoder_device)
+
+    @property
+    def iceq_model(self) -> dict | None:
+        """Модель ICEQ с токенизатором, если она сейчас загружена"""
+        return self.models.peek(ICEQ_MODEL_KEY)
+
+    def models_status(self) -> dict:
+        """
+        Возвращает состояние резидентности моделей для мониторинга
+        
+        Returns:
+            dict: загружена ли каждая модель, её размер, время простоя и т.д.,
+                а также статистика батчей ICEQ
+        """
+        status = self.models.status()
+        status['encoder_backend'] = self.encoder_backend
+        prefix_cache = (self.iceq_model or {}).get('prefix_cache')
+        status['iceq_prefix_cache'] = prefix_cache.stats() if prefix_cache is not None else None
+        status['iceq_prompt_lookup'] = self.__prompt_lookup_stats.stats() if self.iceq_prompt_lookup_tokens else None
+        status['iceq_batching'] = {
+            'main': self.__iceq_batcher.stats(),
+            'short': self.__iceq_short_batcher.stats()
+        }
+        status['iceq_token_budget'] = {prompt: budget.stats() for prompt, budget in self.__iceq_token_budgets.items()}
+        status['document_versions'] = self.document_versions.stats()
+        return status
+
+    def update_metrics(self) -> None:
+        """
+        Обновляет метрики кэшей, резидентности моделей и батчей ICEQ
+
+        Вызывается перед выдачей /metrics (metrics.REGISTRY.add_collector):
+        значения берутся из уже существующей статистики, а не ведутся повторно.
+        """
+        embedding_stats = self.embedding_cache.stats()
+        caches = {('embeddings', 'all'): embedding_stats}
+        response_stats = self.response_cache.stats()
+        for llm, backend_stats in response_stats['backends'].items():
+            caches[('responses', llm)] = backend_stats
+
+        for (cache, backend), stats in caches.items():
+            CACHE_LOOKUPS.set_total(stats['memory_hits'], cache=cache, backend=backend, result='memory_hit')
+            CACHE_LOOKUPS.set_total(stats['disk_hits'], cache=cache, backend=backend, result='disk_hit')
+            CACHE_LOOKUPS.set_total(stats['misses'], cache=cache, backend=backend, result='miss')
+            CACHE_HIT_RATIO.set(stats['hit_rate'], cache=cache, backend=backend)
+
+        status = self.models_status()
+        for name, model in status['models'].items():
+            MODEL_RESIDENT.set(1 if model['loaded'] else 0, model=name)
+            MODEL_MEMORY_MB.set((model['size_mb'] or 0.0) if model['loaded'] else 0.0, model=name)
+            MODEL_LOADS.set_total(model['load_count'], model=name)
+            MODEL_EVICTIONS.set_total(model['eviction_count'], model=name)
+        for batcher, stats in status['iceq_batching'].items():
+            BATCHES.set_total(stats['batches'], batcher=batcher)
+            BATCH_ITEMS.set_total(stats['items'], batcher=batcher)
+        if status['iceq_prompt_lookup'] is not None:
+            PROMPT_LOOKUP_TOKENS.set_total(status['iceq_prompt_lookup']['tokens'])
+            PROMPT_LOOKUP_STEPS.set_total(status['iceq_prompt_lookup']['steps'])
+        for prompt, stats in status['iceq_token_budget'].items():
+            for reason, count in stats['stops'].items():
+                ICEQ_STOPS.set_total(count, prompt=prompt, reason=reason)
+        for item, counts in status['document_versions']['reuse'].items():
+            for result, count in counts.items():
+                DOCUMENT_REUSE.set_total(count, item=item, result=result)
+
+    def __encode(self, model_key: str, sentences, **kwargs) -> np.ndarray:
+        """
+        Кодирует тексты моделью из реестра, загружая её при необходимости
+        
+        Args:
+            model_key (str): имя модели в реестре
+            sentences: тексты для кодирования
+            **kwargs: параметры SentenceTransformer.encode
+        
+        Returns:
+            np.ndarray: эмбеддинги
+        """
+        with self.models.use(model_key) as model:
+            if model is None:
+                raise RuntimeError(f'Модель {model_key} недоступна')
+            embeddings = model.encode(sentences, device=self.encoder_device, **kwargs)
+        if hasattr(embeddings, 'cpu'):
+            # convert_to_tensor=True возвращает torch.Tensor
+            embeddings = embeddings.cpu().numpy()
+        return embeddings
+
     def __init_deepseek(self) -> bool:
         """
         Проверяет наличие API ключа для DeepSeek
@@ -273,8 +545,11 @@ class QuestionsGenerator:
             dict: словарь с токенизатором и моделью или None при ошибке
         """
         try:
+            import torch
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+
             print('Загрузка ICEQ с МАКСИМАЛЬНОЙ квантизацией (4-bit)...')
-            tokenizer = AutoTokenizer.from_pretrained('t-tech/T-lite-it-1.0')
+            tokenizer = AutoTokenizer.from_pretrained(ICEQ_TOKENIZER_NAME)
             
             # Настройки для минимального использования памяти
             if self.device == 'cuda':
@@ -349,52 +624,431 @@ class QuestionsGenerator:
         with open(filename, 'r', encoding='utf8') as f:
             return f.read()
 
-    def __filter_chunks(self, chunk: str, min_words_in_chunk: int) -> bool:
+    @staticmethod
+    def check_llm(llm: str) -> str:
         """
-        Фильтрует чанки текста по минимальному количеству слов
+        Проверяет, что LLM известна (до того, как её имя попадёт в пути кэша и метки метрик)
         
         Args:
-            chunk (str): фрагмент текста для проверки
-            min_words_in_chunk (int): минимальное количество слов
-            
+            llm (str): LLM для генерации вопросов
+        
+        Raises:
+            ValueError: LLM не из question_generator_api.LLMS
+        """
+        if llm not in LLMS:
+            raise ValueError(f"Неизвестная модель '{llm}'. Доступные значения: {', '.join(LLMS)}")
+        return llm
+
+    def __prepare_llm(self, llm: str) -> None:
+        """
+        Проверяет выбранную LLM и её доступность перед генерацией
+        
+        Args:
+            llm (str): LLM для генерации вопросов
+        
+        Raises:
+            ValueError: неизвестная LLM или модель ICEQ не загрузилась
+        """
+        self.check_llm(llm)
+        if llm == 'deepseek' and self.deepseek_client is None:
+            self.deepseek_client = self.__init_deepseek()
+        
+        if llm == 'iceq' and self.models.get(ICEQ_MODEL_KEY) is None:
+            raise ValueError("Не удалось загрузить модель ICEQ. Попробуйте использовать 'deepseek' или 'qwen' вместо 'iceq'.")
+
+    def __check_text_sufficiency(self, chunked: ChunkedText, questions_num: int) -> None:
+        """
+        Проверяет, что в тексте достаточно смысловых блоков для генерации вопросов
+        
+        Raises:
+            ValueError: если блоков меньше, чем вопросов
+        """
+        # Простая проверка: хватит ли параграфов (блоков между пустыми строками) для вопросов
+        if chunked.paragraphs_num < questions_num:
+            # Пробуем считать блоками отдельные строки длиннее MIN_BLOCK_WORDS слов
+            if chunked.blocks_num < questions_num:
+                raise ValueError(
+                    f"Недостаточно информационных блоков в тексте для генерации {questions_num} вопросов. "
+                    f"Найдено {chunked.blocks_num} блоков. Попробуйте уменьшить количество вопросов до {chunked.blocks_num} "
+                    f"или добавить больше структурированного текста."
+                )
+
+    def __split_chunks(self, chunked: ChunkedText) -> np.ndarray:
+        """
+        Извлекает чанки (строки текста), прошедшие фильтр по количеству слов
+        
+        Args:
+            chunked (ChunkedText): результат однопроходного разбиения текста
+        
         Returns:
-            bool: True, если чанк подходит, False - если нет
+            np.ndarray: отфильтрованные чанки
         """
-        result = chunk and len(chunk.split()) > min_words_in_chunk
-        return result
+        chunks = chunked.chunks()
+        print(f'Получено {len(chunks)} чанков после фильтрации.')
+        return chunks
 
-    def __get_central_objects(
+    def __get_clustering_embeddings(
             self,
-            kmeans: KMeans,
-            embeddings: np.ndarray,
-            objects: np.ndarray
+            chunks: np.ndarray,
+            previous: DocumentVersion | None = None,
+            positions: np.ndarray | None = None
     ) -> np.ndarray:
+        """
+        Вычисляет (или берёт из кэша) эмбеддинги чанков для кластеризации
+        
+        Args:
+            chunks (np.ndarray): чанки текста
+            previous (DocumentVersion | None): предыдущая версия документа
+            positions (np.ndarray | None): номера чанков в предыдущей версии
+                (document_versions.match_chunks); кодируются только чанки с -1
+        
+        Returns:
+            np.ndarray: нормализованные эмбеддинги
+        """
+        print('Вычисление эмбеддингов для кластеризации...')
+        def encode(new_chunks: np.ndarray) -> np.ndarray:
+            return self.embedding_cache.encode(
+                self.__encoder_id(CLUSTERING_MODEL_NAME),
+                new_chunks,
+                lambda uncached_chunks: self.__encode(
+                    CLUSTERING_MODEL_KEY,
+                    uncached_chunks,
+                    convert_to_tensor=True,
+                    normalize_embeddings=True
+                )
+            )
+
+        if previous is None:
+            clustering_embeddings = encode(chunks)
+        else:
+            # Неизменённые чанки берутся из предыдущей версии документа, даже если вытеснены из кэша
+            changed = positions < 0
+            clustering_embeddings = np.empty((len(chunks), previous.embeddings.shape[1]), dtype=np.float32)
+            clustering_embeddings[~changed] = previous.embeddings[positions[~changed]]
+            if changed.any():
+                clustering_embeddings[changed] = encode(chunks[changed])
+        print('Эмбеддинги для кластеризации вычислены.')
+        return clustering_embeddings
+
+    def __cluster_chunks(
+            self,
+            lines_num: int,
+            clustering_embeddings: np.ndarray,
+            previous: DocumentVersion | None = None,
+            changed: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Кластеризует чанки и возвращает индексы центральных чанков
+        
+        Args:
+            lines_num (int): количество строк исходного текста (для определения количества кластеров)
+            clustering_embeddings (np.ndarray): эмбеддинги чанков
+            previous (DocumentVersion | None): предыдущая версия документа -
+                кластеризация начинается с её центроидов
+            changed (np.ndarray | None): маска изменённых чанков (нужна с previous)
+        
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: индексы центральных чанков, их приоритеты
+                для упаковки контекста (см. context_packing.cluster_priorities) и центроиды
+        """
+        # Определение оптимального количества кластеров
+        clusters_num = self.__clusters_num(lines_num)
+        print(f'Количество кластеров: {clusters_num}')
+
+        init_centroids = None
+        if previous is not None:
+            init_centroids = warm_start_centroids(previous.centroids, clustering_embeddings, clusters_num, changed)
+
+        # Выполнение K-means кластеризации
+        warm_text = ', с центроидов предыдущей версии' if init_centroids is not None else ''
+        print(f'Запуск K-means кластеризации ({self.__clustering_engine.backend}{warm_text})...')
+        clustering = self.__clustering_engine.fit(clustering_embeddings, clusters_num, init_centroids)
+        print('Кластеризация завершена.')
+
+        central_indices = self.__get_central_indices(clustering)
+        return central_indices, cluster_priorities(clustering, central_indices), clustering.centroids
+
+    def __clusters_num(self, lines_num: int) -> int:
+        """Количество кластеров для текста: доля DATA_PART от числа строк в пределах [MIN, MAX]"""
+        return min(
+            MAX_CLUSTERS_NUM,
+            max(MIN_CLUSTERS_NUM, int(lines_num * DATA_PART))
+        )
+
+    def __get_central_indices(self, clustering: ClusteringResult) -> np.ndarray:
         
         '''
-        Находит самые центральные объекты в каждом кластере
+        Находит индексы самых центральных объектов в каждом кластере
 
         Параметры:
-            kmeans (sklearn.KMeans): обученный объект типа sklearn.KMeans
-            embeddings (np.ndarray): векторное представление объектов
-            objects (np.ndarray): сами объекты
+            clustering (ClusteringResult): результат кластеризации
+                (метки и расстояния до центроидов, уже посчитанные движком)
 
         Возвращаемое значение:
-            central_objects: центральные объекты из objects в каждом кластере
+            central_indices: индексы центральных объектов в каждом кластере
         '''
         
         print('Поиск центральных объектов для кластеров...')
-        centroids = kmeans.cluster_centers_
-        labels = kmeans.labels_
-        distances = np.linalg.norm(embeddings - centroids[labels], axis=1)
+        return select_central_indices(clustering)
 
-        central_indices = [
-            np.where(labels == i)[0][np.argmin(distances[labels == i])]
-            for i in range(kmeans.n_clusters)
-        ]
+    def __token_counter(self, llm: str) -> TokenCounter:
+        """Счётчик токенов контекста токенизатором LLM (загружается один раз)"""
+        tokenizer_name = PROVIDERS[llm]['model'] if llm in PROVIDERS else ICEQ_TOKENIZER_NAME
+        return get_token_counter(tokenizer_name, download=self.download_tokenizers)
+
+    def __pack_context(
+            self,
+            llm: str,
+            chunks,
+            priorities: np.ndarray | None = None,
+            budget: int | None = None
+    ) -> PackedContext:
+
+        '''
+        Упаковывает чанки в бюджет токенов промпта выбранной LLM
+
+        Параметры:
+            llm (str): LLM, токенизатором которой считаются токены
+            chunks: чанки-кандидаты
+            priorities (np.ndarray | None): приоритеты чанков (None - порядок чанков)
+            budget (int | None): бюджет токенов (None - context_token_budget генератора)
+
+        Возвращаемое значение (PackedContext): текст контекста и количество токенов
+        '''
+
+        context = pack_chunks(
+            chunks,
+            self.__token_counter(llm),
+            budget if budget is not None else self.context_token_budget,
+            priorities
+        )
+
+        PROMPT_TOKENS.observe(context.candidate_tokens, llm=llm, kind='candidate')
+        PROMPT_TOKENS.observe(context.tokens, llm=llm, kind='packed')
+        tokens_kind = 'токенов' if context.exact else 'токенов (оценка)'
+        budget_text = f', бюджет {context.budget}' if context.budget is not None else ''
+        print(f'Контекст: {context.tokens} из {context.candidate_tokens} {tokens_kind}{budget_text}, '
+              f'чанков {len(context.indices)} из {context.candidates_num}'
+              + (' (текст обрезан)' if context.truncated else ''))
+        return context
+
+    def __get_document_embeddings(
+            self,
+            target_chunks: np.ndarray,
+            target_clustering_embeddings: np.ndarray
+    ) -> np.ndarray:
+
+        '''
+        Вычисляет эмбеддинги чанков для поиска объяснений
+
+        Параметры:
+            target_chunks (np.ndarray): центральные чанки
+            target_clustering_embeddings (np.ndarray): их эмбеддинги кластеризации
 
-        return objects[central_indices]
+        Возвращаемое значение:
+            doc_embeddings (np.ndarray): матрица эмбеддингов документов
+        '''
+
+        if self.encoder_mode == 'single':
+            # Эмбеддинги чанков уже посчитаны на стадии кластеризации
+            return target_clustering_embeddings
+
+        return self.embedding_cache.encode(
+            f'{self.__encoder_id(SEARCH_MODEL_NAME)}:search_document',
+            target_chunks,
+            lambda new_chunks: self.__encode(
+                SEARCH_MODEL_KEY,
+                new_chunks,
+                prompt_name='search_document'
+            )
+        )
+
+    def __get_query_embeddings(self, questions: list[dict]) -> np.ndarray:
+
+        '''
+        Вычисляет эмбеддинги вопросов для поиска объяснений
+
+        Параметры:
+            questions (list[dict]): сгенерированные вопросы
+
+        Возвращаемое значение:
+            query_embeddings (np.ndarray): матрица эмбеддингов запросов
+        '''
+
+        questions_text = [q['question'] for q in questions]
+
+        if self.encoder_mode == 'single':
+            return self.__encode(
+                CLUSTERING_MODEL_KEY,
+                questions_text,
+                prompt=E5_QUERY_INSTRUCTION,
+                normalize_embeddings=True
+            )
+
+        return self.__encode(
+            SEARCH_MODEL_KEY,
+            questions_text,
+            prompt_name='search_query'
+        )
+
+    def __build_explanation_index(self, target_chunks: np.ndarray, target_clustering_embeddings: np.ndarray):
+
+        '''
+        Создаёт FAISS индекс центральных чанков для поиска объяснений
+
+        Параметры:
+            target_chunks (np.ndarray): центральные чанки
+            target_clustering_embeddings (np.ndarray): их эмбеддинги кластеризации
+
+        Возвращаемое значение:
+            faiss.IndexFlatIP: индекс по эмбеддингам документов
+        '''
+
+        import faiss
+
+        doc_embeddings = self.__get_document_embeddings(target_chunks, target_clustering_embeddings)
+
+        # Создание FAISS индекса для быстрого поиска похожих чанков
+        print('Настройка FAISS индекса...')
+        index = faiss.IndexFlatIP(doc_embeddings.shape[1])  # Косинусное расстояние
+        index.add(doc_embeddings)
+        print('FAISS индекс готов.')
+        return index
+
+    def __attach_explanations(
+            self,
+            questions: list[dict],
+            target_chunks: np.ndarray,
+            index
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        '''
+        Добавляет к вопросам без объяснения наиболее релевантный чанк
+
+        Параметры:
+            questions (list[dict]): вопросы (изменяются на месте)
+            target_chunks (np.ndarray): центральные чанки, по которым построен индекс
+            index (faiss.Index): индекс центральных чанков
+
+        Возвращаемое значение:
+            query_embeddings (np.ndarray): эмбеддинги вопросов
+            nearest (np.ndarray): номер ближайшего центрального чанка для каждого вопроса
+        '''
+
+        query_embeddings = self.__get_query_embeddings(questions)
+
+        # Проверка корректности эмбеддингов
+        if query_embeddings is None or len(query_embeddings.shape) < 2 or query_embeddings.shape[0] == 0:
+            print("⚠️ Не удалось создать эмбеддинги для вопросов. Объяснения будут пропущены.")
+            raise ValueError("Некорректные эмбеддинги для запроса")
+
+        # Поиск наиболее релевантных чанков для каждого вопроса
+        _, indices = index.search(query_embeddings, 1)
+
+        # Добавление объяснений к вопросам
+        for question, explanation_chunk in zip(questions, target_chunks[indices]):
+            # Если модель не предоставила объяснение, используем релевантный чанк
+            if not question.get('explanation'):
+                question['explanation'] = str(explanation_chunk[0])
+
+        return query_embeddings, indices[:, 0]
+
+    def __deduplicate_questions(
+            self,
+            llm: str,
+            questions: list[dict],
+            query_embeddings: np.ndarray,
+            nearest: np.ndarray,
+            target_chunks: np.ndarray,
+            index,
+            questions_num: int,
+            use_cache: bool = True,
+            priorities: np.ndarray | None = None
+    ) -> tuple[list[dict], np.ndarray]:
+
+        '''
+        Удаляет похожие вопросы и догенерирует недостающие
+
+        Дубликаты ищутся по эмбеддингам вопросов, уже вычисленным для поиска
+        объяснений. Недостающие вопросы запрашиваются одним запросом только по
+        центральным чанкам, к которым ещё нет вопросов.
+
+        Параметры:
+            llm (str): LLM для генерация вопросов
+            questions (list[dict]): вопросы с объяснениями
+            query_embeddings (np.ndarray): эмбеддинги вопросов
+            nearest (np.ndarray): ближайший центральный чанк для каждого вопроса
+            target_chunks (np.ndarray): центральные чанки
+            index (faiss.Index): индекс центральных чанков
+            questions_num (int): требуемое количество вопросов
+            use_cache (bool): использовать кэш ответов LLM
+            priorities (np.ndarray | None): приоритеты центральных чанков для упаковки контекста
+
+        Возвращаемое значение:
+            questions (list[dict]): вопросы без дубликатов
+            nearest (np.ndarray): номер ближайшего центрального чанка для каждого вопроса
+        '''
+
+        keep = find_unique_questions(query_embeddings, self.dedup_threshold)
+        duplicates_num = int(np.count_nonzero(~keep))
+        if duplicates_num:
+            print(f'Удалено похожих вопросов: {duplicates_num}')
+        questions = [question for question, kept in zip(questions, keep) if kept]
+        query_embeddings = query_embeddings[keep]
+        nearest = nearest[keep]
+
+        missing_num = questions_num - len(questions)
+        if missing_num <= 0:
+            return questions, nearest
+
+        # Догенерация только по кластерам, к которым ещё нет вопросов
+        uncovered = np.setdiff1d(np.arange(len(target_chunks)), nearest)
+        source = uncovered if len(uncovered) else np.arange(len(target_chunks))
+        print(f'Догенерация {missing_num} вопросов по {len(source)} непокрытым кластерам...')
+        context = self.__pack_context(llm, target_chunks[source], priorities[source] if priorities is not None else None)
+        extra = self.__get_questions(llm, context.text, missing_num, use_cache)
+        if not extra:
+            return questions, nearest
+
+        extra_embeddings, extra_nearest = self.__attach_explanations(extra, target_chunks, index)
+        keep = find_unique_questions(np.concatenate([query_embeddings, extra_embeddings]), self.dedup_threshold)
+        kept_extra = np.flatnonzero(keep[len(questions):])[:missing_num]
+        return questions + [extra[i] for i in kept_extra], np.concatenate([nearest, extra_nearest[kept_extra]])
+
+    def __response_cache_key(self, llm: str, text_content: str, questions_num: int) -> str:
+
+        '''
+        Вычисляет ключ кэша ответов для запроса к LLM
+
+        Параметры:
+            llm (str): LLM для генерация вопросов
+            text_content (str): Текст для генерации
+            questions_num (int): Количество вопросов
+
+        Возвращаемое значение (str): ключ кэша
+        '''
+
+        model = PROVIDERS[llm]['model'] if llm in PROVIDERS else ICEQ_MODEL_NAME
+        return self.response_cache.make_key(
+            llm,
+            text_content,
+            questions_num,
+            model=model,
+            prompts=self.__prompts_version
+        )
+
+    def __store_response(self, llm: str, key: str | None, response_text: str, questions: list[dict]) -> None:
+        # Пустые и неразобранные ответы не кэшируем, чтобы следующий запрос мог получить нормальный ответ
+        if key is not None and questions:
+            self.response_cache.put(llm, key, response_text, questions)
 
-    def __get_questions(self, llm: str, text_content: str, questions_num: int) -> list[dict]:
+    def __get_questions(
+            self,
+            llm: str,
+            text_content: str,
+            questions_num: int,
+            use_cache: bool = True
+    ) -> list[dict]:
 
         '''
         Отправляет запрос LLM и возвращает вопросы
@@ -403,26 +1057,27 @@ class QuestionsGenerator:
             llm (str): LLM для генерация вопросов
             text_content (str): Текст для генерации
             questions_num (int): Количество вопросов
+            use_cache (bool): Искать ответ в кэше и сохранять новый ответ
 
         Возвращаемое значение (list[dict]): извлечённые вопросы
         '''
 
+        key = None
+        if use_cache:
+            key = self.__response_cache_key(llm, text_content, questions_num)
+            cached = self.response_cache.get(llm, key)
+            if cached is not None:
+                print('Ответ LLM взят из кэша.')
+                return cached['questions']
+
         match llm:
             case 'deepseek':
                 print('Генерация вопросов с помощью Deepseek API...')
                 try:
-                    # Используем асинхронную функцию
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        response_text = loop.run_until_complete(
-                            generate_questions_deepseek(text_content, questions_num)
-                        )
-                    finally:
-                        loop.close()
+                    # Запрос выполняется в общем фоновом цикле событий клиента
+                    response_text = self.llm_client.generate('deepseek', text_content, questions_num)
                     
                     print('Ответ от DeepSeek API получен.')
-                    return parse_questions(response_text)
                 except Exception as e:
                     print(f'Ошибка при работе с DeepSeek API: {e}')
                     return []
@@ -430,327 +1085,905 @@ class QuestionsGenerator:
             case 'qwen':
                 print('Генерация вопросов с помощью Qwen API...')
                 try:
-                    # Используем асинхронную функцию
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        response_text = loop.run_until_complete(
-                            generate_questions_qwen(text_content, questions_num)
-                        )
-                    finally:
-                        loop.close()
-                    
-                    return parse_questions(response_text)
+                    response_text = self.llm_client.generate('qwen', text_content, questions_num)
                 except Exception as e:
                     print(f'Ошибка при работе с Qwen API: {e}')
                     return []
             
             case 'iceq':
                 print('Использование квантованной ICEQ Model...')
-                if self.iceq_model is None:
-                    raise ValueError("Модель ICEQ не загружена")
-                
-                user_prompt = self.__user_prompt_template \
-                    .replace(QUESTIONS_NUM_PROMPT_TAG, str(questions_num)) \
-                    .replace(CHUNKS_PROMPT_TAG, text_content)
-
-                prompt = self.__system_prompt + '\n' + user_prompt
-                messages = [
-                    {'role': 'user', 'content': prompt}
-                ]
-
-                # Использование Chat Template
-                text = self.iceq_model['tokenizer'].apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True
-                )
-                
-                # Определяем устройство модели
-                model_device = next(self.iceq_model['model'].parameters()).device
-                
-                model_inputs = self.iceq_model['tokenizer']([text], return_tensors='pt').to(model_device)
-
-                # Генерация вопросов
-                generated_ids = self.iceq_model['model'].generate(
-                    **model_inputs,
-                    max_new_tokens=32_000
-                )
-                generated_ids = [
-                    output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-                ]
-
-                response = self.iceq_model['tokenizer'].batch_decode(generated_ids, skip_special_tokens=True)[0]
+                # Запрос выполняется в общем батче с одновременными запросами других пользователей
+                response_text = self.__iceq_batcher.run((text_content, questions_num))
                 print('Ответ от ICEQ Model получен.')
 
-                return parse_questions(response)
+            case _:
+                self.check_llm(llm)
 
-    def __generate_iceq(self, text: str, num_questions: int) -> List[Dict]:
-        if not self.iceq_model:
-            return []
-        
-        tokenizer = self.iceq_model['tokenizer']
-        model = self.iceq_model['model']
-        
-        # Улучшенный промпт для более детальных вопросов
-        prompt = f"""Создай {num_questions} сложных вопроса с 4 вариантами ответов по тексту. 
-Каждый вопрос должен быть разного типа: на понимание фактов, на анализ причинно-следственных связей, 
-и на применение знаний.
+        questions = parse_questions(response_text)
+        self.__store_response(llm, key, response_text, questions)
+        return questions
 
-Текст:
-{text[:1500]} 
+    def __generate_shards(
+            self,
+            llm: str,
+            shards: list[tuple[str, int]],
+            use_cache: bool = True
+    ) -> list[list[dict]]:
 
-Формат ответа:
-1. Вопрос: [вопрос]
-Варианты: A) [вариант] B) [вариант] C) [вариант] D) [вариант]
-Ответ: [буква]
+        '''
+        Параллельно генерирует вопросы для нескольких групп чанков
 
-2. Вопрос: [вопрос]
-Варианты: A) [вариант] B) [вариант] C) [вариант] D) [вариант]
-Ответ: [буква]"""
+        Параметры:
+            llm (str): LLM для генерация вопросов
+            shards (list[tuple[str, int]]): пары (текст группы, количество вопросов)
+            use_cache (bool): Искать ответы в кэше и сохранять новые ответы
 
-        try:
-            inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
-            
-            # Отправляем на то же устройство, что и модель
-            device = next(model.parameters()).device
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            
-            # Улучшенные параметры генерации для 8-битного квантования
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    max_new_tokens=600,  # Увеличиваем для более подробных ответов
-                    do_sample=True,      # Включаем семплирование для более разнообразных ответов
-                    temperature=0.7,     # Умеренная температура
-                    top_p=0.9,           # Высокий top_p для большего разнообразия
-                    top_k=50,            # Умеренный top_k
-                    num_beams=2,         # Небольшое количество лучей для улучшения качества
-                    pad_token_id=tokenizer.eos_token_id,
-                    eos_token_id=tokenizer.eos_token_id,
-                    early_stopping=True
-                )
-            
-            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = generated_text[len(prompt):].strip()
-            
-            return self.__parse_iceq_response(response, num_questions)
-            
-        except Exception as e:
-            print(f"Ошибка при генерации с ICEQ: {e}")
-            return []
+        Возвращаемое значение (list[list[dict]]): вопросы каждой группы в порядке shards;
+            для группы, запрос которой завершился ошибкой, - пустой список
+        '''
 
-    def __parse_iceq_response(self, response: str, num_questions: int) -> List[Dict]:
-        """Парсит ответ от модели ICEQ в упрощенном формате"""
-        questions = []
+        questions: list[list[dict] | None] = [None] * len(shards)
+        keys: list[str | None] = [None] * len(shards)
+        if use_cache:
+            for i, (text_content, questions_num) in enumerate(shards):
+                keys[i] = self.__response_cache_key(llm, text_content, questions_num)
+                cached = self.response_cache.get(llm, keys[i])
+                if cached is not None:
+                    questions[i] = cached['questions']
+
+        # Запросы к LLM только для групп, которых нет в кэше
+        pending = [i for i in range(len(shards)) if questions[i] is None]
+        if len(pending) < len(shards):
+            print(f'Ответы для {len(shards) - len(pending)} из {len(shards)} групп взяты из кэша.')
+        pending_shards = [shards[i] for i in pending]
+
+        match llm:
+            case 'deepseek' | 'qwen':
+                responses = self.llm_client.generate_many(llm, pending_shards, self.fanout_concurrency) if pending else []
+
+            case 'iceq':
+                # Группы попадают в батчи ICEQ вместе с запросами других пользователей
+                futures = [self.__iceq_batcher.submit(shard) for shard in pending_shards]
+                responses = []
+                for future in futures:
+                    try:
+                        responses.append(future.result())
+                    except Exception as e:
+                        responses.append(e)
+
+            case _:
+                self.check_llm(llm)
+
+        for i, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                print(f'⚠️ Ошибка генерации для группы {i + 1}: {response}')
+                questions[i] = []
+            else:
+                questions[i] = parse_questions(response)
+                self.__store_response(llm, keys[i], response, questions[i])
+        return questions
+
+    def __get_questions_fanout(
+            self,
+            llm: str,
+            target_chunks: np.ndarray,
+            central_indices: np.ndarray,
+            questions_num: int,
+            use_cache: bool = True,
+            priorities: np.ndarray | None = None
+    ) -> list[dict]:
+
+        '''
+        Генерирует вопросы параллельными запросами по группам центральных чанков
+
+        Каждая группа получает долю вопросов, пропорциональную количеству
+        чанков в ней, и упаковывается в бюджет токенов отдельно. Группы,
+        вернувшие меньше вопросов, чем запрошено, догенерируются отдельным
+        запросом на недостающее количество.
+
+        Параметры:
+            llm (str): LLM для генерация вопросов
+            target_chunks (np.ndarray): центральные чанки
+            central_indices (np.ndarray): их индексы в тексте
+            questions_num (int): количество вопросов
+            use_cache (bool): использовать кэш ответов LLM
+            priorities (np.ndarray | None): приоритеты центральных чанков для упаковки контекста
+
+        Возвращаемое значение (list[dict]): вопросы в порядке групп
+        '''
+
+        # Группы - смежные участки документа: чанки упорядочиваются по позиции в тексте
+        order = np.argsort(central_indices)
+        ordered_chunks = target_chunks[order]
+        ordered_priorities = priorities[order] if priorities is not None else None
+        groups_num = min(self.fanout_groups, questions_num, len(ordered_chunks))
+        groups = np.array_split(np.arange(len(ordered_chunks)), groups_num)
+        group_texts = [
+            self.__pack_context(
+                llm,
+                ordered_chunks[group],
+                ordered_priorities[group] if ordered_priorities is not None else None
+            ).text
+            for group in groups
+        ]
+
+        # array_split делает первые группы на один чанк больше - им и достаются лишние вопросы
+        base_num, extra_num = divmod(questions_num, groups_num)
+        requested = [base_num + (1 if i < extra_num else 0) for i in range(groups_num)]
+
+        print(f'Параллельная генерация: {groups_num} групп, до {self.fanout_concurrency} запросов одновременно...')
+        questions = self.__generate_shards(llm, list(zip(group_texts, requested)), use_cache)
+
+        for attempt in range(FANOUT_MAX_RETRIES):
+            missing = [
+                (i, requested[i] - len(questions[i]))
+                for i in range(groups_num)
+                if len(questions[i]) < requested[i]
+            ]
+            if not missing:
+                break
+
+            print(f'Догенерация вопросов для {len(missing)} групп (попытка {attempt + 1})...')
+            extra = self.__generate_shards(llm, [(group_texts[i], count) for i, count in missing], use_cache)
+            for (i, count), extra_questions in zip(missing, extra):
+                questions[i].extend(extra_questions[:count])
+
+        # Лишние вопросы групп восполняют нехватку в других группах
+        merged, surplus = [], []
+        for count, group_questions in zip(requested, questions):
+            merged.extend(group_questions[:count])
+            surplus.extend(group_questions[count:])
+        merged.extend(surplus[:questions_num - len(merged)])
+
+        print(f'Получено {len(merged)} вопросов из {groups_num} групп.')
+        return merged
+
+    def __render_iceq_prompt(self, tokenizer, text_content: str, questions_num: int) -> str:
+
+        '''
+        Собирает текст основного промпта ICEQ по шаблону чата
+
+        Параметры:
+            tokenizer: токенизатор ICEQ
+            text_content (str): Текст для генерации
+            questions_num (int): Количество вопросов
+
+        Возвращаемое значение (str): промпт с шаблоном чата
+        '''
+
+        user_prompt = self.__user_prompt_template \
+            .replace(QUESTIONS_NUM_PROMPT_TAG, str(questions_num)) \
+            .replace(CHUNKS_PROMPT_TAG, text_content)
+
+        prompt = self.__system_prompt + '\n' + user_prompt
+        messages = [
+            {'role': 'user', 'content': prompt}
+        ]
+
+        # Использование Chat Template
+        return tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def __build_iceq_inputs(self, iceq_model: dict, shards: list[tuple[str, int]]):
+
+        '''
+        Готовит входы модели ICEQ по основному промпту
+
+        Промпты выравниваются паддингом слева, поэтому генерация всех
+        элементов батча начинается с одной позиции.
+
+        Параметры:
+            iceq_model (dict): токенизатор и модель ICEQ
+            shards (list[tuple[str, int]]): пары (текст для генерации, количество вопросов)
+
+        Возвращаемое значение (BatchEncoding): токенизированные промпты на устройстве модели
+        '''
+
+        tokenizer = iceq_model['tokenizer']
+        texts = [self.__render_iceq_prompt(tokenizer, text_content, questions_num) for text_content, questions_num in shards]
+
+        tokenizer.padding_side = 'left'
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
         
-        # Ищем паттерны вопросов
-        question_pattern = r'(\d+)\.\s*Вопрос:\s*(.+?)(?=\d+\.\s*Вопрос:|$)'
-        matches = re.findall(question_pattern, response, re.DOTALL | re.IGNORECASE)
+        # Определяем устройство модели
+        model_device = next(iceq_model['model'].parameters()).device
         
-        for match in matches:
-            question_num, question_block = match
-            
-            # Извлекаем текст вопроса
-            lines = question_block.strip().split('\n')
-            question_text = lines[0].strip()
-            
-            # Ищем варианты ответов
-            answers = []
-            correct_answer = None
+        return tokenizer(texts, return_tensors='pt', padding=True).to(model_device)
+
+    def __get_iceq_prefix_cache(self, iceq_model: dict) -> PromptPrefixCache | None:
+
+        '''
+        KV-кэш общего префикса основного промпта для загруженной модели ICEQ
+
+        Кэш хранится вместе с моделью в реестре: считается при первом запросе
+        и освобождается при выгрузке модели.
+
+        Параметры:
+            iceq_model (dict): токенизатор и модель ICEQ
+
+        Возвращаемое значение (PromptPrefixCache | None): кэш или None, если он
+            отключён или не поддерживается моделью
+        '''
+
+        if not self.iceq_prefix_cache:
+            return None
+
+        with self.__prefix_cache_lock:
+            if 'prefix_cache' not in iceq_model:
+                tokenizer = iceq_model['tokenizer']
+                try:
+                    # Промпты с разными значениями расходятся сразу после общей части шаблона
+                    prefix_ids = shared_prefix_ids(tokenizer, [
+                        self.__render_iceq_prompt(tokenizer, 'А', 1),
+                        self.__render_iceq_prompt(tokenizer, 'Б', 2)
+                    ])
+                    prefix_cache = PromptPrefixCache(iceq_model['model'], prefix_ids)
+                    print(f'KV-кэш префикса промпта ICEQ: {prefix_cache.tokens} токенов, '
+                          f'prefill {prefix_cache.prefill_ms:.0f} мс')
+                except Exception as e:
+                    print(f'⚠️ KV-кэш префикса промпта ICEQ недоступен: {e}')
+                    prefix_cache = None
+                iceq_model['prefix_cache'] = prefix_cache
+            return iceq_model['prefix_cache']
+
+    def __prepare_iceq_generation(self, iceq_model: dict, shards: list[tuple[str, int]]) -> dict:
+
+        '''
+        Готовит аргументы generate для батча запросов по основному промпту
+
+        Если токены всех промптов начинаются с общего префикса, генерация
+        начинается от копии его KV-кэша и prefill выполняется только для
+        индивидуальной части. Иначе - обычные входы с паддингом слева.
+
+        Параметры:
+            iceq_model (dict): токенизатор и модель ICEQ
+            shards (list[tuple[str, int]]): пары (текст для генерации, количество вопросов)
+
+        Возвращаемое значение (dict): input_ids, attention_mask и, при попадании
+            в кэш префикса, past_key_values
+        '''
+
+        tokenizer = iceq_model['tokenizer']
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        prefix_cache = self.__get_iceq_prefix_cache(iceq_model)
+        if prefix_cache is not None:
+            texts = [self.__render_iceq_prompt(tokenizer, text_content, questions_num) for text_content, questions_num in shards]
+            suffixes = [prefix_cache.split(input_ids) for input_ids in tokenizer(texts)['input_ids']]
+            if all(suffix is not None for suffix in suffixes):
+                prefix_cache.record(hits=len(shards))
+                PREFIX_CACHE_REQUESTS.inc(len(shards), result='hit')
+                PREFIX_CACHE_SAVED_TOKENS.inc(prefix_cache.tokens * len(shards))
+                print(f'Префикс промпта ICEQ из KV-кэша: {prefix_cache.tokens} токенов prefill на запрос '
+                      f'(~{prefix_cache.prefill_ms:.0f} мс) не вычисляются')
+                inputs = prefix_cache.build_inputs(suffixes, tokenizer.pad_token_id)
+                return {**inputs, 'past_key_values': prefix_cache.copy(len(shards))}
+
+            prefix_cache.record(misses=len(shards))
+            PREFIX_CACHE_REQUESTS.inc(len(shards), result='miss')
+
+        return dict(self.__build_iceq_inputs(iceq_model, shards))
+
+    def __observe_iceq_batch(self, run_batch: Callable[[list], list[str]], items: list) -> list[str]:
+
+        '''
+        Выполняет батч ICEQ и записывает его длительность и ошибки в метрики
+
+        Параметры:
+            run_batch (Callable): функция батча (основной или упрощённый промпт)
+            items (list): запросы батча
+
+        Возвращаемое значение (list[str]): ответы модели
+        '''
+
+        start = time.perf_counter()
+        try:
+            responses = run_batch(items)
+        except Exception:
+            LLM_ERRORS.inc(len(items), llm='iceq')
+            raise
+
+        # Каждый запрос батча ждал ответа всё время генерации
+        elapsed = time.perf_counter() - start
+        for _ in items:
+            LLM_REQUEST_SECONDS.observe(elapsed, llm='iceq')
+        return responses
+
+    def __run_iceq_requests(self, shards: list[tuple[str, int]]) -> list[str]:
+
+        '''
+        Выполняет батч запросов к ICEQ по основному промпту (вызывается батчером)
+
+        Параметры:
+            shards (list[tuple[str, int]]): пары (текст для генерации, количество вопросов)
+
+        Возвращаемое значение (list[str]): сырые ответы модели в порядке shards
+        '''
+
+        with self.models.use(ICEQ_MODEL_KEY) as iceq_model:
+            if iceq_model is None:
+                raise ValueError("Модель ICEQ не загружена")
+
+            if len(shards) > 1:
+                print(f'Батч ICEQ из {len(shards)} запросов')
+            return self.__run_iceq_batch(iceq_model, shards)
+
+    def __run_iceq_batch(self, iceq_model: dict, shards: list[tuple[str, int]]) -> list[str]:
+
+        '''
+        Генерирует ответы локальной модели ICEQ одним батчем
+
+        Параметры:
+            iceq_model (dict): токенизатор и модель ICEQ
+            shards (list[tuple[str, int]]): пары (текст для генерации, количество вопросов)
+
+        Возвращаемое значение (list[str]): сырые ответы модели в порядке shards
+        '''
+
+        tokenizer = iceq_model['tokenizer']
+
+        # Prompt lookup decoding работает только для батча из одного запроса
+        if self.iceq_prompt_lookup_tokens and len(shards) > 1:
+            return [response for shard in shards for response in self.__run_iceq_batch(iceq_model, [shard])]
+
+        model_inputs = self.__prepare_iceq_generation(iceq_model, shards)
+        # После паддинга все промпты имеют одинаковую длину
+        prompt_length = model_inputs['input_ids'].shape[1]
+        criteria = self.__iceq_stopping_criteria('main', tokenizer, prompt_length, shards)
+        max_new_tokens = max(criteria.token_limits)
+        counter = DecodingCounter(max_new_tokens=max_new_tokens)
+
+        # Генерация вопросов
+        start = time.perf_counter()
+        generated_ids = iceq_model['model'].generate(
+            **model_inputs,
+            **self.__iceq_decoding_kwargs(counter),
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=[criteria],
+            pad_token_id=tokenizer.pad_token_id
+        )
+        self.__record_prompt_lookup(counter, time.perf_counter() - start)
+        self.__record_iceq_stops('main', criteria)
+        # Prompt lookup decoding может выйти за max_new_tokens на последнем шаге
+        generated_ids = generated_ids[:, prompt_length:prompt_length + max_new_tokens]
+
+        return tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+
+    def __iceq_stopping_criteria(
+            self,
+            prompt: str,
+            tokenizer,
+            prompt_length: int,
+            items: list[tuple[str, int]]
+    ) -> QuestionsStoppingCriteria:
+
+        '''
+        Критерий остановки ICEQ по количеству вопросов с лимитами токенов запросов
+
+        Параметры:
+            prompt (str): промпт ('main' - основной, 'short' - упрощённый)
+            tokenizer: токенизатор ICEQ
+            prompt_length (int): длина промптов батча в токенах
+            items (list[tuple[str, int]]): пары (текст, количество вопросов)
+
+        Возвращаемое значение (QuestionsStoppingCriteria): критерий для generate
+        '''
+
+        budget = self.__iceq_token_budgets[prompt]
+        questions_nums = [questions_num for _, questions_num in items]
+        limits = [budget.limit(questions_num, ICEQ_MAX_NEW_TOKENS) for questions_num in questions_nums]
+        return QuestionsStoppingCriteria(tokenizer, prompt_length, questions_nums, limits)
+
+    def __record_iceq_stops(self, prompt: str, criteria: QuestionsStoppingCriteria) -> None:
+
+        '''
+        Записывает причину остановки каждого запроса и длину ответа в токенах
+
+        Параметры:
+            prompt (str): промпт ('main' или 'short')
+            criteria (QuestionsStoppingCriteria): критерий после generate
+        '''
+
+        budget = self.__iceq_token_budgets[prompt]
+        for i, questions_num in enumerate(criteria.questions_nums):
+            reason = criteria.stop_reason(i)
+            budget.record(criteria.tokens[i], criteria.questions[i], reason)
+            print(f'ICEQ: остановка ({reason}) - {criteria.tokens[i]} токенов, '
+                  f'вопросов {criteria.questions[i]} из {questions_num}, лимит {criteria.token_limits[i]} токенов')
+
+    def __iceq_decoding_kwargs(self, counter: DecodingCounter) -> dict:
+
+        '''
+        Параметры декодирования generate для основного промпта ICEQ
+
+        Параметры:
+            counter (DecodingCounter): счётчик токенов и проходов модели
+                (streamer; может оборачивать streamer потоковой генерации)
+
+        Возвращаемое значение (dict): параметры prompt lookup decoding и streamer
+            или пустой словарь при обычном декодировании
+        '''
+
+        if not self.iceq_prompt_lookup_tokens:
+            return {'streamer': counter.streamer} if counter.streamer is not None else {}
+        return {
+            **prompt_lookup_kwargs(self.iceq_prompt_lookup_tokens, ICEQ_PROMPT_LOOKUP_NGRAM),
+            'streamer': counter
+        }
+
+    def __record_prompt_lookup(self, counter: DecodingCounter, seconds: float) -> None:
+
+        '''
+        Записывает статистику генерации с prompt lookup decoding
+
+        Параметры:
+            counter (DecodingCounter): счётчик токенов и проходов модели
+            seconds (float): длительность generate
+        '''
+
+        if not self.iceq_prompt_lookup_tokens or not counter.steps:
+            return
+        self.__prompt_lookup_stats.record(counter, seconds)
+        print(f'Prompt lookup decoding: {counter.tokens} токенов за {counter.steps} проходов модели '
+              f'({counter.tokens / counter.steps:.2f} токена на проход, {counter.tokens / seconds:.1f} токенов/с)')
+
+    def __stream_iceq(self, text_content: str, questions_num: int) -> Iterator[str]:
+
+        '''
+        Генерирует ответ модели ICEQ по частям
+
+        generate() выполняется в отдельном потоке, а декодированные токены
+        забираются из TextIteratorStreamer по мере генерации. Модель
+        закреплена в реестре до окончания генерации. Ошибка generate
+        пробрасывается читателю, а при закрытии итератора (клиент отключился)
+        generate останавливается на следующем шаге.
+
+        Параметры:
+            text_content (str): Текст для генерации
+            questions_num (int): Количество вопросов
+
+        Возвращаемое значение (Iterator[str]): части ответа модели
+        '''
+
+        from transformers import TextIteratorStreamer
+
+        with self.models.use(ICEQ_MODEL_KEY) as iceq_model:
+            if iceq_model is None:
+                raise ValueError("Модель ICEQ не загружена")
+
+            model_inputs = self.__prepare_iceq_generation(iceq_model, [(text_content, questions_num)])
+            criteria = self.__iceq_stopping_criteria(
+                'main',
+                iceq_model['tokenizer'],
+                model_inputs['input_ids'].shape[1],
+                [(text_content, questions_num)]
+            )
+            max_new_tokens = criteria.token_limits[0]
+            streamer = TextIteratorStreamer(
+                iceq_model['tokenizer'],
+                skip_prompt=True,
+                skip_special_tokens=True,
+                timeout=ICEQ_STREAM_TIMEOUT
+            )
+            counter = DecodingCounter(streamer, max_new_tokens=max_new_tokens)
+            cancelled = threading.Event()
+            errors = []
+
+            def stop_on_cancel(input_ids, scores=None, **kwargs):
+                # Критерий остановки generate: клиент отключился или чтение прервано
+                import torch
+
+                return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+            def run_generation():
+                # Ошибка generate передаётся читателю стримера, а стример
+                # завершается в любом случае - иначе чтение ждало бы вечно
+                try:
+                    iceq_model['model'].generate(
+                        **model_inputs,
+                        **self.__iceq_decoding_kwargs(counter),
+                        max_new_tokens=max_new_tokens,
+                        stopping_criteria=[criteria, stop_on_cancel]
+                    )
+                except BaseException as e:
+                    errors.append(e)
+                finally:
+                    streamer.end()
+
+            generation_thread = threading.Thread(target=run_generation, daemon=True)
+            start = time.perf_counter()
+            generation_thread.start()
+            try:
+                first_delta = True
+                for delta in streamer:
+                    if delta:
+                        if first_delta:
+                            LLM_TTFT_SECONDS.observe(time.perf_counter() - start, llm='iceq')
+                            first_delta = False
+                        yield delta
+                if errors:
+                    raise errors[0]
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, llm='iceq')
+            except BaseException:
+                # Клиент отключился (GeneratorExit), истёк таймаут или generate упал -
+                # останавливаем generate на следующем шаге, а не по лимиту токенов
+                cancelled.set()
+                raise
+            finally:
+                generation_thread.join()
+            self.__record_prompt_lookup(counter, time.perf_counter() - start)
+            self.__record_iceq_stops('main', criteria)
+
+    def __stream_llm(self, llm: str, text_content: str, questions_num: int) -> Iterator[str]:
+
+        '''
+        Отправляет запрос LLM и возвращает ответ по частям
+
+        Параметры:
+            llm (str): LLM для генерация вопросов
+            text_content (str): Текст для генерации
+            questions_num (int): Количество вопросов
+
+        Возвращаемое значение (Iterator[str]): части ответа модели
+        '''
+
+        match llm:
+            case 'deepseek' | 'qwen':
+                yield from self.llm_client.stream(llm, text_content, questions_num)
+
+            case 'iceq':
+                yield from self.__stream_iceq(text_content, questions_num)
+
+            case _:
+                self.check_llm(llm)
+
+    def __generate_iceq(self, text: str, num_questions: int) -> List[Dict]:
+        """Упрощённая генерация ICEQ для коротких текстов"""
+        try:
+            response = self.__iceq_short_batcher.run((text, num_questions))
+        except Exception as e:
+            print(f"Ошибка при генерации с ICEQ: {e}")
+            return []
+
+        return self.__parse_iceq_response(response, num_questions)
+
+    def __run_iceq_short_requests(self, items: list[tuple[str, int]]) -> list[str]:
+        """
+        Генерирует ответы ICEQ по упрощённому промпту одним батчем (вызывается батчером)
+        
+        Args:
+            items (list[tuple[str, int]]): пары (текст, количество вопросов)
+        
+        Returns:
+            list[str]: ответы модели в порядке items
+        """
+        with self.models.use(ICEQ_MODEL_KEY) as iceq_model:
+            if not iceq_model:
+                raise ValueError("Модель ICEQ не загружена")
+
+            tokenizer = iceq_model['tokenizer']
+            model = iceq_model['model']
+        
+            # Улучшенный промпт для более детальных вопросов
+            prompts = [
+                f"""Создай {num_questions} сложных вопроса с 4 вариантами ответов по тексту. 
+Каждый вопрос должен быть разного типа: на понимание фактов, на анализ причинно-следственных связей, 
+и на применение знаний.
+
+Текст:
+{text} 
+
+Формат ответа:
+1. Вопрос: [вопрос]
+Варианты: A) [вариант] B) [вариант] C) [вариант] D) [вариант]
+Ответ: [буква]
+
+2. Вопрос: [вопрос]
+Варианты: A) [вариант] B) [вариант] C) [вариант] D) [вариант]
+Ответ: [буква]"""
+                for text, num_questions in items
+            ]
+
+            import torch
+
+            # Паддинг слева: ответы всех промптов начинаются с одной позиции
+            tokenizer.padding_side = 'left'
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=1024)
             
-            for line in lines[1:]:
-                line = line.strip()
-                
-                # Варианты A), B), C), D)
-                variant_match = re.match(r'([ABCD])\)\s*(.+)', line)
-                if variant_match:
-                    letter, text = variant_match.groups()
-                    answers.append({
-                        'answer': text.strip(),
-                        'is_correct': False,
-                        'letter': letter
-                    })
-                
-                # Правильный ответ
-                answer_match = re.match(r'Ответ:\s*([ABCD])', line)
-                if answer_match:
-                    correct_answer = answer_match.group(1)
+            # Отправляем на то же устройство, что и модель
+            device = next(model.parameters()).device
+            inputs = {k: v.to(device) for k, v in inputs.items()}
             
-            # Отмечаем правильный ответ
-            if correct_answer and answers:
-                for answer in answers:
-                    if answer['letter'] == correct_answer:
-                        answer['is_correct'] = True
-                        break
-                
-                # Удаляем служебное поле letter
-                for answer in answers:
-                    del answer['letter']
-                
-                questions.append({
-                    'question': question_text,
-                    'answers': answers
-                })
+            # Генерация останавливается, как только готово нужное количество вопросов
+            criteria = self.__iceq_stopping_criteria('short', tokenizer, inputs['input_ids'].shape[1], items)
+
+            # Улучшенные параметры генерации для 8-битного квантования
+            with torch.no_grad():
+                outputs = model.generate(
+                    **inputs,
+                    max_new_tokens=max(criteria.token_limits),
+                    stopping_criteria=[criteria],
+                    do_sample=True,      # Включаем семплирование для более разнообразных ответов
+                    temperature=0.7,     # Умеренная температура
+                    top_p=0.9,           # Высокий top_p для большего разнообразия
+                    top_k=50,            # Умеренный top_k
+                    num_beams=2,         # Небольшое количество лучей для улучшения качества
+                    pad_token_id=tokenizer.pad_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                    early_stopping=True
+                )
+            self.__record_iceq_stops('short', criteria)
             
-            if len(questions) >= num_questions:
-                break
-        
-        return questions
+            # Отрезаем промпт по токенам (после паддинга слева длина промптов одинакова)
+            outputs = outputs[:, inputs['input_ids'].shape[1]:]
+            return [response.strip() for response in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+
+    def __parse_iceq_response(self, response: str, num_questions: int) -> List[Dict]:
+        """Парсит ответ от модели ICEQ в упрощенном формате"""
+        return parse_questions(response)[:num_questions]
+
+    def __reuse_document_questions(
+            self,
+            previous: DocumentVersion,
+            central_hashes: list[str],
+            priorities: np.ndarray,
+            questions_num: int
+    ) -> tuple[list[dict], np.ndarray]:
+
+        '''
+        Берёт из предыдущей версии документа вопросы кластеров с неизменным центральным чанком
+
+        Параметры:
+            previous (DocumentVersion): предыдущая версия документа
+            central_hashes (list[str]): хэши центральных чанков новой версии
+            priorities (np.ndarray): приоритеты центральных чанков
+            questions_num (int): количество вопросов
+
+        Возвращаемое значение:
+            reused (list[dict]): не больше questions_num вопросов в прежнем порядке;
+                при избытке остаются вопросы приоритетных кластеров
+            changed (np.ndarray): номера кластеров с новым центральным чанком
+        '''
+
+        previous_centers = set(previous.central_hashes)
+        unchanged = np.fromiter((h in previous_centers for h in central_hashes), dtype=bool, count=len(central_hashes))
+        changed = np.flatnonzero(~unchanged)
+        self.document_versions.record('clusters', reused=int(unchanged.sum()), recomputed=len(changed))
+
+        # Приоритет кластера по хэшу центрального чанка (одинаковые чанки разных кластеров - один кластер)
+        priority = {}
+        for central_hash, cluster_priority in zip(central_hashes, priorities):
+            priority[central_hash] = max(priority.get(central_hash, -np.inf), cluster_priority)
+        positions = [i for i, center in enumerate(previous.question_centers) if center in priority]
+        if len(positions) > questions_num:
+            positions = sorted(sorted(positions, key=lambda i: -priority[previous.question_centers[i]])[:questions_num])
+
+        print(f'Кластеров с неизменным центральным чанком: {int(unchanged.sum())} из {len(central_hashes)}, '
+              f'вопросов из предыдущей версии: {len(positions)}')
+        return [previous.questions[i] for i in positions], changed
+
+    def __save_document_version(
+            self,
+            document_id: str,
+            llm: str,
+            chunk_hashes: list[str],
+            clustering_embeddings: np.ndarray,
+            centroids: np.ndarray,
+            central_hashes: list[str],
+            questions: list[dict],
+            nearest: np.ndarray | None
+    ) -> None:
+
+        '''
+        Сохраняет состояние генерации как последнюю версию документа
+
+        Параметры:
+            document_id (str): идентификатор документа
+            llm (str): LLM генерации
+            chunk_hashes (list[str]): хэши чанков
+            clustering_embeddings (np.ndarray): эмбеддинги кластеризации чанков
+            centroids (np.ndarray): центроиды кластеров
+            central_hashes (list[str]): хэши центральных чанков
+            questions (list[dict]): итоговые вопросы
+            nearest (np.ndarray | None): ближайший центральный чанк для каждого вопроса
+                (None - объяснения не найдены, вопросы не привязаны к кластерам и не сохраняются)
+        '''
+
+        if nearest is None:
+            questions = []
+        try:
+            self.document_versions.put(document_id, DocumentVersion(
+                chunk_hashes=chunk_hashes,
+                embeddings=np.asarray(clustering_embeddings, dtype=np.float32),
+                centroids=np.asarray(centroids, dtype=np.float32),
+                central_hashes=central_hashes,
+                questions=questions,
+                question_centers=[central_hashes[i] for i in nearest] if questions else [],
+                llm=llm,
+                prompts=self.__prompts_version,
+                encoder=self.__encoder_id(CLUSTERING_MODEL_NAME)
+            ))
+        except Exception as e:
+            print(f'⚠️ Не удалось сохранить версию документа: {e}')
 
     def generate(
             self, 
-            text: str, 
+            text: TextSource, 
             questions_num: int,
-            llm: Literal['deepseek', 'qwen', 'iceq'] = 'iceq'
+            llm: Literal['deepseek', 'qwen', 'iceq'] = 'iceq',
+            progress_callback: Callable[[str, float], None] | None = None,
+            use_cache: bool = True,
+            document_id: str | None = None
     ) -> list[dict]:
 
         '''
         Генерирует и возвращает вопросы по тексту
 
         Параметры:
-            text (str): текст, по которому надо задать вопросы
+            text (str | os.PathLike | bytes | mmap.mmap | ChunkedText):
+                текст, по которому надо задать вопросы, путь к текстовому файлу
+                (UTF-8, отображается в память, а не читается целиком) или байтовый буфер
             questions_num (int): количество вопросов
             llm (Literal['deepseek', 'qwen', 'iceq']), optional:
                 языковая модель, используемая для генерации вопросов
                     - deepseek: использование DeepSeek API
                     - qwen: использование Qwen API
                     - iceq: использование локальной предобученной модели
+            progress_callback (Callable[[str, float], None]), optional:
+                вызывается при переходе к новой стадии с её названием
+                (см. GENERATION_STAGES) и долей выполнения от 0 до 1
+            use_cache (bool), optional:
+                использовать кэш ответов LLM (False - всегда запрашивать модель заново)
+            document_id (str | None), optional:
+                идентификатор документа для инкрементальной перегенерации после правки:
+                чанки сравниваются по хэшам с прошлой генерацией этого документа и
+                кодируются только изменённые, кластеризация начинается с прошлых
+                центроидов, вопросы кластеров с неизменным центральным чанком берутся
+                из прошлой генерации (с той же LLM и use_cache), а LLM генерирует
+                только недостающие по изменённым кластерам
 
         Возвращаемое значение:
             questions (list[dict]): список вопросов
         '''
 
-        if llm == 'deepseek' and self.deepseek_client is None:
-            self.deepseek_client = self.__init_deepseek()
-        
-        if llm == 'iceq' and self.iceq_model is None:
-            self.iceq_model = self.__init_iceq()
-            if self.iceq_model is None:
-                raise ValueError("Не удалось загрузить модель ICEQ. Попробуйте использовать 'deepseek' или 'qwen' вместо 'iceq'.")
+        self.__prepare_llm(llm)
+        stage_timer = StageTimer(llm=llm)
+
+        def report_progress(stage: str) -> None:
+            if stage == 'done':
+                stage_timer.finish()
+            else:
+                stage_timer.enter(stage)
+            if progress_callback is not None:
+                progress_callback(stage, GENERATION_STAGES[stage])
+
+        # Предыдущая версия документа (идентификатор проверяется до начала работы)
+        previous = self.document_versions.get(document_id) if document_id is not None else None
+        if previous is not None and previous.encoder != self.__encoder_id(CLUSTERING_MODEL_NAME):
+            # Эмбеддинги другого энкодера (модели или бэкенда) несовместимы с новыми
+            print(f'Документ {document_id}: предыдущая версия получена другим энкодером ({previous.encoder}), '
+                  f'пересчитывается целиком.')
+            previous = None
 
         print(f'Начало генерации {questions_num} вопросов...')
-        
-        # Простая проверка: разделяем текст на параграфы и смотрим, хватит ли для вопросов
-        initial_chunks = text.split('\n\n')  # Разделяем по двойным переносам (параграфы)
-        initial_chunks = [chunk.strip() for chunk in initial_chunks if chunk.strip()]
-        
-        # Проверяем, что есть достаточно смысловых блоков для генерации вопросов
-        if len(initial_chunks) < questions_num:
-            # Пробуем разделить по одинарным переносам
-            backup_chunks = text.split('\n')
-            backup_chunks = [chunk.strip() for chunk in backup_chunks if chunk.strip() and len(chunk.split()) > 5]
-            
-            if len(backup_chunks) < questions_num:
-                raise ValueError(
-                    f"Недостаточно информационных блоков в тексте для генерации {questions_num} вопросов. "
-                    f"Найдено {len(backup_chunks)} блоков. Попробуйте уменьшить количество вопросов до {len(backup_chunks)} "
-                    f"или добавить больше структурированного текста."
-                )
+        report_progress('chunking')
+        # Один проход по тексту: смещения строк и вся статистика для последующих стадий
+        chunked = chunk_source(text)
+        self.__check_text_sufficiency(chunked, questions_num)
         
         # Запускаем таймер
-        import time
         start_time = time.time()
-        
-        # Получаем оценку времени
-        time_estimate = self.estimate_generation_time(text, questions_num, llm)
+        # Ответы из кэша LLM не отражают реальное время генерации и не записываются в замеры
+        cache_hits_before = self.__response_cache_hits(llm)
 
         # Разделение текста на чанки и фильтрация
-        chunks = text.split('\n')
-        # Вычисляем среднюю длину чанка для определения минимального порога
-        mean_chunk_len = np.array([len(chunk) for chunk in chunks]).mean()
-        min_words_in_chunk = mean_chunk_len * 0.15
-
-        # Фильтруем слишком короткие чанки
-        chunks = list(filter(lambda chunk: self.__filter_chunks(chunk, min_words_in_chunk), chunks))
-        chunks = np.array(chunks)
-        print(f'Получено {len(chunks)} чанков после фильтрации.')
+        chunks = self.__split_chunks(chunked)
+        REQUEST_ITEMS.observe(len(chunks), kind='chunks')
 
-        # Если чанков слишком мало, используем упрощенную генерацию
+        # Получаем оценку времени
+        time_estimate = self.estimate_generation_time(chunked, questions_num, llm)
+
+        # Инкрементальная перегенерация документа (см. document_id): хэши чанков, их номера
+        # в предыдущей версии, маска изменённых чанков и вопросы из предыдущей версии
+        chunk_hashes, positions, changed = None, None, None
+        reused = []
+
+        # Исходный текст нужен только упрощённой генерации, после неё файл больше не читается
+        source_text = chunked.text() if len(chunks) < MIN_CLUSTERS_NUM else None
+        if not isinstance(text, ChunkedText):
+            chunked.close()
+
+        # Если чанков слишком мало, используем упрощенную генерацию по всему тексту
         if len(chunks) < MIN_CLUSTERS_NUM:
             print(f'Чанков слишком мало ({len(chunks)}), используем упрощенную генерацию...')
-            # Используем оптимизированный метод для ICEQ
+            report_progress('generation')
+            clustering_embeddings = None
+            # Объяснения ищутся среди всех чанков
+            central_indices = np.arange(len(chunks))
+            priorities = None
+            target_chunks = chunks
+            if document_id is not None:
+                print('Версия документа не сохраняется: упрощённая генерация не кластеризует чанки.')
             if llm == 'iceq':
-                questions = self.__generate_iceq(text, questions_num)
+                # Упрощённый промпт для ICEQ с меньшим бюджетом текста
+                context = self.__pack_context(llm, [source_text], budget=ICEQ_SHORT_CONTEXT_TOKENS)
+                questions = self.__generate_iceq(context.text, questions_num)
             else:
-                # Для других LLM используем весь текст с ограничением длины
-                prompt = self.__user_prompt_template \
-                    .replace(QUESTIONS_NUM_PROMPT_TAG, str(questions_num)) \
-                    .replace(CHUNKS_PROMPT_TAG, text[:2000])  # Ограничиваем длину
-                return self.__get_questions(llm, prompt)
-
-        # Вычисление эмбеддингов для кластеризации чанков
-        print('Вычисление эмбеддингов для кластеризации...')
-        clustering_embeddings = self.__clustering_model.encode(
-            chunks,
-            convert_to_tensor=True,
-            normalize_embeddings=True,
-            device=self.device
-        ).cpu().numpy()
-        print('Эмбеддинги для кластеризации вычислены.')
-
-        # Определение оптимального количества кластеров
-        paragraph_num = len(text.split('\n'))
-        clusters_num = min(
-            MAX_CLUSTERS_NUM,
-            max(MIN_CLUSTERS_NUM, int(paragraph_num * DATA_PART))
-        )
-        print(f'Количество кластеров: {clusters_num}')
-
-        # Выполнение K-means кластеризации
-        print('Запуск K-means кластеризации...')
-        kmeans = KMeans(n_clusters=clusters_num, random_state=42)
-        kmeans.fit(clustering_embeddings)
-        print('Кластеризация завершена.')
-
-        # Поиск центральных объектов в каждом кластере
-        target_chunks = self.__get_central_objects(kmeans, clustering_embeddings, chunks)
-        print('Передача чанков для генерации...')
-        
-        # Объединяем отобранные чанки для генерации
-        text_for_generation = '\n\n'.join(target_chunks)
-        questions = self.__get_questions(llm, text_for_generation, questions_num)
+                context = self.__pack_context(llm, [source_text])
+                questions = self.__get_questions(llm, context.text, questions_num, use_cache)
+        else:
+            # Вычисление эмбеддингов для кластеризации чанков
+            report_progress('embedding')
+            if document_id is not None:
+                chunk_hashes = [chunk_hash(chunk) for chunk in chunks]
+            if previous is not None:
+                positions = match_chunks(previous.chunk_hashes, chunk_hashes)
+                changed = positions < 0
+                print(f'Документ {document_id}: изменено {int(changed.sum())} из {len(chunks)} чанков.')
+                self.document_versions.record('chunks', reused=int((~changed).sum()), recomputed=int(changed.sum()))
+            clustering_embeddings = self.__get_clustering_embeddings(chunks, previous, positions)
+
+            # Кластеризация и поиск центральных объектов в каждом кластере
+            report_progress('clustering')
+            central_indices, priorities, centroids = self.__cluster_chunks(
+                chunked.lines_num, clustering_embeddings, previous, changed
+            )
+            target_chunks = chunks[central_indices]
+            REQUEST_ITEMS.observe(len(central_indices), kind='clusters')
+
+            report_progress('generation')
+            # Кластеры, для которых нужны новые вопросы (по умолчанию - все)
+            pending = np.arange(len(target_chunks))
+            if previous is not None and use_cache and (previous.llm, previous.prompts) == (llm, self.__prompts_version):
+                reused, changed_clusters = self.__reuse_document_questions(
+                    previous, [chunk_hashes[i] for i in central_indices], priorities, questions_num
+                )
+                if len(changed_clusters):
+                    pending = changed_clusters
+
+            missing_num = questions_num - len(reused)
+            if missing_num <= 0:
+                print('Все вопросы взяты из предыдущей версии документа, запрос к LLM пропущен.')
+                questions = []
+            elif self.fanout_groups > 1:
+                print('Передача чанков для генерации...')
+                questions = self.__get_questions_fanout(
+                    llm, target_chunks[pending], central_indices[pending], missing_num, use_cache, priorities[pending]
+                )
+            else:
+                print('Передача чанков для генерации...')
+                # Центральные чанки в бюджете токенов: сначала большие кластеры
+                context = self.__pack_context(llm, target_chunks[pending], priorities[pending])
+                questions = self.__get_questions(llm, context.text, missing_num, use_cache)
+            if previous is not None:
+                self.document_versions.record('questions', reused=len(reused), recomputed=len(questions))
+            questions = reused + questions
 
         # Если вопросы не были сгенерированы, возвращаем пустой список
         if not questions:
             print('Вопросы не были сгенерированы.')
+            stage_timer.finish()
+            GENERATIONS.inc(llm=llm, status='empty')
             return []
 
+        report_progress('explanations')
+        query_embeddings = None
+        nearest = None
         try:
             # Добавление объяснений через семантический поиск
             print('Вычисление эмбеддингов для поиска...')
-            doc_embeddings = self.__search_model.encode(
-                target_chunks,
-                prompt_name='search_document',
-                device=self.device
-            )
-            query_embeddings = self.__search_model.encode(
-                [q['question'] for q in questions],
-                prompt_name='search_query',
-                device=self.device
-            )
-            print('Эмбеддинги для поиска вычислены.')
-
-            # Проверка корректности эмбеддингов
-            if query_embeddings is None or len(query_embeddings.shape) < 2 or query_embeddings.shape[0] == 0:
-                print("⚠️ Не удалось создать эмбеддинги для вопросов. Объяснения будут пропущены.")
-                raise ValueError("Некорректные эмбеддинги для запроса")
-
-            # Создание FAISS индекса для быстрого поиска похожих чанков
-            print('Настройка FAISS индекса...')
-            index = faiss.IndexFlatIP(doc_embeddings.shape[1])  # Косинусное расстояние
-            index.add(doc_embeddings)
-            print('FAISS индекс готов.')
-
-            # Поиск наиболее релевантных чанков для каждого вопроса
-            print('Поиск соответствий вопросов и чанков...')
-            _, indices = index.search(query_embeddings, 1)
-
-            # Добавление объяснений к вопросам
-            for question, explanation_chunk in zip(questions, target_chunks[indices]):
-                # Если модель не предоставила объяснение, используем релевантный чанк
-                if not question.get('explanation'):
-                    question['explanation'] = str(explanation_chunk[0])
+            if clustering_embeddings is None:
+                # Упрощённая генерация: эмбеддинги чанков нужны только для поиска объяснений
+                clustering_embeddings = self.__get_clustering_embeddings(chunks)
+            index = self.__build_explanation_index(target_chunks, clustering_embeddings[central_indices])
+            query_embeddings, nearest = self.__attach_explanations(questions, target_chunks, index)
                 
         except Exception as e:
             print(f'⚠️ Ошибка при добавлении объяснений из контекста: {e}')
@@ -759,8 +1992,46 @@ class QuestionsGenerator:
                 if not q.get('explanation'):
                     q['explanation'] = 'Объяснение не найдено из-за ошибки.'
 
+        # Удаление похожих вопросов по эмбеддингам, уже посчитанным для объяснений
+        if query_embeddings is not None and self.dedup_threshold is not None:
+            report_progress('deduplication')
+            try:
+                questions, nearest = self.__deduplicate_questions(
+                    llm,
+                    questions,
+                    query_embeddings,
+                    nearest,
+                    target_chunks,
+                    index,
+                    questions_num,
+                    use_cache,
+                    priorities
+                )
+            except Exception as e:
+                print(f'⚠️ Ошибка при удалении похожих вопросов: {e}')
+
+        if document_id is not None and len(chunks) >= MIN_CLUSTERS_NUM:
+            self.__save_document_version(
+                document_id,
+                llm,
+                chunk_hashes,
+                clustering_embeddings,
+                centroids,
+                [chunk_hashes[i] for i in central_indices],
+                questions,
+                nearest
+            )
+
         # Финальная статистика по времени
         actual_time = time.time() - start_time
+        # При одновременных запросах попадание в кэш другого запроса тоже исключает замер - это допустимо.
+        # Вопросы из предыдущей версии документа тоже не отражают время генерации
+        if self.__response_cache_hits(llm) == cache_hits_before and not reused:
+            self.time_estimator.record(
+                llm,
+                self.__estimate_features(chunked, questions_num, len(central_indices)),
+                actual_time
+            )
         
         # Определяем полное название модели для красивого вывода
         model_names = {
@@ -774,27 +2045,229 @@ class QuestionsGenerator:
         print(f'🎉 ГЕНЕРАЦИЯ ЗАВЕРШЕНА!')
         print(f'   🤖 Модель: {model_display}')
         print(f'   ⏱️  Фактическое время: {actual_time:.1f} сек ({actual_time/60:.1f} мин)')
-        print(f'   📈 Ожидалось: {time_estimate["estimated_seconds"]} сек')
+        interval = time_estimate['confidence_interval']
+        interval_text = f' (90%: {interval[0]}-{interval[1]} сек)' if interval else ''
+        print(f'   📈 Ожидалось: {time_estimate["estimated_seconds"]} сек{interval_text}')
         print(f'   📊 Разница: {actual_time - time_estimate["estimated_seconds"]:.1f} сек')
         print(f'   📝 Результат: {len(questions)} вопросов')
+        cache_stats = self.embedding_cache.stats()
+        print(f'   💾 Кэш эмбеддингов: {cache_stats["memory_hits"] + cache_stats["disk_hits"]} попаданий, '
+              f'{cache_stats["misses"]} промахов')
+        response_stats = self.response_cache.stats()
+        print(f'   💬 Кэш ответов LLM: {response_stats["memory_hits"] + response_stats["disk_hits"]} попаданий, '
+              f'{response_stats["misses"]} промахов')
+        if previous is not None:
+            print(f'   ♻️  Из предыдущей версии документа: {len(reused)} вопросов')
         print()
-        
+
+        REQUEST_ITEMS.observe(len(questions), kind='questions')
+        GENERATIONS.inc(llm=llm, status='ok')
+        report_progress('done')
         return questions
 
-    def estimate_generation_time(self, text: str, questions_num: int, llm: str = 'iceq') -> dict:
+    def generate_stream(
+            self,
+            text: TextSource,
+            questions_num: int,
+            llm: Literal['deepseek', 'qwen', 'iceq'] = 'iceq',
+            use_cache: bool = True
+    ) -> Iterator[dict]:
+
+        '''
+        Генерирует вопросы по тексту и выдаёт их по мере получения от LLM
+
+        Ответ модели читается потоком и разбирается инкрементально: каждый
+        вопрос выдаётся с объяснением, как только он полностью получен,
+        не дожидаясь окончания генерации остальных. Короткие тексты (меньше
+        MIN_CLUSTERS_NUM чанков) генерируются упрощённо, как в generate; для
+        ICEQ упрощённый ответ не стримится, и вопросы выдаются после него.
+
+        Параметры:
+            text (str | os.PathLike | bytes | mmap.mmap | ChunkedText):
+                текст, по которому надо задать вопросы (см. generate)
+            questions_num (int): количество вопросов
+            llm (Literal['deepseek', 'qwen', 'iceq']), optional:
+                языковая модель, используемая для генерации вопросов
+            use_cache (bool), optional:
+                использовать кэш ответов LLM; при попадании все вопросы выдаются сразу
+
+        Возвращаемое значение (Iterator[dict]): события
+            - {'type': 'progress', 'stage': str, 'progress': float}
+            - {'type': 'question', 'index': int, 'question': dict}
+            - {'type': 'done', 'count': int}
+
+        LLM проверяется при получении первого события; чтобы получить ошибку
+        до начала ответа клиенту, вызовите check_llm заранее.
+        '''
+
+        self.__prepare_llm(llm)
+        stage_timer = StageTimer(llm=llm)
+
+        def progress_event(stage: str) -> dict:
+            if stage == 'done':
+                stage_timer.finish()
+            else:
+                stage_timer.enter(stage)
+            return {'type': 'progress', 'stage': stage, 'progress': GENERATION_STAGES[stage]}
+
+        print(f'Начало потоковой генерации {questions_num} вопросов...')
+        yield progress_event('chunking')
+        chunked = chunk_source(text)
+        self.__check_text_sufficiency(chunked, questions_num)
+        chunks = self.__split_chunks(chunked)
+        # Исходный текст нужен только упрощённой генерации (как в generate)
+        source_text = chunked.text() if len(chunks) < MIN_CLUSTERS_NUM else None
+        if not isinstance(text, ChunkedText):
+            chunked.close()
+        REQUEST_ITEMS.observe(len(chunks), kind='chunks')
+
+        yield progress_event('embedding')
+        clustering_embeddings = self.__get_clustering_embeddings(chunks)
+
+        if len(chunks) < MIN_CLUSTERS_NUM:
+            # Кластеризовать нечего - объяснения ищем среди всех чанков
+            print(f'Чанков слишком мало ({len(chunks)}), используем упрощенную генерацию...')
+            central_indices = np.arange(len(chunks))
+            priorities = None
+        else:
+            yield progress_event('clustering')
+            central_indices, priorities, _ = self.__cluster_chunks(chunked.lines_num, clustering_embeddings)
+        target_chunks = chunks[central_indices]
+        REQUEST_ITEMS.observe(len(central_indices), kind='clusters')
+
+        # Индекс для объяснений строим до генерации, чтобы не задерживать выдачу вопросов
+        index = None
+        try:
+            index = self.__build_explanation_index(target_chunks, clustering_embeddings[central_indices])
+        except Exception as e:
+            print(f'⚠️ Ошибка при построении индекса объяснений: {e}')
+
+        yield progress_event('generation')
+        parser = IncrementalQuestionParser()
+        count = 0
+
+        def with_explanations(questions: list[dict]) -> list[dict]:
+            if not questions:
+                return questions
+            try:
+                if index is not None:
+                    self.__attach_explanations(questions, target_chunks, index)
+            except Exception as e:
+                print(f'⚠️ Ошибка при добавлении объяснений из контекста: {e}')
+            for q in questions:
+                if not q.get('explanation'):
+                    q['explanation'] = 'Объяснение не найдено из-за ошибки.'
+            return questions
+
+        if source_text is not None:
+            # Упрощённая генерация по всему тексту, как в generate
+            if llm == 'iceq':
+                context = self.__pack_context(llm, [source_text], budget=ICEQ_SHORT_CONTEXT_TOKENS)
+            else:
+                context = self.__pack_context(llm, [source_text])
+        else:
+            context = self.__pack_context(llm, target_chunks, priorities)
+        text_for_generation = context.text
+        key = None
+        if use_cache and not (source_text is not None and llm == 'iceq'):
+            key = self.__response_cache_key(llm, text_for_generation, questions_num)
+        cached = self.response_cache.get(llm, key) if key is not None else None
+
+        if source_text is not None and llm == 'iceq':
+            # Упрощённый промпт ICEQ выполняется батчером целиком: вопросы выдаются после ответа
+            for question in with_explanations(self.__generate_iceq(text_for_generation, questions_num)):
+                yield {'type': 'question', 'index': count, 'question': question}
+                count += 1
+        elif cached is not None:
+            print('Ответ LLM взят из кэша.')
+            for question in with_explanations(cached['questions']):
+                yield {'type': 'question', 'index': count, 'question': question}
+                count += 1
+        else:
+            response_parts = []
+            # В кэш попадают вопросы без объяснений, как и в generate
+            parsed_questions = []
+            for delta in self.__stream_llm(llm, text_for_generation, questions_num):
+                response_parts.append(delta)
+                questions = parser.feed(delta)
+                parsed_questions.extend(copy.deepcopy(questions))
+                for question in with_explanations(questions):
+                    yield {'type': 'question', 'index': count, 'question': question}
+                    count += 1
+
+            questions = parser.close()
+            parsed_questions.extend(copy.deepcopy(questions))
+            for question in with_explanations(questions):
+                yield {'type': 'question', 'index': count, 'question': question}
+                count += 1
+
+            self.__store_response(llm, key, ''.join(response_parts), parsed_questions)
+
+        print(f'Потоковая генерация завершена: {count} вопросов')
+        REQUEST_ITEMS.observe(count, kind='questions')
+        GENERATIONS.inc(llm=llm, status='ok' if count else 'empty')
+        yield progress_event('done')
+        yield {'type': 'done', 'count': count}
+
+    def __response_cache_hits(self, llm: str) -> int:
+        """Количество попаданий в кэш ответов LLM с момента запуска"""
+        stats = self.response_cache.stats()['backends'].get(llm)
+        return stats['memory_hits'] + stats['disk_hits'] if stats else 0
+
+    def __estimate_features(
+            self,
+            chunked: ChunkedText,
+            questions_num: int,
+            clusters_num: int | None = None
+    ) -> dict:
+        """
+        Признаки запроса для оценки времени генерации
+        
+        Args:
+            chunked (ChunkedText): разбитый на чанки текст
+            questions_num (int): количество вопросов
+            clusters_num (int | None): количество кластеров (None - вычислить по тексту)
+        
+        Returns:
+            dict: значения time_estimator.ESTIMATOR_FEATURES
+        """
+        if clusters_num is None:
+            clusters_num = min(self.__clusters_num(chunked.lines_num), chunked.chunks_num)
+        return {
+            'text_length': chunked.text_length,
+            'chunks': chunked.chunks_num,
+            'clusters': clusters_num,
+            'questions_num': questions_num
+        }
+
+    def estimate_generation_time(
+            self,
+            text: TextSource,
+            questions_num: int,
+            llm: str = 'iceq'
+    ) -> dict:
         """
         Оценивает примерное время генерации вопросов
         
+        Когда для LLM накоплено достаточно замеров, время прогнозируется
+        регрессией по фактическим генерациям (с 90% интервалом), иначе -
+        эвристикой по длине текста и количеству вопросов.
+        
         Параметры:
-            text (str): текст для анализа
+            text (str | os.PathLike | bytes | mmap.mmap | ChunkedText):
+                текст для анализа (ChunkedText - уже разбитый текст, без повторного прохода)
             questions_num (int): количество вопросов
             llm (str): используемая модель
             
         Возвращает:
             dict: информация о времени генерации
         """
-        text_length = len(text)
-        word_count = len(text.split())
+        chunked = chunk_source(text)
+        text_length = chunked.text_length
+        word_count = chunked.words_num
+        features = self.__estimate_features(chunked, questions_num)
+        if not isinstance(text, ChunkedText):
+            chunked.close()
         
         if llm == 'iceq':
             # Базовое время для ICEQ модели с 8-битным квантованием
@@ -808,17 +2281,29 @@ class QuestionsGenerator:
             base_time_per_question = 2.0  # быстрее через API
             text_factor = min(text_length / 1500, 2.0)
             estimated_time = base_time_per_question * questions_num * text_factor
+
+        confidence_interval = None
+        source = 'heuristic'
+        samples = 0
+        learned = self.time_estimator.estimate(llm, features)
+        if learned is not None:
+            estimated_time = learned['seconds']
+            confidence_interval = [int(learned['lower']), int(round(learned['upper']))]
+            source = 'model'
+            samples = learned['samples']
         
         return {
             'estimated_seconds': int(estimated_time),
             'estimated_minutes': round(estimated_time / 60, 1),
+            'confidence_interval': confidence_interval,
+            'source': source,
+            'samples': samples,
             'text_length': text_length,
             'word_count': word_count,
             'questions_count': questions_num,
             'model': llm
         }
 
-
 if __name__ == '__main__':
     print('Запуск тестового сценария...')
     with open('test_data/markdown.md', 'r', encoding='utf8') as f:
@@ -0,0 +1,290 @@
+'''
+ICEQ (2025) - Асинхронная очередь задач генерации
+
+Основной функционал:
+- Постановка задачи в очередь с немедленным возвратом идентификатора
+- Ограниченный пул рабочих потоков и ограниченная очередь ожидания
+- Реальный прогресс по стадиям, сообщаемый изнутри задачи
+- Хранение результатов завершённых задач с ограниченным временем жизни
+- Оценка времени ожидания в очереди по прогнозу длительности задач
+- Общее для нескольких процессов состояние задач в директории state_dir
+  (pre-fork сервер: задача выполняется в одном рабочем процессе, а статус
+  может запросить любой)
+
+Пример использования:
+    >>> manager = JobManager(max_workers=2)
+    >>> job_id = manager.submit(generator.generate, text, 10, llm='deepseek')
+    >>> manager.status(job_id)
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import os
+import re
+import json
+import time
+import uuid
+import threading
+
+# Количество одновременно выполняемых задач
+DEFAULT_MAX_WORKERS = 2
+# Максимальное количество задач в очереди (включая выполняющиеся)
+DEFAULT_MAX_PENDING = 32
+# Время хранения завершённых задач, секунд
+DEFAULT_RESULT_TTL = 3600
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+
+# Формат идентификатора задачи (uuid4().hex): только такие имена читаются из state_dir
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class JobQueueFull(Exception):
+    """Очередь задач переполнена"""
+
+
+class JobManager:
+    """
+    Менеджер фоновых задач с пулом потоков
+
+    Функция задачи получает именованный аргумент progress_callback(stage, progress),
+    через который сообщает текущую стадию и долю выполнения (0..1).
+
+    Attributes:
+        max_workers (int): количество рабочих потоков
+        max_pending (int): максимальное количество незавершённых задач
+        result_ttl (float): время хранения завершённых задач, секунд
+        state_dir (str | None): директория состояния задач, общая для процессов
+            (None - задачи видны только в своём процессе). Задачи других
+            процессов читаются из неё без позиции в очереди и оценки ожидания
+    """
+
+    def __init__(
+            self,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            max_pending: int = DEFAULT_MAX_PENDING,
+            result_ttl: float = DEFAULT_RESULT_TTL,
+            state_dir: Optional[str] = None
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir
+        if state_dir is not None:
+            os.makedirs(state_dir, exist_ok=True)
+
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='iceq-job')
+        self.__jobs: Dict[str, dict] = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, estimated_seconds: Optional[float] = None, **kwargs) -> str:
+        """
+        Ставит задачу в очередь
+
+        Args:
+            fn (Callable): функция задачи, принимающая progress_callback
+            *args, **kwargs: аргументы функции
+            estimated_seconds (float | None): прогноз длительности задачи
+                (для оценки времени ожидания в очереди)
+
+        Returns:
+            str: идентификатор задачи
+
+        Raises:
+            JobQueueFull: если незавершённых задач уже max_pending
+        """
+        with self.__lock:
+            self.__cleanup()
+            pending = sum(1 for job in self.__jobs.values() if job['status'] in (JOB_QUEUED, JOB_RUNNING))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'Очередь генерации переполнена ({pending} задач). Попробуйте позже.')
+
+            job_id = uuid.uuid4().hex
+            self.__jobs[job_id] = {
+                'id': job_id,
+                'status': JOB_QUEUED,
+                'stage': None,
+                'progress': 0.0,
+                'created_at': time.time(),
+                'estimated_seconds': estimated_seconds,
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+        self.__save(job_id)
+
+        self.__executor.submit(self.__run, job_id, fn, args, kwargs)
+        return job_id
+
+    def __run(self, job_id: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        def progress_callback(stage: str, progress: float) -> None:
+            with self.__lock:
+                job = self.__jobs[job_id]
+                job['stage'] = stage
+                job['progress'] = round(min(max(progress, 0.0), 1.0), 3)
+            self.__save(job_id)
+
+        with self.__lock:
+            if self.__jobs[job_id]['status'] != JOB_QUEUED:
+                # Задача отменена при остановке
+                return
+            self.__jobs[job_id].update(status=JOB_RUNNING, started_at=time.time())
+        self.__save(job_id)
+
+        try:
+            result = fn(*args, progress_callback=progress_callback, **kwargs)
+        except Exception as e:
+            print(f'Ошибка при выполнении задачи {job_id}: {e}')
+            with self.__lock:
+                self.__jobs[job_id].update(status=JOB_ERROR, error=str(e), finished_at=time.time())
+            self.__save(job_id)
+            return
+
+        with self.__lock:
+            self.__jobs[job_id].update(
+                status=JOB_DONE,
+                progress=1.0,
+                result=result,
+                finished_at=time.time()
+            )
+        self.__save(job_id)
+
+    def __path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f'{job_id}.json')
+
+    def __save(self, job_id: str) -> None:
+        """Записывает состояние задачи в state_dir (атомарно, через временный файл)"""
+        if self.state_dir is None:
+            return
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job is None:
+                return
+            job = dict(job)
+
+        path = self.__path(job_id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f'⚠️ Не удалось сохранить состояние задачи {job_id}: {e}')
+
+    def __load(self, job_id: str) -> Optional[dict]:
+        """Читает задачу другого процесса из state_dir"""
+        if self.state_dir is None or JOB_ID_PATTERN.fullmatch(job_id) is None:
+            return None
+        try:
+            with open(self.__path(job_id), 'r', encoding='utf8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['finished_at'] is not None and time.time() - job['finished_at'] > self.result_ttl:
+            return None
+        return job
+
+    def __cleanup(self) -> None:
+        """Удаляет завершённые задачи старше result_ttl (вызывается под блокировкой)"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.__jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.__jobs[job_id]
+            if self.state_dir is not None:
+                try:
+                    os.remove(self.__path(job_id))
+                except OSError:
+                    pass
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """
+        Возвращает состояние задачи без результата
+
+        Returns:
+            dict | None: состояние задачи или None, если задача не найдена
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job is None:
+                job = self.__load(job_id)
+                return {key: value for key, value in job.items() if key != 'result'} if job is not None else None
+
+            status = {key: value for key, value in job.items() if key != 'result'}
+            if job['status'] == JOB_QUEUED:
+                ahead = [
+                    other for other in self.__jobs.values()
+                    if other['status'] == JOB_QUEUED and other['created_at'] < job['created_at']
+                ]
+                status['queue_position'] = len(ahead) + 1
+                status['estimated_wait_seconds'] = self.__estimate_wait(ahead)
+            elif job['status'] == JOB_RUNNING and job['estimated_seconds'] is not None:
+                status['estimated_remaining_seconds'] = round(self.__remaining(job), 1)
+            return status
+
+    def __remaining(self, job: dict) -> float:
+        """Прогноз оставшегося времени выполняющейся задачи (вызывается под блокировкой)"""
+        return max(0.0, job['estimated_seconds'] - (time.time() - job['started_at']))
+
+    def __estimate_wait(self, ahead: list) -> Optional[float]:
+        """
+        Оценивает ожидание задачи в очереди (вызывается под блокировкой)
+
+        Работа выполняющихся задач и задач, стоящих впереди, делится между
+        рабочими потоками. Задачи без прогноза не учитываются.
+
+        Returns:
+            float | None: секунд или None, если прогнозов нет ни у одной задачи
+        """
+        running = [job for job in self.__jobs.values() if job['status'] == JOB_RUNNING]
+        known = [job for job in running + ahead if job['estimated_seconds'] is not None]
+        if not known and (running or ahead):
+            return None
+
+        work = sum(self.__remaining(job) for job in running if job['estimated_seconds'] is not None)
+        work += sum(job['estimated_seconds'] for job in ahead if job['estimated_seconds'] is not None)
+        return round(work / self.max_workers, 1)
+
+    def result(self, job_id: str) -> Optional[dict]:
+        """
+        Возвращает задачу вместе с результатом
+
+        Returns:
+            dict | None: задача с полем result или None, если задача не найдена
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            return dict(job) if job is not None else self.__load(job_id)
+
+    def shutdown(self) -> None:
+        """
+        Отменяет задачи, ожидающие в очереди, и дожидается выполняющихся
+
+        Вызывается при остановке процесса (рабочего процесса pre-fork сервера)
+        """
+        with self.__lock:
+            cancelled = [job_id for job_id, job in self.__jobs.items() if job['status'] == JOB_QUEUED]
+            for job_id in cancelled:
+                self.__jobs[job_id].update(
+                    status=JOB_ERROR,
+                    error='Сервер перезапускается, задача отменена. Повторите запрос.',
+                    finished_at=time.time()
+                )
+        for job_id in cancelled:
+            self.__save(job_id)
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Количество задач по статусам"""
+        with self.__lock:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_ERROR: 0}
+            for job in self.__jobs.values():
+                counts[job['status']] += 1
+            return counts
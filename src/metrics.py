@@ -0,0 +1,356 @@
+'''
+ICEQ (2025) - Метрики в формате Prometheus
+
+Основной функционал:
+- Счётчики, gauge и гистограммы с метками, безопасные для потоков
+- Замер длительности стадий генерации
+- Сборщики, обновляющие метрики из статистики кэшей и реестра моделей
+  непосредственно перед выдачей
+- Текстовый формат экспозиции Prometheus (text/plain; version=0.0.4)
+
+Пример использования:
+    >>> with LLM_REQUEST_SECONDS.time(llm='deepseek'):
+    ...     response = client.generate('deepseek', text, 10)
+    >>> REGISTRY.add_collector(generator.update_metrics)
+    >>> REGISTRY.render()  # ответ GET /metrics
+'''
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import math
+import time
+import threading
+
+# Тип содержимого ответа /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Границы гистограмм длительности, секунд
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Границы гистограмм количества (чанков, кластеров, вопросов)
+DEFAULT_COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10_000, 50_000, 100_000, 500_000)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и значения по наборам меток"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> List[Tuple[str, str]]:
+        return list(zip(self.labelnames, key))
+
+    def clear(self) -> None:
+        """Удаляет все значения (например, перед повторным заполнением сборщиком)"""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Устанавливает значение счётчика, который ведётся в другом месте (кэши, батчер)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(f'{self.name}_total', self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Текущее значение, которое может как расти, так и уменьшаться"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        """Увеличивает gauge на время выполнения блока"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Распределение значений по накопительным корзинам"""
+
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+            registry=None
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Записывает длительность выполнения блока, секунд"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state['count'] if state is not None else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    samples.append((f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative))
+                samples.append((f'{self.name}_sum', labels, state['sum']))
+                samples.append((f'{self.name}_count', labels, state['count']))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса
+
+    Сборщики (collectors) вызываются перед каждой выдачей и обновляют
+    метрики, значения которых дешевле прочитать из готовой статистики
+    (кэши, реестр моделей, очередь задач), чем вести отдельно.
+    """
+
+    def __init__(self):
+        self.__metrics: Dict[str, _Metric] = {}
+        self.__collectors: List[Callable[[], None]] = []
+        self.__lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+            self.__metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        with self.__lock:
+            self.__collectors.append(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self.__metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Возвращает все метрики в текстовом формате Prometheus
+
+        Returns:
+            str: текст экспозиции
+        """
+        with self.__lock:
+            collectors = list(self.__collectors)
+            metrics = list(self.__metrics.values())
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f'⚠️ Ошибка при сборе метрик: {e}')
+
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+class StageTimer:
+    """
+    Замер длительности последовательных стадий
+
+    enter(stage) завершает предыдущую стадию и начинает новую,
+    finish() завершает последнюю.
+
+    Args:
+        histogram (Histogram): гистограмма с меткой stage
+        **labels: прочие метки гистограммы
+    """
+
+    def __init__(self, histogram: Histogram = None, **labels):
+        self.histogram = histogram if histogram is not None else STAGE_SECONDS
+        self.labels = labels
+        self.__stage: Optional[str] = None
+        self.__started = 0.0
+
+    def enter(self, stage: str) -> None:
+        now = time.perf_counter()
+        if self.__stage is not None:
+            self.histogram.observe(now - self.__started, stage=self.__stage, **self.labels)
+        self.__stage = stage
+        self.__started = now
+
+    def finish(self) -> None:
+        if self.__stage is not None:
+            self.histogram.observe(time.perf_counter() - self.__started, stage=self.__stage, **self.labels)
+            self.__stage = None
+
+
+REGISTRY = MetricsRegistry()
+
+# Генерация
+STAGE_SECONDS = Histogram(
+    'iceq_stage_duration_seconds',
+    'Длительность стадии генерации, секунд',
+    ['stage', 'llm']
+)
+GENERATIONS = Counter('iceq_generations', 'Завершённые генерации', ['llm', 'status'])
+REQUEST_ITEMS = Histogram(
+    'iceq_request_items',
+    'Количество чанков, кластеров и вопросов в одном запросе генерации',
+    ['kind'],
+    buckets=DEFAULT_COUNT_BUCKETS
+)
+PROMPT_TOKENS = Histogram(
+    'iceq_prompt_context_tokens',
+    'Токены контекста промпта: всех чанков-кандидатов (candidate) и вошедших в бюджет (packed)',
+    ['llm', 'kind'],
+    buckets=DEFAULT_COUNT_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge('iceq_requests_in_flight', 'Выполняющиеся запросы', ['endpoint'])
+JOBS = Gauge('iceq_jobs', 'Задачи очереди генерации по статусам', ['status'])
+
+# LLM
+LLM_REQUEST_SECONDS = Histogram(
+    'iceq_llm_request_duration_seconds',
+    'Длительность запроса к LLM до получения полного ответа, секунд',
+    ['llm']
+)
+LLM_TTFT_SECONDS = Histogram(
+    'iceq_llm_time_to_first_token_seconds',
+    'Время до первой части ответа LLM, секунд',
+    ['llm']
+)
+LLM_ERRORS = Counter('iceq_llm_errors', 'Ошибки запросов к LLM', ['llm'])
+PARSE_FAILURES = Counter(
+    'iceq_parse_failures',
+    'Отброшенные при разборе вопросы и ответы без вопросов',
+    ['format', 'reason']
+)
+
+# Кэши
+CACHE_LOOKUPS = Counter('iceq_cache_lookups', 'Обращения к кэшам', ['cache', 'backend', 'result'])
+CACHE_HIT_RATIO = Gauge('iceq_cache_hit_ratio', 'Доля попаданий в кэш', ['cache', 'backend'])
+
+# Модели
+MODEL_RESIDENT = Gauge('iceq_model_resident', 'Загружена ли модель в память (1/0)', ['model'])
+MODEL_MEMORY_MB = Gauge('iceq_model_memory_mb', 'Размер загруженной модели, МБ', ['model'])
+MODEL_LOADS = Counter('iceq_model_loads', 'Загрузки модели', ['model'])
+MODEL_EVICTIONS = Counter('iceq_model_evictions', 'Выгрузки модели', ['model'])
+BATCH_ITEMS = Counter('iceq_batch_items', 'Запросы, выполненные батчами ICEQ', ['batcher'])
+BATCHES = Counter('iceq_batches', 'Батчи ICEQ', ['batcher'])
+PREFIX_CACHE_REQUESTS = Counter(
+    'iceq_prefix_cache_requests',
+    'Запросы ICEQ по основному промпту от KV-кэша общего префикса (hit) и без него (miss)',
+    ['result']
+)
+PREFIX_CACHE_SAVED_TOKENS = Counter('iceq_prefix_cache_saved_tokens', 'Токены prefill, взятые из KV-кэша общего префикса')
+ICEQ_STOPS = Counter(
+    'iceq_generation_stops',
+    'Причины остановки генерации ICEQ: questions (готово нужное количество вопросов), eos, max_tokens',
+    ['prompt', 'reason']
+)
+DOCUMENT_REUSE = Counter(
+    'iceq_document_version_items',
+    'Перегенерация изменённых документов: чанки, кластеры и вопросы из предыдущей версии (reused) и вычисленные заново (recomputed)',
+    ['item', 'result']
+)
+PROMPT_LOOKUP_TOKENS = Counter('iceq_prompt_lookup_tokens', 'Токены, сгенерированные ICEQ с prompt lookup decoding')
+PROMPT_LOOKUP_STEPS = Counter(
+    'iceq_prompt_lookup_steps',
+    'Проходы модели ICEQ с prompt lookup decoding (проверка черновика и следующий токен)'
+)
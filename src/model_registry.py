@@ -0,0 +1,330 @@
+'''
+ICEQ (2025) - Реестр моделей с ленивой загрузкой
+
+Основной функционал:
+- Загрузка модели при первом обращении
+- Выгрузка моделей, простаивающих дольше заданного таймаута
+- Выгрузка давно не используемых моделей (LRU) при превышении бюджета памяти
+- Состояние резидентности моделей для мониторинга
+
+Пример использования:
+    >>> registry = ModelRegistry(idle_timeout=600, memory_budget_mb=8000)
+    >>> registry.register('clustering', lambda: SentenceTransformer('intfloat/multilingual-e5-large-instruct'))
+    >>> with registry.use('clustering') as model:
+    ...     embeddings = model.encode(chunks)
+'''
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import gc
+import os
+import sys
+import time
+import threading
+
+# Период проверки простаивающих моделей, секунд
+DEFAULT_SWEEP_INTERVAL = 30.0
+
+
+def _rss_mb() -> Optional[float]:
+    """Текущий RSS процесса в мегабайтах (только Linux)"""
+    try:
+        with open(f'/proc/{os.getpid()}/status', 'r', encoding='utf8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def estimate_model_size_mb(model: Any) -> Optional[float]:
+    """
+    Оценивает размер модели по её параметрам и буферам
+
+    Поддерживает torch.nn.Module (в т.ч. SentenceTransformer) и словари
+    с моделями (например, {'tokenizer': ..., 'model': ...} для ICEQ).
+
+    Args:
+        model: загруженная модель
+
+    Returns:
+        float | None: размер в мегабайтах или None, если оценить нельзя
+    """
+    if isinstance(model, dict):
+        sizes = [estimate_model_size_mb(value) for value in model.values()]
+        sizes = [size for size in sizes if size is not None]
+        return sum(sizes) if sizes else None
+
+    if hasattr(model, 'parameters') and hasattr(model, 'buffers'):
+        total = 0
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+        # У SentenceTransformer с бэкендом ONNX веса хранятся в ONNX Runtime, а не в тензорах torch
+        return total / 1024 ** 2 if total else None
+
+    return None
+
+
+class _ModelEntry:
+    """Состояние одной зарегистрированной модели"""
+
+    def __init__(self, name: str, loader: Callable[[], Any], size_mb: Optional[float]):
+        self.name = name
+        self.loader = loader
+        self.size_mb = size_mb
+        self.model = None
+        self.loaded_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.load_count = 0
+        self.eviction_count = 0
+        self.active_users = 0
+        self.load_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+
+class ModelRegistry:
+    """
+    Реестр моделей с ленивой загрузкой и выгрузкой
+
+    Модель загружается при первом вызове get()/use(). Модели, к которым
+    не обращались дольше idle_timeout секунд, выгружаются фоновым потоком.
+    Если суммарный размер загруженных моделей превышает memory_budget_mb,
+    выгружаются наименее недавно использованные модели. Модели, которые
+    прямо сейчас используются через use(), не выгружаются.
+
+    Attributes:
+        idle_timeout (float | None): таймаут простоя, секунд (None - не выгружать)
+        memory_budget_mb (float | None): бюджет памяти, МБ (None - без ограничения)
+    """
+
+    def __init__(
+            self,
+            idle_timeout: Optional[float] = None,
+            memory_budget_mb: Optional[float] = None,
+            sweep_interval: float = DEFAULT_SWEEP_INTERVAL
+    ):
+        self.idle_timeout = idle_timeout
+        self.memory_budget_mb = memory_budget_mb
+        self.__entries: Dict[str, _ModelEntry] = {}
+        self.__lock = threading.RLock()
+
+        if idle_timeout is not None:
+            sweeper = threading.Thread(
+                target=self.__sweep_loop,
+                args=(min(sweep_interval, idle_timeout),),
+                name='model-registry-sweeper',
+                daemon=True
+            )
+            sweeper.start()
+
+    def register(self, name: str, loader: Callable[[], Any], size_mb: Optional[float] = None) -> None:
+        """
+        Регистрирует модель без её загрузки
+
+        Args:
+            name (str): имя модели в реестре
+            loader (Callable): функция загрузки; None в качестве результата означает ошибку
+            size_mb (float | None): ожидаемый размер, МБ (уточняется после загрузки)
+        """
+        with self.__lock:
+            self.__entries[name] = _ModelEntry(name, loader, size_mb)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__entries
+
+    def is_loaded(self, name: str) -> bool:
+        """Проверяет, загружена ли модель, не загружая её"""
+        entry = self.__entries.get(name)
+        return entry is not None and entry.loaded
+
+    def peek(self, name: str) -> Any:
+        """Возвращает модель, если она уже загружена, иначе None"""
+        entry = self.__entries.get(name)
+        return entry.model if entry is not None else None
+
+    def get(self, name: str) -> Any:
+        """
+        Возвращает модель, загружая её при необходимости
+
+        Args:
+            name (str): имя модели в реестре
+
+        Returns:
+            Any: загруженная модель или None, если загрузка не удалась
+        """
+        with self.use(name) as model:
+            return model
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """
+        Контекстный менеджер: модель не выгружается, пока используется
+
+        Args:
+            name (str): имя модели в реестре
+
+        Yields:
+            Any: загруженная модель или None, если загрузка не удалась
+        """
+        if name not in self.__entries:
+            raise KeyError(f"Модель '{name}' не зарегистрирована")
+        entry = self.__entries[name]
+
+        with self.__lock:
+            entry.active_users += 1
+        try:
+            if not entry.loaded:
+                self.__load(entry)
+            with self.__lock:
+                entry.last_used = time.monotonic()
+            yield entry.model
+        finally:
+            with self.__lock:
+                entry.active_users -= 1
+                entry.last_used = time.monotonic()
+
+    def __load(self, entry: _ModelEntry) -> None:
+        # Отдельная блокировка на модель: параллельные запросы не загружают её дважды
+        with entry.load_lock:
+            if entry.loaded:
+                return
+
+            if entry.size_mb is not None:
+                self.__enforce_budget(reserve_mb=entry.size_mb, keep=entry.name)
+                if self.memory_budget_mb is not None and self.resident_mb() + entry.size_mb > self.memory_budget_mb:
+                    print(f'⚠️ Модель {entry.name} ({entry.size_mb:.0f} МБ) не укладывается в бюджет памяти '
+                          f'{self.memory_budget_mb:g} МБ: загружено {self.resident_mb():.0f} МБ')
+
+            print(f'Загрузка модели {entry.name}...')
+            rss_before = _rss_mb()
+            start = time.monotonic()
+            model = entry.loader()
+            if model is None:
+                print(f'⚠️ Модель {entry.name} не загружена')
+                return
+
+            entry.load_seconds = time.monotonic() - start
+            # Приоритет: размер параметров, затем заявленный размер, затем прирост RSS
+            size_mb = estimate_model_size_mb(model)
+            if size_mb is None:
+                size_mb = entry.size_mb
+            if size_mb is None and rss_before is not None:
+                rss_after = _rss_mb()
+                size_mb = max(rss_after - rss_before, 0.0) if rss_after is not None else None
+
+            with self.__lock:
+                entry.model = model
+                entry.size_mb = size_mb
+                entry.loaded_at = entry.last_used = time.monotonic()
+                entry.load_count += 1
+            print(f'Модель {entry.name} загружена за {entry.load_seconds:.1f} сек')
+
+            self.__enforce_budget(keep=entry.name)
+
+    def __enforce_budget(self, reserve_mb: float = 0.0, keep: Optional[str] = None) -> None:
+        """Выгружает LRU-модели, пока загруженные модели не уложатся в бюджет"""
+        if self.memory_budget_mb is None:
+            return
+
+        with self.__lock:
+            candidates = sorted(
+                (entry for entry in self.__entries.values()
+                 if entry.loaded and entry.name != keep and entry.active_users == 0),
+                key=lambda entry: entry.last_used
+            )
+            for entry in candidates:
+                if self.resident_mb() + reserve_mb <= self.memory_budget_mb:
+                    break
+                self.__evict(entry, reason='бюджет памяти')
+
+    def __evict(self, entry: _ModelEntry, reason: str) -> None:
+        entry.model = None
+        entry.loaded_at = None
+        entry.eviction_count += 1
+        print(f'Модель {entry.name} выгружена ({reason})')
+
+        gc.collect()
+        # Освобождаем кэш CUDA, только если torch уже импортирован
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, name: str) -> bool:
+        """
+        Принудительно выгружает модель
+
+        Returns:
+            bool: True, если модель была загружена и выгружена
+        """
+        with self.__lock:
+            entry = self.__entries.get(name)
+            if entry is None or not entry.loaded or entry.active_users:
+                return False
+            self.__evict(entry, reason='по запросу')
+            return True
+
+    def evict_idle(self) -> list[str]:
+        """
+        Выгружает модели, простаивающие дольше idle_timeout
+
+        Returns:
+            list[str]: имена выгруженных моделей
+        """
+        if self.idle_timeout is None:
+            return []
+
+        evicted = []
+        now = time.monotonic()
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry.loaded and entry.active_users == 0 and now - entry.last_used > self.idle_timeout:
+                    self.__evict(entry, reason=f'простой > {self.idle_timeout:g} сек')
+                    evicted.append(entry.name)
+        return evicted
+
+    def __sweep_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f'⚠️ Ошибка при выгрузке простаивающих моделей: {e}')
+
+    def resident_mb(self) -> float:
+        """Суммарный размер загруженных моделей, МБ"""
+        with self.__lock:
+            return sum(entry.size_mb or 0.0 for entry in self.__entries.values() if entry.loaded)
+
+    def status(self) -> dict:
+        """
+        Возвращает состояние резидентности моделей для мониторинга
+
+        Returns:
+            dict: параметры реестра и состояние каждой модели
+        """
+        now = time.monotonic()
+        with self.__lock:
+            models = {
+                entry.name: {
+                    'loaded': entry.loaded,
+                    'size_mb': round(entry.size_mb, 1) if entry.size_mb is not None else None,
+                    'idle_seconds': round(now - entry.last_used, 1) if entry.last_used is not None else None,
+                    'active_users': entry.active_users,
+                    'load_seconds': round(entry.load_seconds, 2) if entry.load_seconds is not None else None,
+                    'load_count': entry.load_count,
+                    'eviction_count': entry.eviction_count
+                }
+                for entry in self.__entries.values()
+            }
+            return {
+                'idle_timeout': self.idle_timeout,
+                'memory_budget_mb': self.memory_budget_mb,
+                'resident_mb': round(self.resident_mb(), 1),
+                'models': models
+            }
@@ -0,0 +1,159 @@
+'''
+ICEQ (2025) - KV-кэш общего префикса промпта ICEQ
+
+Основной функционал:
+- Поиск общего префикса промптов в токенах (шаблон чата, системный промпт
+  и начало пользовательского шаблона до первого подставляемого значения)
+- Однократный prefill префикса и хранение past_key_values
+- Генерация от копии кэша: prefill выполняется только для индивидуальной
+  части промпта
+- Сборка батча: префикс, паддинг, индивидуальная часть - позиции токенов
+  совпадают с позициями при паддинге слева
+
+Пример использования:
+    >>> prefix_ids = shared_prefix_ids(tokenizer, [render('A', 1), render('B', 2)])
+    >>> cache = PromptPrefixCache(model, prefix_ids)
+    >>> inputs = cache.build_inputs(suffixes, tokenizer.pad_token_id)
+    >>> model.generate(**inputs, past_key_values=cache.copy(len(suffixes)))
+'''
+
+from typing import List, Optional, Sequence
+
+import copy
+import time
+import threading
+
+
+def shared_prefix_ids(tokenizer, prompts: Sequence[str]) -> List[int]:
+    """
+    Общий префикс промптов в токенах
+
+    Промпты должны отличаться сразу после общей части (например, один шаблон
+    с разными подставленными значениями): на границе токенизатор может
+    объединить символы по-разному, поэтому берётся общее начало токенов,
+    а не токены общего начала текста.
+
+    Args:
+        tokenizer: токенизатор модели
+        prompts (Sequence[str]): не меньше двух промптов с разными значениями
+
+    Returns:
+        list[int]: токены общего префикса
+    """
+    sequences = tokenizer(list(prompts))['input_ids']
+    prefix = sequences[0]
+    for ids in sequences[1:]:
+        length = 0
+        for a, b in zip(prefix, ids):
+            if a != b:
+                break
+            length += 1
+        prefix = prefix[:length]
+    return list(prefix)
+
+
+class PromptPrefixCache:
+    """
+    Предвычисленный KV-кэш общего префикса промпта
+
+    Кэш считается один раз для загруженной модели и не изменяется:
+    каждая генерация получает свою копию (copy). Запрос использует кэш,
+    только если его токены начинаются точно с prefix_ids (split).
+
+    Attributes:
+        prefix_ids (list[int]): токены префикса
+        prefill_ms (float): время prefill префикса (экономия на каждом запросе), мс
+        hits (int): запросы, сгенерированные от кэша
+        misses (int): запросы, токены которых не начинаются с префикса
+    """
+
+    def __init__(self, model, prefix_ids: List[int]):
+        import torch
+
+        if not prefix_ids:
+            raise ValueError('Пустой префикс промпта')
+
+        self.prefix_ids = list(prefix_ids)
+        self.__device = next(model.parameters()).device
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model(
+                input_ids=torch.tensor([self.prefix_ids], device=self.__device),
+                use_cache=True
+            )
+        self.prefill_ms = (time.perf_counter() - start) * 1000
+        self.__cache = outputs.past_key_values
+
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def tokens(self) -> int:
+        """Длина префикса в токенах"""
+        return len(self.prefix_ids)
+
+    def split(self, input_ids: Sequence[int]) -> Optional[List[int]]:
+        """
+        Индивидуальная часть промпта после префикса
+
+        Returns:
+            list[int] | None: токены после префикса или None, если промпт
+                начинается не с prefix_ids (или не длиннее префикса)
+        """
+        prefix_len = len(self.prefix_ids)
+        if len(input_ids) <= prefix_len or list(input_ids[:prefix_len]) != self.prefix_ids:
+            return None
+        return list(input_ids[prefix_len:])
+
+    def record(self, hits: int = 0, misses: int = 0) -> None:
+        with self.__lock:
+            self.hits += hits
+            self.misses += misses
+
+    def build_inputs(self, suffixes: List[List[int]], pad_token_id: int) -> dict:
+        """
+        Входы generate для батча индивидуальных частей
+
+        Индивидуальные части выравниваются паддингом между префиксом и
+        текстом: паддинг закрыт маской внимания, а позиции вычисляются
+        generate по маске, поэтому они те же, что у промпта без паддинга.
+
+        Args:
+            suffixes (list[list[int]]): токены после префикса для каждого запроса
+            pad_token_id (int): токен паддинга
+
+        Returns:
+            dict: input_ids и attention_mask на устройстве модели
+        """
+        import torch
+
+        width = max(len(suffix) for suffix in suffixes)
+        input_ids = []
+        attention_mask = []
+        for suffix in suffixes:
+            padding = width - len(suffix)
+            input_ids.append(self.prefix_ids + [pad_token_id] * padding + suffix)
+            attention_mask.append([1] * len(self.prefix_ids) + [0] * padding + [1] * len(suffix))
+
+        return {
+            'input_ids': torch.tensor(input_ids, device=self.__device),
+            'attention_mask': torch.tensor(attention_mask, device=self.__device)
+        }
+
+    def copy(self, batch_size: int = 1):
+        """Копия кэша префикса для одной генерации батча из batch_size запросов"""
+        cache = copy.deepcopy(self.__cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'tokens': self.tokens,
+                'prefill_ms': round(self.prefill_ms, 1),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,341 @@
+'''
+ICEQ (2025) - Pre-fork сервер с общими моделями
+
+Основной функционал:
+- Модели загружаются один раз в родительском процессе, затем запускаются
+  рабочие процессы (fork): веса моделей остаются общими страницами памяти
+  (copy-on-write), пока их никто не изменяет
+- Рабочие процессы принимают соединения с общего слушающего сокета
+  (WSGI-сервер werkzeug с потоками на запросы)
+- Наблюдение: упавший рабочий процесс перезапускается (с задержкой, если
+  процессы падают сразу после запуска)
+- Плавный перезапуск рабочих процессов по SIGHUP и плавная остановка по
+  SIGTERM/SIGINT: процессы перестают принимать соединения и дожидаются
+  выполняющихся запросов (не дольше graceful_timeout)
+- Потребление памяти процессом: RSS, PSS и USS (только Linux)
+
+Только POSIX (Linux, macOS): на Windows нет fork. Только CPU: сервер не
+запускается, если preload инициализировал CUDA.
+
+Пример использования:
+    >>> server = PreforkServer(app, port=8080, workers=4, preload=lambda: generator.warm_up())
+    >>> server.run()  # блокирует до SIGTERM/SIGINT
+    >>> process_memory_mb(pid)
+'''
+
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import gc
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import threading
+import traceback
+
+# Количество рабочих процессов по умолчанию
+DEFAULT_WORKERS = 2
+# Сколько ждать завершения выполняющихся запросов при остановке, секунд
+DEFAULT_GRACEFUL_TIMEOUT = 60.0
+# Очередь соединений слушающего сокета
+LISTEN_BACKLOG = 2048
+# Рабочий процесс, завершившийся быстрее, считается упавшим при запуске, секунд
+MIN_WORKER_LIFETIME = 5.0
+# Задержка перезапуска процессов, падающих при запуске: удваивается до максимума, секунд
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# Период проверки рабочих процессов, секунд
+SUPERVISE_INTERVAL = 1.0
+
+
+def process_memory_mb(pid: Optional[int] = None) -> Optional[Dict[str, float]]:
+    """
+    Потребление памяти процессом по /proc/<pid>/smaps_rollup (только Linux)
+
+    RSS учитывает общие страницы в каждом процессе целиком, поэтому сумма RSS
+    рабочих процессов завышает реальное потребление. PSS делит каждую общую
+    страницу поровну между процессами (сумма PSS - реальное потребление),
+    USS - только собственные страницы процесса.
+
+    Args:
+        pid (int | None): процесс (None - текущий)
+
+    Returns:
+        dict | None: rss, pss, uss и shared в МБ или None, если данных нет
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid or os.getpid()}/smaps_rollup', 'r', encoding='utf8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    if 'Rss' not in fields:
+        return None
+    return {
+        'rss': round(fields['Rss'], 1),
+        'pss': round(fields.get('Pss', 0.0), 1),
+        'uss': round(fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0), 1),
+        'shared': round(fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0), 1)
+    }
+
+
+class PreforkServer:
+    """
+    Pre-fork WSGI-сервер: модели загружаются до fork и общие для процессов
+
+    Перед запуском рабочих процессов вызывается preload (загрузка моделей),
+    затем объекты Python переносятся в постоянное поколение сборщика мусора
+    (gc.freeze): сборщик не обходит их в рабочих процессах и не копирует
+    страницы с их заголовками.
+
+    Сигналы родительскому процессу:
+        SIGTERM, SIGINT - плавная остановка (повторный сигнал - немедленная)
+        SIGHUP - плавный перезапуск рабочих процессов: новые процессы
+            запускаются от родителя (модели уже загружены), старые
+            завершают выполняющиеся запросы. Код и модели не перезагружаются
+
+    Args:
+        app: WSGI-приложение
+        host (str): адрес
+        port (int): порт
+        workers (int): количество рабочих процессов
+        graceful_timeout (float): сколько ждать выполняющихся запросов при остановке, секунд
+        preload (Callable | None): загрузка моделей в родительском процессе
+        post_fork (Callable[[int], None] | None): настройка рабочего процесса (номер процесса)
+        worker_exit (Callable | None): вызывается в рабочем процессе после последнего запроса
+    """
+
+    def __init__(
+            self,
+            app,
+            host: str = '127.0.0.1',
+            port: int = 8080,
+            workers: int = DEFAULT_WORKERS,
+            graceful_timeout: float = DEFAULT_GRACEFUL_TIMEOUT,
+            preload: Optional[Callable[[], None]] = None,
+            post_fork: Optional[Callable[[int], None]] = None,
+            worker_exit: Optional[Callable[[], None]] = None
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.preload = preload
+        self.post_fork = post_fork
+        self.worker_exit = worker_exit
+
+        # pid -> (номер процесса, время запуска)
+        self.__workers: Dict[int, tuple[int, float]] = {}
+        # Процессы, которым отправлен SIGTERM: pid -> срок завершения
+        self.__retiring: Dict[int, float] = {}
+        self.__signals: deque = deque()
+        self.__socket: Optional[socket.socket] = None
+        self.__wakeup_fds: Optional[tuple[int, int]] = None
+        self.__restart_delay = RESTART_DELAY
+        self.__next_spawn_at = 0.0
+        self.__stopping = False
+
+    @property
+    def worker_pids(self) -> list[int]:
+        """Рабочие процессы, принимающие соединения"""
+        return [pid for pid in self.__workers if pid not in self.__retiring]
+
+    def run(self) -> None:
+        """Загружает модели, запускает рабочие процессы и наблюдает за ними до остановки"""
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Pre-fork сервер работает только на POSIX (Linux, macOS): используйте python app.py')
+
+        if self.preload is not None:
+            start = time.perf_counter()
+            self.preload()
+            print(f'Модели загружены в родительском процессе за {time.perf_counter() - start:.1f} сек')
+        # CUDA не переживает fork: рабочие процессы упадут при первом обращении к GPU
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_initialized():
+            raise RuntimeError('CUDA инициализирована до fork: загрузите модели на CPU или используйте один процесс')
+        # Объекты, созданные до fork, сборщик мусора больше не обходит
+        gc.collect()
+        gc.freeze()
+
+        self.__socket = socket.create_server((self.host, self.port), backlog=LISTEN_BACKLOG)
+        self.__install_signals()
+        print(f'ICEQ: pre-fork сервер http://{self.host}:{self.port}, рабочих процессов: {self.workers} (pid {os.getpid()})')
+        try:
+            for index in range(self.workers):
+                self.__spawn(index)
+            self.__supervise()
+            print('ICEQ: pre-fork сервер остановлен')
+        finally:
+            self.__socket.close()
+            signal.set_wakeup_fd(-1)
+            for fd in self.__wakeup_fds:
+                os.close(fd)
+
+    # ---------- Родительский процесс ----------
+
+    def __install_signals(self) -> None:
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self.__wakeup_fds = (read_fd, write_fd)
+        # Сигнал будит select в цикле наблюдения; обработчик только запоминает его
+        signal.set_wakeup_fd(write_fd)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self.__on_signal)
+
+    def __on_signal(self, signum, frame) -> None:
+        self.__signals.append(signum)
+
+    def __supervise(self) -> None:
+        while self.__workers or not self.__stopping:
+            try:
+                select.select([self.__wakeup_fds[0]], [], [], SUPERVISE_INTERVAL)
+            except InterruptedError:
+                pass
+            try:
+                while os.read(self.__wakeup_fds[0], 512):
+                    pass
+            except BlockingIOError:
+                pass
+
+            while self.__signals:
+                self.__handle_signal(self.__signals.popleft())
+            self.__reap()
+            self.__kill_overdue()
+            if not self.__stopping:
+                self.__replace_missing()
+
+    def __handle_signal(self, signum: int) -> None:
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            if self.__stopping:
+                print('ICEQ: немедленная остановка рабочих процессов')
+                for pid in self.__workers:
+                    self.__kill(pid, signal.SIGKILL)
+                return
+            print(f'ICEQ: плавная остановка, ожидание выполняющихся запросов (до {self.graceful_timeout:.0f} сек)')
+            self.__stopping = True
+            for pid in list(self.__workers):
+                self.__retire(pid)
+        elif signum == signal.SIGHUP and not self.__stopping:
+            old = self.worker_pids
+            print(f'ICEQ: плавный перезапуск {len(old)} рабочих процессов')
+            # Новые процессы принимают соединения до остановки старых
+            for pid in old:
+                self.__spawn(self.__workers[pid][0])
+                self.__retire(pid)
+
+    def __retire(self, pid: int) -> None:
+        self.__retiring[pid] = time.monotonic() + self.graceful_timeout
+        self.__kill(pid, signal.SIGTERM)
+
+    @staticmethod
+    def __kill(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def __kill_overdue(self) -> None:
+        now = time.monotonic()
+        for pid, deadline in self.__retiring.items():
+            if now > deadline:
+                print(f'⚠️ Рабочий процесс {pid} не завершился за {self.graceful_timeout:.0f} сек, SIGKILL')
+                self.__kill(pid, signal.SIGKILL)
+                # Повторно не убиваем
+                self.__retiring[pid] = float('inf')
+
+    def __reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index, started_at = self.__workers.pop(pid, (None, None))
+            retired = self.__retiring.pop(pid, None) is not None
+            if index is None or retired:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            lifetime = time.monotonic() - started_at
+            print(f'⚠️ Рабочий процесс {index} (pid {pid}) завершился с кодом {code} через {lifetime:.1f} сек')
+            if lifetime < MIN_WORKER_LIFETIME:
+                # Процесс падает при запуске - не перезапускаем его в цикле без паузы
+                self.__next_spawn_at = time.monotonic() + self.__restart_delay
+                self.__restart_delay = min(self.__restart_delay * 2, MAX_RESTART_DELAY)
+            else:
+                self.__restart_delay = RESTART_DELAY
+
+    def __replace_missing(self) -> None:
+        if time.monotonic() < self.__next_spawn_at:
+            return
+        active = {self.__workers[pid][0] for pid in self.worker_pids}
+        for index in range(self.workers):
+            if index not in active:
+                self.__spawn(index)
+
+    def __spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.__workers[pid] = (index, time.monotonic())
+            return
+
+        # Рабочий процесс: не возвращается в код родителя
+        code = 0
+        try:
+            self.__run_worker(index)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Без обработчиков atexit родительского процесса
+            os._exit(code)
+
+    # ---------- Рабочий процесс ----------
+
+    def __run_worker(self, index: int) -> None:
+        from werkzeug.serving import make_server
+
+        signal.set_wakeup_fd(-1)
+        for fd in self.__wakeup_fds:
+            os.close(fd)
+        for signum in (signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        # Ctrl+C получает вся группа процессов - остановкой управляет родитель
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        if self.post_fork is not None:
+            self.post_fork(index)
+
+        server = make_server(self.host, self.port, self.app, threaded=True, fd=self.__socket.fileno())
+        # server_close дожидается потоков выполняющихся запросов
+        server.daemon_threads = False
+        self.__socket.close()
+
+        def shutdown(signum, frame):
+            # shutdown ждёт выхода serve_forever, поэтому вызывается не из основного потока
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        print(f'Рабочий процесс {index} запущен (pid {os.getpid()})')
+        try:
+            server.serve_forever()
+        except OSError as e:
+            if e.errno != errno.EBADF:
+                raise
+        finally:
+            server.server_close()
+            if self.worker_exit is not None:
+                self.worker_exit()
+        print(f'Рабочий процесс {index} (pid {os.getpid()}) остановлен')
@@ -0,0 +1,115 @@
+'''
+ICEQ (2025) - Prompt lookup decoding для локальной модели ICEQ
+
+Основной функционал:
+- Параметры generate для prompt lookup decoding: черновик продолжения
+  копируется из промпта по совпадению последней n-граммы и проверяется
+  моделью за один проход (без отдельной черновой модели). Ответы ICEQ
+  цитируют текст чанков, поэтому часть черновиков принимается целиком
+- Подсчёт сгенерированных токенов и проходов модели через интерфейс
+  streamer метода generate
+- Накопительная статистика: токенов на проход модели и токенов в секунду
+
+Пример использования:
+    >>> counter = DecodingCounter()
+    >>> model.generate(**inputs, **prompt_lookup_kwargs(10), streamer=counter)
+    >>> stats.record(counter, seconds)
+    >>> stats.stats()['tokens_per_step']
+'''
+
+import threading
+
+# Длина n-граммы (в токенах), по которой ищется совпадение в промпте;
+# при отсутствии совпадения ищутся более короткие n-граммы
+DEFAULT_NGRAM_SIZE = 3
+
+
+def prompt_lookup_kwargs(num_tokens: int, ngram_size: int = DEFAULT_NGRAM_SIZE) -> dict:
+    """
+    Параметры generate для prompt lookup decoding
+
+    Работает только для батча из одного запроса.
+
+    Args:
+        num_tokens (int): сколько токенов черновика брать из промпта за один шаг
+        ngram_size (int): максимальная длина n-граммы для поиска совпадения
+
+    Returns:
+        dict: prompt_lookup_num_tokens и max_matching_ngram_size
+    """
+    return {'prompt_lookup_num_tokens': num_tokens, 'max_matching_ngram_size': ngram_size}
+
+
+class DecodingCounter:
+    """
+    Streamer для generate, считающий сгенерированные токены и проходы модели
+
+    generate передаёт в streamer сначала промпт, а затем токены каждого шага:
+    при обычном декодировании - один токен за проход модели, при prompt lookup
+    decoding - принятые токены черновика и токен модели. Вызовы передаются
+    во вложенный streamer (например, TextIteratorStreamer).
+
+    Черновик prompt lookup decoding не ограничивается оставшейся длиной
+    ответа, поэтому последний шаг может выйти за max_new_tokens: токены
+    сверх max_new_tokens не считаются и не передаются во вложенный streamer.
+
+    Args:
+        streamer: вложенный streamer или None
+        max_new_tokens (int | None): максимальная длина ответа
+    """
+
+    def __init__(self, streamer=None, max_new_tokens: int | None = None):
+        self.streamer = streamer
+        self.max_new_tokens = max_new_tokens
+        self.tokens = 0
+        self.steps = 0
+        self.__prompt_received = False
+
+    def put(self, value) -> None:
+        if self.__prompt_received:
+            if self.max_new_tokens is not None:
+                value = value.reshape(-1)[:max(0, self.max_new_tokens - self.tokens)]
+                if not value.numel():
+                    return
+            self.tokens += int(value.numel())
+            self.steps += 1
+        self.__prompt_received = True
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self) -> None:
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class DecodingStats:
+    """Накопительная статистика генераций с prompt lookup decoding"""
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens = 0
+        self.steps = 0
+        self.seconds = 0.0
+        self.__lock = threading.Lock()
+
+    def record(self, counter: DecodingCounter, seconds: float) -> None:
+        with self.__lock:
+            self.requests += 1
+            self.tokens += counter.tokens
+            self.steps += counter.steps
+            self.seconds += seconds
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: запросы, токены, проходы модели, токенов на проход
+                (1 + принятые токены черновика) и токенов в секунду
+        """
+        with self.__lock:
+            return {
+                'requests': self.requests,
+                'tokens': self.tokens,
+                'steps': self.steps,
+                'tokens_per_step': round(self.tokens / self.steps, 3) if self.steps else 0.0,
+                'tokens_per_second': round(self.tokens / self.seconds, 1) if self.seconds else 0.0
+            }
@@ -4,6 +4,9 @@ API модуль для генерации вопросов через DeepSeek
 Этот модуль содержит асинхронные функции для взаимодействия с внешними API:
 - generate_questions_deepseek: использует DeepSeek API для генерации вопросов
 - generate_questions_qwen: использует Qwen API для генерации вопросов
+- stream_questions_deepseek / stream_questions_qwen: то же, но ответ отдаётся по частям
+- ProviderClient: долгоживущий клиент с пулом keep-alive соединений и общим
+  фоновым циклом событий для вызова API из синхронного кода (потоков Flask)
 - test_question_generation: тестовая функция для проверки работоспособности API
 
 Требует настройки переменных окружения:
@@ -11,43 +14,22 @@ API модуль для генерации вопросов через DeepSeek
 - CHUTES_API_KEY: ключ для Qwen API
 """
 
-import aiohttp
+from functools import lru_cache
+from typing import Iterator
+
 import asyncio
+import atexit
 import json
 import os
 import re
-from dotenv import load_dotenv
-
-# Загружаем переменные окружения с обработкой кодировок
-try:
-    # Явно указываем путь к .env в корневой директории
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    env_path = os.path.join(project_root, '.env')
-
-    if os.path.exists(env_path):
-        loaded_successfully = False
-        # Пробуем разные кодировки, чтобы справиться с BOM в Windows
-        for encoding in ['utf-8-sig', 'utf-16', 'utf-8', 'cp1251']:
-            try:
-                # override=True чтобы новые значения заменили старые, если они есть
-                if load_dotenv(dotenv_path=env_path, encoding=encoding, override=True):
-                    loaded_successfully = True
-                    break  # Выходим из цикла при успехе
-            except Exception:
-                continue # Пробуем следующую кодировку
-
-        if not loaded_successfully:
-            print("⚠️ Не удалось загрузить .env файл. Пожалуйста, сохраните его в кодировке UTF-8.")
-    else:
-        # Fallback, если .env не найден в корне
-        if load_dotenv(override=True):
-            print("ℹ️ .env файл в корне не найден, используется стандартный поиск.")
-        else:
-            print("⚠️ .env файл не найден ни в одном из стандартных мест.")
+import time
+import threading
 
-except Exception as e:
-    print(f"⚠️ Критическая ошибка при загрузке .env: {e}")
+from env_loader import load_environment
+from metrics import LLM_REQUEST_SECONDS, LLM_TTFT_SECONDS, LLM_ERRORS
+
+# Загружаем переменные окружения (однократно для всех модулей)
+load_environment()
 
 
 def analyze_text_sufficiency(text: str, num_questions: int) -> dict:
@@ -133,32 +115,44 @@ def analyze_text_sufficiency(text: str, num_questions: int) -> dict:
     }
 
 
-async def generate_questions_deepseek(text: str, num_questions: int = 5):
-    """
-    Генерирует вопросы по тексту используя DeepSeek API
-    
-    Args:
-        text (str): Текст для генерации вопросов
-        num_questions (int): Количество вопросов для генерации (по умолчанию 5)
-    
-    Returns:
-        str: Сгенерированные вопросы в текстовом формате
-        
-    Raises:
-        ValueError: Если не найден API ключ DeepSeek
-        Exception: При ошибках API запроса
-    """
-    api_token = os.getenv('DEEPSEEK_API_KEY')
-    
-    if not api_token:
-        raise ValueError("DEEPSEEK_API_KEY не найден в переменных окружения")
+# Адрес OpenAI-совместимого API chutes.ai
+CHUTES_API_URL = "https://llm.chutes.ai/v1/chat/completions"
+# Таймаут установления соединения с API, секунд
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# Максимальная пауза между частями потокового ответа, секунд
+DEFAULT_READ_TIMEOUT = 120.0
+# Максимальное количество одновременных соединений с API
+DEFAULT_POOL_SIZE = 16
+# Время жизни простаивающего keep-alive соединения, секунд
+KEEPALIVE_TIMEOUT = 60.0
 
-    headers = {
-        "Authorization": "Bearer " + api_token,
-        "Content-Type": "application/json"
+# Параметры провайдеров: модель, переменная окружения с ключом и отображаемое имя
+PROVIDERS = {
+    'deepseek': {
+        'model': "deepseek-ai/DeepSeek-V3-0324",
+        'api_key_env': 'DEEPSEEK_API_KEY',
+        'display_name': 'DeepSeek'
+    },
+    'qwen': {
+        'model': "Qwen/Qwen3-235B-A22B",
+        'api_key_env': 'CHUTES_API_KEY',
+        'display_name': 'Qwen'
     }
+}
+# Все LLM генерации: API-провайдеры и локальная модель ICEQ
+LLMS = (*PROVIDERS, 'iceq')
+
 
-    # Загружаем промпты из файлов
+@lru_cache(maxsize=1)
+def _load_prompts() -> tuple[str, str]:
+    """
+    Загружает системный промпт и шаблон пользовательского промпта из файлов
+
+    Файлы читаются один раз за время работы процесса.
+
+    Returns:
+        tuple[str, str]: (системный промпт, шаблон пользовательского промпта)
+    """
     try:
         # Определяем текущую директорию для поиска файлов промптов
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -179,6 +173,38 @@ async def generate_questions_deepseek(text: str, num_questions: int = 5):
         system_prompt = "Ты - эксперт по созданию образовательных тестов."
         user_prompt_template = "Создай [QUESTIONS_NUM] вопросов по тексту: [CHUNKS]"
         print("⚠️ Используются fallback промпты")
+
+    return system_prompt, user_prompt_template
+
+
+def _build_request(provider: str, text: str, num_questions: int) -> tuple[dict, dict]:
+    """
+    Формирует заголовки и тело запроса к API провайдера
+
+    Args:
+        provider (str): провайдер ('deepseek' или 'qwen')
+        text (str): Текст для генерации вопросов
+        num_questions (int): Количество вопросов для генерации
+
+    Returns:
+        tuple[dict, dict]: (заголовки, тело запроса)
+
+    Raises:
+        ValueError: Если не найден API ключ провайдера
+    """
+    config = PROVIDERS[provider]
+    api_token = os.getenv(config['api_key_env'])
+    
+    if not api_token:
+        raise ValueError(f"{config['api_key_env']} не найден в переменных окружения")
+
+    headers = {
+        "Authorization": "Bearer " + api_token,
+        "Content-Type": "application/json"
+    }
+
+    # Загружаем промпты (из кэша после первого чтения)
+    system_prompt, user_prompt_template = _load_prompts()
     
     # Формируем пользовательский промпт, заменяя плейсхолдеры
     user_prompt = user_prompt_template.replace('[QUESTIONS_NUM]', str(num_questions))
@@ -186,7 +212,7 @@ async def generate_questions_deepseek(text: str, num_questions: int = 5):
     
     # Формируем тело запроса к API
     body = {
-        "model": "deepseek-ai/DeepSeek-V3-0324",
+        "model": config['model'],
         "messages": [
             {
                 "role": "system",
@@ -200,21 +226,59 @@ async def generate_questions_deepseek(text: str, num_questions: int = 5):
         "stream": True,  # Включаем потоковую передачу
         "temperature": 0.3  # Низкая температура для более предсказуемых результатов
     }
+    return headers, body
+
+
+async def stream_questions(
+        provider: str,
+        text: str,
+        num_questions: int = 5,
+        session=None,
+        api_url: str = CHUTES_API_URL
+):
+    """
+    Генерирует вопросы через API провайдера, отдавая ответ по частям
+
+    Args:
+        provider (str): провайдер ('deepseek' или 'qwen')
+        text (str): Текст для генерации вопросов
+        num_questions (int): Количество вопросов для генерации (по умолчанию 5)
+        session (aiohttp.ClientSession | None): сессия с пулом соединений;
+            если не задана, открывается отдельная сессия на один запрос
+        api_url (str): адрес chat/completions API
+
+    Yields:
+        str: очередная часть ответа модели (delta.content из SSE потока)
+
+    Raises:
+        ValueError: Если не найден API ключ провайдера
+        Exception: При ошибках API запроса
+    """
+    headers, body = _build_request(provider, text, num_questions)
+
+    if session is None:
+        # aiohttp импортируется лениво, чтобы не замедлять импорт модуля
+        import aiohttp
+
+        async with aiohttp.ClientSession() as own_session:
+            async for content in stream_questions(provider, text, num_questions, own_session, api_url):
+                yield content
+        return
 
-    full_response = ""
-    
     # Выполняем асинхронный запрос к API
-    async with aiohttp.ClientSession() as session:
+    start = time.perf_counter()
+    first_content = True
+    try:
         async with session.post(
-                "https://llm.chutes.ai/v1/chat/completions",
+                api_url,
                 headers=headers,
                 json=body
         ) as response:
             # Проверяем статус ответа
             if response.status != 200:
                 error_text = await response.text()
-                raise Exception(f"Ошибка API DeepSeek: {response.status} - {error_text}")
-                
+                raise Exception(f"Ошибка API {PROVIDERS[provider]['display_name']}: {response.status} - {error_text}")
+
             # Обрабатываем потоковый ответ
             async for line in response.content:
                 line = line.decode("utf-8").strip()
@@ -228,18 +292,204 @@ async def generate_questions_deepseek(text: str, num_questions: int = 5):
                         if 'choices' in chunk_json and len(chunk_json['choices']) > 0:
                             delta = chunk_json['choices'][0].get('delta', {})
                             if 'content' in delta and delta['content']:
-                                content = delta['content']
-                                full_response += content
+                                if first_content:
+                                    LLM_TTFT_SECONDS.observe(time.perf_counter() - start, llm=provider)
+                                    first_content = False
+                                yield delta['content']
                     except json.JSONDecodeError:
                         # Пропускаем некорректные JSON чанки
                         continue
-    
-    return full_response
+    except Exception:
+        LLM_ERRORS.inc(llm=provider)
+        raise
 
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, llm=provider)
 
-async def generate_questions_qwen(text: str, num_questions: int = 5):
+
+class ProviderClient:
     """
-    Генерирует вопросы по тексту используя Qwen API
+    Долгоживущий клиент API провайдеров для синхронного кода
+
+    Все запросы выполняются в одном фоновом цикле событий через одну
+    aiohttp-сессию: соединения с API переиспользуются (keep-alive), а потоки
+    Flask не создают собственный цикл событий на каждый запрос. Цикл и сессия
+    создаются при первом запросе.
+
+    Attributes:
+        api_url (str): адрес chat/completions API
+        connect_timeout (float): таймаут установления соединения, секунд
+        read_timeout (float): максимальная пауза между частями ответа, секунд
+        pool_size (int): максимальное количество одновременных соединений
+    """
+
+    def __init__(
+            self,
+            api_url: str = CHUTES_API_URL,
+            connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+            read_timeout: float = DEFAULT_READ_TIMEOUT,
+            pool_size: int = DEFAULT_POOL_SIZE
+    ):
+        self.api_url = api_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__session = None
+        self.__lock = threading.Lock()
+
+    def __ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='provider-client-loop', daemon=True).start()
+                self.__loop = loop
+                atexit.register(self.close)
+            return self.__loop
+
+    async def __get_session(self):
+        # Выполняется только в фоновом цикле, поэтому блокировка не нужна
+        if self.__session is None or self.__session.closed:
+            import aiohttp
+
+            self.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=KEEPALIVE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    connect=self.connect_timeout,
+                    sock_read=self.read_timeout
+                )
+            )
+        return self.__session
+
+    async def __stream(self, provider: str, text: str, num_questions: int):
+        session = await self.__get_session()
+        async for content in stream_questions(provider, text, num_questions, session, self.api_url):
+            yield content
+
+    async def __collect(self, provider: str, text: str, num_questions: int) -> str:
+        return ''.join([content async for content in self.__stream(provider, text, num_questions)])
+
+    def generate(self, provider: str, text: str, num_questions: int = 5) -> str:
+        """
+        Генерирует вопросы и возвращает полный ответ модели
+
+        Args:
+            provider (str): провайдер ('deepseek' или 'qwen')
+            text (str): Текст для генерации вопросов
+            num_questions (int): Количество вопросов
+
+        Returns:
+            str: ответ модели
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.__collect(provider, text, num_questions),
+            self.__ensure_loop()
+        )
+        return future.result()
+
+    async def __collect_many(self, provider: str, requests: list[tuple[str, int]], concurrency: int) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def collect_one(text: str, num_questions: int) -> str:
+            async with semaphore:
+                return await self.__collect(provider, text, num_questions)
+
+        return await asyncio.gather(
+            *(collect_one(text, num_questions) for text, num_questions in requests),
+            return_exceptions=True
+        )
+
+    def generate_many(
+            self,
+            provider: str,
+            requests: list[tuple[str, int]],
+            concurrency: int = DEFAULT_POOL_SIZE
+    ) -> list:
+        """
+        Выполняет несколько запросов генерации одновременно
+
+        Args:
+            provider (str): провайдер ('deepseek' или 'qwen')
+            requests (list[tuple[str, int]]): пары (текст, количество вопросов)
+            concurrency (int): максимальное количество одновременных запросов
+
+        Returns:
+            list[str | Exception]: ответы в порядке запросов; ошибка отдельного
+                запроса возвращается как исключение, не прерывая остальные
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.__collect_many(provider, requests, concurrency),
+            self.__ensure_loop()
+        )
+        return future.result()
+
+    def stream(self, provider: str, text: str, num_questions: int = 5) -> Iterator[str]:
+        """
+        Генерирует вопросы, отдавая ответ модели по частям
+
+        Args:
+            provider (str): провайдер ('deepseek' или 'qwen')
+            text (str): Текст для генерации вопросов
+            num_questions (int): Количество вопросов
+
+        Yields:
+            str: очередная часть ответа модели
+        """
+        loop = self.__ensure_loop()
+        stream = self.__stream(provider, text, num_questions)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(stream.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), loop).result()
+
+    def close(self) -> None:
+        """Закрывает соединения и останавливает фоновый цикл событий"""
+        with self.__lock:
+            loop, self.__loop = self.__loop, None
+        if loop is None:
+            return
+
+        async def close_session():
+            if self.__session is not None:
+                await self.__session.close()
+                self.__session = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+async def stream_questions_deepseek(text: str, num_questions: int = 5):
+    """
+    Генерирует вопросы по тексту используя DeepSeek API, отдавая ответ по частям
+
+    Yields:
+        str: очередная часть ответа модели
+    """
+    async for content in stream_questions('deepseek', text, num_questions):
+        yield content
+
+
+async def stream_questions_qwen(text: str, num_questions: int = 5):
+    """
+    Генерирует вопросы по тексту используя Qwen API, отдавая ответ по частям
+
+    Yields:
+        str: очередная часть ответа модели
+    """
+    async for content in stream_questions('qwen', text, num_questions):
+        yield content
+
+
+async def generate_questions_deepseek(text: str, num_questions: int = 5):
+    """
+    Генерирует вопросы по тексту используя DeepSeek API
     
     Args:
         text (str): Текст для генерации вопросов
@@ -249,96 +499,29 @@ async def generate_questions_qwen(text: str, num_questions: int = 5):
         str: Сгенерированные вопросы в текстовом формате
         
     Raises:
-        ValueError: Если не найден API ключ Qwen
+        ValueError: Если не найден API ключ DeepSeek
         Exception: При ошибках API запроса
     """
-    api_token = os.getenv('CHUTES_API_KEY')
-    
-    if not api_token:
-        raise ValueError("CHUTES_API_KEY не найден в переменных окружения")
+    # Части собираются в список и объединяются один раз
+    return ''.join([content async for content in stream_questions('deepseek', text, num_questions)])
 
-    headers = {
-        "Authorization": "Bearer " + api_token,
-        "Content-Type": "application/json"
-    }
 
-    # Загружаем промпты из файлов
-    try:
-        # Определяем текущую директорию для поиска файлов промптов
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        system_prompt_path = os.path.join(current_dir, 'system_prompt.txt')
-        user_prompt_path = os.path.join(current_dir, 'user_prompt.txt')
-        
-        # Читаем системный и пользовательский промпты
-        with open(system_prompt_path, 'r', encoding='utf8') as f:
-            system_prompt = f.read()
-        with open(user_prompt_path, 'r', encoding='utf8') as f:
-            user_prompt_template = f.read()
-            
-        print("Промпты загружены из файлов")
-        
-    except FileNotFoundError as e:
-        print(f"❌ Ошибка загрузки промптов: {e}")
-        # Fallback промпты на случай отсутствия файлов
-        system_prompt = "Ты - эксперт по созданию образовательных тестов."
-        user_prompt_template = "Создай [QUESTIONS_NUM] вопросов по тексту: [CHUNKS]"
-        print("⚠️ Используются fallback промпты")
-    
-    # Формируем пользовательский промпт
-    user_prompt = user_prompt_template.replace('[QUESTIONS_NUM]', str(num_questions))
-    user_prompt = user_prompt.replace('[CHUNKS]', text)
-    
-    # Формируем тело запроса к API
-    body = {
-        "model": "Qwen/Qwen3-235B-A22B",
-        "messages": [
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": user_prompt
-            }
-        ],
-        "stream": True,  # Включаем потоковую передачу
-        "temperature": 0.3  # Низкая температура для более предсказуемых результатов
-    }
-
-    full_response = ""
+async def generate_questions_qwen(text: str, num_questions: int = 5):
+    """
+    Генерирует вопросы по тексту используя Qwen API
     
-    # Выполняем асинхронный запрос к API
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-                "https://llm.chutes.ai/v1/chat/completions",
-                headers=headers,
-                json=body
-        ) as response:
-            # Проверяем статус ответа
-            if response.status != 200:
-                error_text = await response.text()
-                raise Exception(f"Ошибка API Qwen: {response.status} - {error_text}")
-                
-            # Обрабатываем потоковый ответ
-            async for line in response.content:
-                line = line.decode("utf-8").strip()
-                if line.startswith("data: "):
-                    data = line[6:]  # Убираем префикс "data: "
-                    if data == "[DONE]":
-                        break
-                    try:
-                        # Парсим JSON чанк
-                        chunk_json = json.loads(data)
-                        if 'choices' in chunk_json and len(chunk_json['choices']) > 0:
-                            delta = chunk_json['choices'][0].get('delta', {})
-                            if 'content' in delta and delta['content']:
-                                content = delta['content']
-                                full_response += content
-                    except json.JSONDecodeError:
-                        # Пропускаем некорректные JSON чанки
-                        continue
+    Args:
+        text (str): Текст для генерации вопросов
+        num_questions (int): Количество вопросов для генерации (по умолчанию 5)
     
-    return full_response
+    Returns:
+        str: Сгенерированные вопросы в текстовом формате
+        
+    Raises:
+        ValueError: Если не найден API ключ Qwen
+        Exception: При ошибках API запроса
+    """
+    return ''.join([content async for content in stream_questions('qwen', text, num_questions)])
 
 
 async def test_question_generation():
@@ -0,0 +1,331 @@
+'''
+ICEQ (2025) - Инкрементальный разбор вопросов из ответа модели
+
+Основной функционал:
+- Приём ответа модели по частям (дельтам потока)
+- Выдача каждого вопроса, как только он полностью получен
+- Поддержка JSON-формата, нумерованного формата с +/-/! строками и
+  упрощённого формата ICEQ (Вопрос: / Варианты: A) ... / Ответ: A)
+- Ограниченное состояние: в буфере хранится только незавершённый объект
+  или незавершённая строка
+- Счётчики отброшенных вопросов (metrics.PARSE_FAILURES)
+
+Пример использования:
+    >>> parser = IncrementalQuestionParser()
+    >>> for delta in stream:
+    ...     for question in parser.feed(delta):
+    ...         print(question['question'])
+    >>> remaining = parser.close()
+    >>> questions = parse_questions(full_response)  # разбор ответа целиком
+'''
+
+from typing import List, Optional
+
+import re
+import json
+
+from metrics import PARSE_FAILURES
+
+# Заголовок вопроса в нумерованном формате: "1. Текст вопроса?"
+QUESTION_HEADER_PATTERN = re.compile(r'^\s*(\d+)\.\s*(.+)')
+# Вариант ответа: "+ правильный" или "- неправильный"
+ANSWER_LINE_PATTERN = re.compile(r'^\s*([+-])\s*(.+)')
+# Объяснение: "! текст объяснения"
+EXPLANATION_LINE_PATTERN = re.compile(r'^\s*!\s*(.+)')
+# Упрощённый формат ICEQ: "1. Вопрос: текст"
+ICEQ_QUESTION_PREFIX_PATTERN = re.compile(r'^Вопрос:\s*', re.IGNORECASE)
+# Строка с вариантами: "Варианты: A) ... B) ..." или "A) ..."
+ICEQ_VARIANTS_LINE_PATTERN = re.compile(r'^\s*(?:Варианты:\s*)?(?=[ABCD]\))', re.IGNORECASE)
+# Один вариант внутри строки с вариантами
+ICEQ_VARIANT_PATTERN = re.compile(r'([ABCD])\)\s*(.+?)(?=\s+[ABCD]\)|\s*$)')
+# Правильный ответ: "Ответ: A"
+ICEQ_CORRECT_PATTERN = re.compile(r'^\s*Ответ:\s*([ABCD])', re.IGNORECASE)
+# Структурные символы JSON вне строк и символы, завершающие строку
+JSON_STRUCTURE_PATTERN = re.compile(r'[\[\]{}"]')
+JSON_STRING_PATTERN = re.compile(r'["\\]')
+
+
+def convert_json_question(item: dict) -> Optional[dict]:
+    """
+    Конвертирует вопрос из JSON-формата модели во внутренний формат
+
+    Args:
+        item (dict): {'question': ..., 'options': [...], 'correct_answer': номер с 1, 'explanation': ...}
+
+    Returns:
+        dict | None: вопрос во внутреннем формате или None, если полей не хватает
+    """
+    if not isinstance(item, dict) or not all(key in item for key in ('question', 'options', 'correct_answer')):
+        return None
+
+    answers = []
+    for i, option in enumerate(item['options'], 1):
+        answers.append({
+            'answer': option,
+            'is_correct': (i == item['correct_answer'])
+        })
+
+    return {
+        'question': item['question'],
+        'answers': answers,
+        'explanation': item.get('explanation', '')
+    }
+
+
+def parse_questions(text_questions: str) -> List[dict]:
+    """
+    Парсит ответ модели целиком и возвращает структурированный список вопросов
+
+    Args:
+        text_questions (str): ответ модели (JSON, нумерованный формат или формат ICEQ)
+
+    Returns:
+        list[dict]: Список структурированных вопросов
+    """
+    parser = IncrementalQuestionParser()
+    return parser.feed(text_questions) + parser.close()
+
+
+class IncrementalQuestionParser:
+    """
+    Потоковый парсер вопросов
+
+    Формат определяется по первому значащему символу: '[' - JSON-массив
+    вопросов, иначе - построчный формат. В JSON-формате вопрос выдаётся при
+    закрытии объекта. В построчном формате вопрос считается завершённым после
+    строки с объяснением ('!') или с правильным ответом ('Ответ: A'), либо
+    при появлении заголовка следующего вопроса.
+
+    Args:
+        record_failures (bool): записывать отброшенные вопросы в метрики
+            (False - для вспомогательного разбора, например при остановке
+            генерации, чтобы ответ не учитывался дважды)
+    """
+
+    def __init__(self, record_failures: bool = True):
+        self.record_failures = record_failures
+        self.__mode: Optional[str] = None
+        self.__buffer = ''
+        self.__done: List[dict] = []
+        self.__emitted = 0
+
+        # Состояние построчного формата
+        self.__current: Optional[dict] = None
+        # Буквы вариантов текущего вопроса в формате ICEQ (None - нумерованный формат)
+        self.__letters: Optional[List[str]] = None
+
+        # Состояние JSON-формата
+        self.__depth = 0
+        self.__in_string = False
+        self.__object_start: Optional[int] = None
+        self.__scan_position = 0
+
+    @property
+    def buffer_size(self) -> int:
+        """Количество символов, ожидающих завершения объекта или строки"""
+        return len(self.__buffer)
+
+    def feed(self, delta: str) -> List[dict]:
+        """
+        Принимает очередную часть ответа
+
+        Args:
+            delta (str): новая часть текста
+
+        Returns:
+            list[dict]: вопросы, завершённые этой частью
+        """
+        if self.__mode == 'json' and JSON_STRUCTURE_PATTERN.search(delta) is None and '\\' not in delta:
+            # В части нет ни структурных символов, ни кавычек - состояние не меняется
+            self.__buffer += delta
+            self.__scan_position = len(self.__buffer)
+            return []
+
+        self.__buffer += delta
+
+        if self.__mode is None:
+            stripped = self.__buffer.lstrip()
+            if stripped and '```'.startswith(stripped):
+                # Открывающее ограждение разбито на части - формат определится по следующим
+                return []
+            if stripped.startswith('```'):
+                # Пропускаем строку с открывающим ограждением ```json
+                if '\n' not in stripped:
+                    return []
+                stripped = stripped.split('\n', 1)[1].lstrip()
+            if not stripped:
+                return []
+            self.__mode = 'json' if stripped.startswith('[') else 'lines'
+            if self.__mode == 'json':
+                self.__buffer = stripped
+
+        if self.__mode == 'json':
+            self.__scan_json()
+        elif '\n' in delta:
+            self.__scan_lines(final=False)
+        # Иначе строка ещё не завершена - разбирать нечего
+
+        done, self.__done = self.__done, []
+        self.__emitted += len(done)
+        return done
+
+    def close(self) -> List[dict]:
+        """
+        Завершает разбор и возвращает оставшиеся вопросы
+
+        Returns:
+            list[dict]: вопросы, завершённые концом ответа
+        """
+        if self.__mode == 'lines':
+            self.__scan_lines(final=True)
+            self.__finish_current()
+
+        done, self.__done = self.__done, []
+        if self.__mode is not None and self.__emitted + len(done) == 0:
+            # Ответ получен, но ни одного вопроса в нём не нашлось
+            self.__record_failure(format=self.__mode, reason='no_questions')
+        return done
+
+    def __record_failure(self, **labels) -> None:
+        if self.record_failures:
+            PARSE_FAILURES.inc(**labels)
+
+    def __scan_json(self) -> None:
+        buffer = self.__buffer
+        position = self.__scan_position
+        length = len(buffer)
+
+        # Переходим сразу к следующему значимому символу, не перебирая текст посимвольно
+        while position < length:
+            if self.__in_string:
+                match = JSON_STRING_PATTERN.search(buffer, position)
+                if match is None:
+                    position = length
+                elif match.group() == '\\':
+                    if match.end() == length:
+                        # Экранированный символ ещё не получен
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                else:
+                    self.__in_string = False
+                    position = match.end()
+                continue
+
+            match = JSON_STRUCTURE_PATTERN.search(buffer, position)
+            if match is None:
+                position = length
+                break
+
+            char = match.group()
+            position = match.end()
+            if char == '"':
+                self.__in_string = True
+            elif char in '[{':
+                self.__depth += 1
+                if char == '{' and self.__depth == 2:
+                    self.__object_start = match.start()
+            else:
+                self.__depth -= 1
+                if char == '}' and self.__depth == 1 and self.__object_start is not None:
+                    self.__emit_json(buffer[self.__object_start:position])
+                    self.__object_start = None
+
+        # Оставляем в буфере только незавершённый объект (уже просканированную часть не сканируем повторно)
+        keep = self.__object_start if self.__object_start is not None else min(position, length)
+        self.__buffer = buffer[keep:]
+        self.__scan_position = position - keep
+        if self.__object_start is not None:
+            self.__object_start = 0
+
+    def __emit_json(self, object_text: str) -> None:
+        try:
+            question = convert_json_question(json.loads(object_text))
+        except json.JSONDecodeError:
+            self.__record_failure(format='json', reason='invalid_json')
+            return
+        if question is None:
+            self.__record_failure(format='json', reason='missing_fields')
+            return
+        self.__done.append(question)
+
+    def __scan_lines(self, final: bool) -> None:
+        lines = self.__buffer.split('\n')
+        # Последняя строка может быть неполной - оставляем её до следующей части
+        self.__buffer = '' if final else lines.pop()
+        for line in lines:
+            self.__process_line(line)
+
+    def __process_line(self, line: str) -> None:
+        header_match = QUESTION_HEADER_PATTERN.match(line)
+        if header_match:
+            self.__finish_current()
+            question_text = header_match.group(2).strip()
+            prefix_match = ICEQ_QUESTION_PREFIX_PATTERN.match(question_text)
+            if prefix_match:
+                question_text = question_text[prefix_match.end():]
+            self.__current = {
+                'question': question_text,
+                'answers': [],
+                'explanation': ''
+            }
+            self.__letters = [] if prefix_match else None
+            return
+
+        if self.__current is None:
+            return
+
+        line = line.strip()
+        if not line:
+            return
+
+        if self.__letters is not None:
+            self.__process_iceq_line(line)
+            return
+
+        answer_match = ANSWER_LINE_PATTERN.match(line)
+        if answer_match:
+            sign, answer_text = answer_match.groups()
+            self.__current['answers'].append({
+                'answer': answer_text.strip(),
+                'is_correct': (sign == '+')
+            })
+            return
+
+        explanation_match = EXPLANATION_LINE_PATTERN.match(line)
+        if explanation_match:
+            self.__current['explanation'] = explanation_match.group(1).strip()
+            # Объяснение - последняя строка вопроса
+            self.__finish_current()
+
+    def __process_iceq_line(self, line: str) -> None:
+        variants_match = ICEQ_VARIANTS_LINE_PATTERN.match(line)
+        if variants_match:
+            for letter, answer_text in ICEQ_VARIANT_PATTERN.findall(line, variants_match.end()):
+                self.__letters.append(letter.upper())
+                self.__current['answers'].append({
+                    'answer': answer_text.strip(),
+                    'is_correct': False
+                })
+            return
+
+        correct_match = ICEQ_CORRECT_PATTERN.match(line)
+        if correct_match:
+            correct_letter = correct_match.group(1).upper()
+            for letter, answer in zip(self.__letters, self.__current['answers']):
+                answer['is_correct'] = (letter == correct_letter)
+            # Правильный ответ - последняя строка вопроса
+            self.__finish_current()
+
+    def __finish_current(self) -> None:
+        current, self.__current = self.__current, None
+        if current is None:
+            return
+        if not current['answers']:
+            self.__record_failure(format='lines', reason='no_answers')
+            return
+        # В формате ICEQ вопрос без указанного правильного ответа отбрасывается
+        if self.__letters is not None and not any(answer['is_correct'] for answer in current['answers']):
+            self.__record_failure(format='lines', reason='no_correct_answer')
+            return
+        self.__done.append(current)
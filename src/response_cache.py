@@ -0,0 +1,290 @@
+'''
+ICEQ (2025) - Кэш ответов языковых моделей
+
+Основной функционал:
+- Ключ: хэш (LLM, модель, версия промптов, нормализованный текст, количество вопросов)
+- Хранение сырого ответа модели и разобранных вопросов
+- In-memory LRU слой и дисковый слой (JSON-файл на запись) с временем жизни;
+  запись из памяти сверяется с диском (общим для рабочих процессов serve.py)
+- Обход кэша и инвалидация (по LLM, по ключу или целиком)
+- Пути дискового слоя строятся только из известных LLM и hex-ключей
+- Попадания и промахи по каждой LLM
+
+Пример использования:
+    >>> cache = ResponseCache('.cache/responses', ttl=7 * 24 * 3600)
+    >>> key = cache.make_key('deepseek', text, 10, model='deepseek-ai/DeepSeek-V3-0324')
+    >>> entry = cache.get('deepseek', key)
+    >>> if entry is None:
+    ...     cache.put('deepseek', key, raw_response, questions)
+'''
+
+from typing import Dict, List, Optional
+
+import os
+import re
+import copy
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from embedding_cache import normalize_chunk
+from question_generator_api import LLMS
+
+# Директория кэша по умолчанию (в корне проекта)
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.cache',
+    'responses'
+)
+# Максимальное количество ответов в in-memory слое
+DEFAULT_MEMORY_ITEMS = 512
+# Время жизни записи, секунд (неделя)
+DEFAULT_TTL = 7 * 24 * 3600
+# Ключ кэша - hex-представление SHA-256 (см. make_key)
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM с in-memory LRU и дисковым слоем
+
+    Записи старше ttl секунд считаются промахом и удаляются при чтении.
+    Запись из памяти, сохранённая на диск, проверяется по mtime файла:
+    если другой процесс удалил её (invalidate) или перезаписал, она
+    удаляется из памяти или перечитывается с диска.
+    Вопросы возвращаются копией: вызывающий код может дополнять их
+    (например, объяснениями), не изменяя кэш.
+
+    Attributes:
+        cache_dir (str | None): директория дискового слоя (None - только память)
+        ttl (float | None): время жизни записи, секунд (None - без ограничения)
+        max_memory_items (int): ёмкость in-memory слоя
+    """
+
+    def __init__(
+            self,
+            cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+            ttl: Optional[float] = DEFAULT_TTL,
+            max_memory_items: int = DEFAULT_MEMORY_ITEMS
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+
+        # (llm, key) -> (запись, mtime файла дискового слоя; None - запись только в памяти)
+        self.__memory: 'OrderedDict[tuple, tuple[dict, float | None]]' = OrderedDict()
+        self.__counters: Dict[str, Dict[str, int]] = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(llm: str, text: str, questions_num: int, **params) -> str:
+        """
+        Вычисляет ключ кэша
+
+        Args:
+            llm (str): LLM ('deepseek', 'qwen', 'iceq')
+            text (str): текст для генерации (нормализуется перед хэшированием)
+            questions_num (int): количество вопросов
+            **params: прочие параметры, влияющие на ответ (модель, версия промптов, ...)
+
+        Returns:
+            str: hex-представление SHA-256
+        """
+        payload = json.dumps(
+            [llm, normalize_chunk(text), int(questions_num), params],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def check_llm(llm: str) -> str:
+        """
+        Проверяет имя LLM - имя поддиректории дискового слоя
+
+        Raises:
+            ValueError: неизвестная LLM (не из question_generator_api.LLMS)
+        """
+        if llm not in LLMS:
+            raise ValueError(f"Неизвестная LLM '{llm}'. Доступные значения: {', '.join(LLMS)}")
+        return llm
+
+    def __path(self, llm: str, key: str) -> str:
+        self.check_llm(llm)
+        if not isinstance(key, str) or not KEY_PATTERN.match(key):
+            raise ValueError(f"Некорректный ключ кэша ответов '{key}'")
+        return os.path.join(self.cache_dir, llm, key[:2], key + '.json')
+
+    def __expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry['created_at'] > self.ttl
+
+    def __count(self, llm: str, counter: str) -> None:
+        counters = self.__counters.setdefault(llm, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        counters[counter] += 1
+
+    def __remember(self, llm: str, key: str, entry: dict, mtime: Optional[float]) -> None:
+        self.__memory[(llm, key)] = (entry, mtime)
+        self.__memory.move_to_end((llm, key))
+        while len(self.__memory) > self.max_memory_items:
+            self.__memory.popitem(last=False)
+
+    def __disk_mtime(self, llm: str, key: str) -> Optional[float]:
+        try:
+            return os.stat(self.__path(llm, key)).st_mtime
+        except OSError:
+            return None
+
+    def __read_disk(self, llm: str, key: str) -> tuple[Optional[dict], Optional[float]]:
+        if self.cache_dir is None:
+            return None, None
+        path = self.__path(llm, key)
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError) as e:
+            print(f'⚠️ Запись кэша ответов повреждена ({path}): {e}')
+            return None, None
+
+        if self.__expired(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, None
+        return entry, mtime
+
+    def get(self, llm: str, key: str) -> Optional[dict]:
+        """
+        Возвращает запись кэша
+
+        Args:
+            llm (str): LLM
+            key (str): ключ из make_key
+
+        Returns:
+            dict | None: {'raw': сырой ответ, 'questions': копия вопросов, 'created_at': ...}
+                или None при промахе
+        """
+        with self.__lock:
+            entry, mtime = self.__memory.get((llm, key), (None, None))
+            if entry is not None and self.__expired(entry):
+                entry = None
+            elif entry is not None and mtime is not None and self.__disk_mtime(llm, key) != mtime:
+                # Запись удалена или перезаписана другим процессом
+                entry = None
+            if entry is None:
+                self.__memory.pop((llm, key), None)
+
+            if entry is not None:
+                self.__memory.move_to_end((llm, key))
+                self.__count(llm, 'memory_hits')
+            else:
+                entry, mtime = self.__read_disk(llm, key)
+                if entry is None:
+                    self.__count(llm, 'misses')
+                    return None
+                self.__remember(llm, key, entry, mtime)
+                self.__count(llm, 'disk_hits')
+
+            return copy.deepcopy(entry)
+
+    def put(self, llm: str, key: str, raw: str, questions: List[dict]) -> None:
+        """
+        Сохраняет ответ модели и разобранные вопросы
+
+        Args:
+            llm (str): LLM
+            key (str): ключ из make_key
+            raw (str): сырой ответ модели
+            questions (list[dict]): разобранные вопросы (сохраняется копия)
+        """
+        entry = {'created_at': time.time(), 'raw': raw, 'questions': copy.deepcopy(questions)}
+        mtime = self.__write_disk(llm, key, entry) if self.cache_dir is not None else None
+        with self.__lock:
+            self.__remember(llm, key, entry, mtime)
+
+    def __write_disk(self, llm: str, key: str, entry: dict) -> Optional[float]:
+        path = self.__path(llm, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return os.stat(path).st_mtime
+        except OSError as e:
+            print(f'⚠️ Не удалось сохранить ответ LLM на диск: {e}')
+            return None
+
+    def invalidate(self, llm: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        Удаляет записи кэша
+
+        Args:
+            llm (str | None): удалить записи только этой LLM (None - всех)
+            key (str | None): удалить одну запись (требует llm)
+
+        Returns:
+            int: количество удалённых записей в памяти
+
+        Raises:
+            ValueError: неизвестная LLM, некорректный ключ или ключ без LLM
+        """
+        if key is not None:
+            if llm is None:
+                raise ValueError('Для удаления одной записи кэша ответов нужно указать LLM')
+            # Проверяет LLM и ключ до изменения кэша
+            self.__path(llm, key)
+        elif llm is not None:
+            self.check_llm(llm)
+        with self.__lock:
+            removed = [
+                memory_key for memory_key in self.__memory
+                if (llm is None or memory_key[0] == llm) and (key is None or memory_key[1] == key)
+            ]
+            for memory_key in removed:
+                del self.__memory[memory_key]
+
+            if self.cache_dir is not None:
+                if key is not None:
+                    try:
+                        os.remove(self.__path(llm, key))
+                    except FileNotFoundError:
+                        pass
+                else:
+                    directory = self.cache_dir if llm is None else os.path.join(self.cache_dir, llm)
+                    shutil.rmtree(directory, ignore_errors=True)
+
+            return len(removed)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику кэша по каждой LLM
+
+        Returns:
+            dict: попадания (память/диск), промахи и доля попаданий по LLM и в сумме
+        """
+        with self.__lock:
+            backends = {}
+            totals = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+            for llm, counters in self.__counters.items():
+                hits = counters['memory_hits'] + counters['disk_hits']
+                total = hits + counters['misses']
+                backends[llm] = {**counters, 'hit_rate': round(hits / total, 4) if total else 0.0}
+                for name, value in counters.items():
+                    totals[name] += value
+
+            hits = totals['memory_hits'] + totals['disk_hits']
+            total = hits + totals['misses']
+            return {
+                **totals,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'memory_items': len(self.__memory),
+                'backends': backends
+            }
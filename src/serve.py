@@ -0,0 +1,94 @@
+'''
+ICEQ (2025) - Запуск веб-интерфейса в нескольких рабочих процессах
+
+Основной функционал:
+- Модели загружаются один раз в родительском процессе, рабочие процессы
+  запускаются fork-ом и используют веса моделей совместно (copy-on-write)
+- Наблюдение за рабочими процессами, плавный перезапуск (SIGHUP) и
+  плавная остановка (SIGTERM, Ctrl+C) - см. модуль prefork
+- Общее для процессов состояние задач /jobs и /upload
+
+Только POSIX (Linux, macOS), только CPU: CUDA, инициализированная в родительском
+процессе при загрузке моделей, не работает в процессах, запущенных fork-ом.
+Для GPU и для разработки - python app.py.
+
+Переменные окружения:
+    ICEQ_WORKERS - количество рабочих процессов (по умолчанию 2)
+    ICEQ_HOST, ICEQ_PORT - адрес сервера (по умолчанию 127.0.0.1:8080)
+    ICEQ_GRACEFUL_TIMEOUT - ожидание выполняющихся запросов при остановке, секунд
+    ICEQ_PRELOAD_MODELS - модели, загружаемые до fork (по умолчанию clustering,search;
+        iceq - ещё и локальная модель ICEQ)
+    ICEQ_JOB_STATE_DIR - директория состояния задач (по умолчанию временная)
+
+Запуск:
+    >>> ICEQ_WORKERS=4 ICEQ_PRELOAD_MODELS=clustering,search,iceq python serve.py
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+
+from env_loader import load_environment
+from prefork import PreforkServer, DEFAULT_WORKERS, DEFAULT_GRACEFUL_TIMEOUT
+
+# Модели, загружаемые до fork по умолчанию (как при предварительной загрузке в app.py)
+DEFAULT_PRELOAD_MODELS = 'clustering,search'
+
+
+def main():
+    load_environment()
+    workers = int(os.getenv('ICEQ_WORKERS', DEFAULT_WORKERS))
+    preload_models = [key.strip() for key in os.getenv('ICEQ_PRELOAD_MODELS', DEFAULT_PRELOAD_MODELS).split(',') if key.strip()]
+
+    # Выгрузка по простою и бюджету памяти освобождала бы в рабочем процессе только его ссылки
+    # на общие веса, а повторная загрузка создавала бы частную копию модели
+    for name in ('ICEQ_MODEL_IDLE_TIMEOUT', 'ICEQ_MODEL_MEMORY_BUDGET_MB'):
+        if os.environ.pop(name, None):
+            print(f'⚠️ {name} не используется с несколькими рабочими процессами: модели загружаются один раз до fork')
+    # Модели загружаются до запуска рабочих процессов
+    os.environ['ICEQ_STARTUP_MODE'] = 'eager'
+    # CUDA, инициализированная до fork, не работает в рабочих процессах: модели загружаются на CPU,
+    # а GPU скрываются от torch, чтобы CUDA не инициализировалась и косвенно
+    device = os.environ.setdefault('ICEQ_DEVICE', 'cpu')
+    if device != 'cpu':
+        sys.exit(f'❌ ICEQ_DEVICE={device} не поддерживается с несколькими рабочими процессами '
+                 f'(CUDA не работает после fork): используйте python app.py')
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+    # Задачу выполняет один процесс, а статус может запросить любой
+    state_dir = None
+    if not os.getenv('ICEQ_JOB_STATE_DIR'):
+        state_dir = tempfile.mkdtemp(prefix='iceq-jobs-')
+        os.environ['ICEQ_JOB_STATE_DIR'] = state_dir
+
+    import app
+
+    def preload():
+        app.question_generator.warm_up([key for key in preload_models if key in app.question_generator.models])
+        app.models_ready.set()
+
+    def post_fork(index: int):
+        # Потоки torch делятся между процессами, чтобы они не конкурировали за ядра
+        if 'torch' in sys.modules:
+            sys.modules['torch'].set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+    server = PreforkServer(
+        app.app,
+        host=os.getenv('ICEQ_HOST', '127.0.0.1'),
+        port=int(os.getenv('ICEQ_PORT', '8080')),
+        workers=workers,
+        graceful_timeout=float(os.getenv('ICEQ_GRACEFUL_TIMEOUT', DEFAULT_GRACEFUL_TIMEOUT)),
+        preload=preload,
+        post_fork=post_fork,
+        worker_exit=app.job_manager.shutdown
+    )
+    try:
+        server.run()
+    finally:
+        if state_dir is not None:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -133,6 +133,13 @@ document.addEventListener('DOMContentLoaded', function () {
     let testQuality = 85; // Default quality
     let showAnswersImmediately = true; // По умолчанию показываем ответы
 
+    // Document ids for incremental regeneration: after an edit the server recomputes only the changed parts.
+    // Reuse is decided by paragraph hashes, so a different document under the same id is simply generated anew
+    const documentIds = {
+        text: 'text-' + Math.random().toString(36).slice(2, 14),
+        file: 'file-' + Math.random().toString(36).slice(2, 14)
+    };
+
     // Premium state
     let isPremiumMode = localStorage.getItem('premiumMode') === 'true';
     let testsCreatedToday = parseInt(localStorage.getItem('testsCreatedToday') || '0');
@@ -593,90 +600,8 @@ document.addEventListener('DOMContentLoaded', function () {
             };
             reader.readAsText(file);
         }
-        else if (['docx', 'doc'].includes(extension)) {
-            // For DOCX files using mammoth.js
-            if (typeof mammoth !== 'undefined') {
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    const arrayBuffer = e.target.result;
-                    mammoth.extractRawText({arrayBuffer: arrayBuffer})
-                        .then(function(result) {
-                            textContent.value = result.value;
-
-                            // Check character limit for free mode
-                            if (!isPremiumMode && result.value.length > 10000) {
-                                charCounter.querySelector('span').textContent = `${result.value.length} (лимит превышен)`;
-                                charCounter.classList.add('limit-reached');
-                                generateBtn.disabled = true;
-                                alert('В бесплатном режиме ограничение - 10 000 символов. Перейдите на Премиум для работы с текстами любой длины.');
-                            } else {
-                                charCounter.querySelector('span').textContent = result.value.length;
-                                charCounter.classList.remove('limit-reached');
-                                generateBtn.disabled = false;
-                            }
-                        })
-                        .catch(function(error) {
-                            console.error(error);
-                            alert("Ошибка при обработке DOCX файла: " + error.message);
-                        });
-                };
-                reader.onerror = function() {
-                    alert("Ошибка чтения файла.");
-                };
-                reader.readAsArrayBuffer(file);
-            } else {
-                alert("Не удалось загрузить библиотеку для работы с DOCX файлами.");
-            }
-        }
-        else if (extension === 'pdf') {
-            // For PDF files using pdf.js
-            if (typeof pdfjsLib !== 'undefined') {
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    const arrayBuffer = e.target.result;
-                    const loadingTask = pdfjsLib.getDocument({data: arrayBuffer});
-                    loadingTask.promise.then(function(pdf) {
-                        let allTextContent = '';
-                        const maxPages = pdf.numPages;
-                        let loadedPages = 0;
-
-                        function processPDFPages(pageNumber) {
-                            if (pageNumber > maxPages) {
-                                textContent.value = allTextContent;
-
-                                // Check character limit for free mode
-                                if (!isPremiumMode && allTextContent.length > 10000) {
-                                    charCounter.querySelector('span').textContent = `${allTextContent.length} (лимит превышен)`;
-                                    charCounter.classList.add('limit-reached');
-                                    generateBtn.disabled = true;
-                                    alert('В бесплатном режиме ограничение - 10 000 символов. Перейдите на Премиум для работы с текстами любой длины.');
-                                } else {
-                                    charCounter.querySelector('span').textContent = allTextContent.length;
-                                    charCounter.classList.remove('limit-reached');
-                                    generateBtn.disabled = false;
-                                }
-                                return;
-                            }
-
-                            pdf.getPage(pageNumber).then(function(page) {
-                                page.getTextContent().then(function(textContent) {
-                                    const textItems = textContent.items.map(item => item.str);
-                                    allTextContent += textItems.join(' ') + '\n\n';
-                                    processPDFPages(pageNumber + 1);
-                                });
-                            });
-                        }
-
-                        processPDFPages(1);
-                    });
-                };
-                reader.onerror = function() {
-                    alert("Ошибка чтения файла.");
-                };
-                reader.readAsArrayBuffer(file);
-            } else {
-                alert("Не удалось загрузить библиотеку для работы с PDF файлами.");
-            }
+        else if (['docx', 'pdf'].includes(extension)) {
+            // PDF and DOCX are uploaded as is: text is extracted on the server (/upload)
         }
         else {
             alert("Неподдерживаемый тип файла. Пожалуйста, выберите .txt, .docx или .pdf файл.");
@@ -737,9 +662,6 @@ document.addEventListener('DOMContentLoaded', function () {
         activateLoadingStage('analyze');
         logMessage("Начинаем анализ текста...");
 
-        // Update progress realistically
-        startRealisticProgress();
-
         // Update tests created counter for free mode
         if (!isPremiumMode) {
             testsCreatedToday++;
@@ -753,59 +675,77 @@ document.addEventListener('DOMContentLoaded', function () {
         } else {
             const file = fileUpload.files[0];
             logMessage(`Обработка файла: ${file.name}`);
-            generateFromText(textToProcess);
+            generateFromFile(file);
         }
     }
 
-    // Realistic progress bar
-    function startRealisticProgress() {
-        let progress = 0;
-        const totalStages = 5;
-        let currentStage = 0;
+    // Loading stages in display order
+    const loadingStageOrder = ['analyze', 'concepts', 'questions', 'answers', 'quality'];
+    // Server-side generation stages mapped to loading stages
+    const generationStageMap = {
+        extraction: 'analyze',
+        chunking: 'analyze',
+        embedding: 'concepts',
+        clustering: 'concepts',
+        generation: 'questions',
+        explanations: 'answers',
+        deduplication: 'quality',
+        done: 'quality'
+    };
+    const JOB_POLL_INTERVAL = 1000;
+    let currentLoadingStageIndex = 0;
 
-        function updateStage() {
-            const stageNames = ['analyze', 'concepts', 'questions', 'answers', 'quality'];
-            const stageTimes = [1000, 1500, 3000, 2000, 1500]; // times in ms for each stage
+    // Show real job progress reported by the server
+    function updateJobProgress(job) {
+        loaderProgress.textContent = `${Math.floor((job.progress || 0) * 100)}%`;
 
-            if (currentStage < totalStages) {
-                // Complete previous stage if needed
-                if (currentStage > 0) {
-                    completeLoadingStage(stageNames[currentStage - 1]);
-                }
+        if (job.status === 'queued' && job.queue_position) {
+            loaderProgress.textContent = `Очередь: ${job.queue_position}`;
+            return;
+        }
 
-                // Activate current stage
-                activateLoadingStage(stageNames[currentStage]);
-
-                // Update progress for this stage
-                const baseProgress = (currentStage / totalStages) * 100;
-                const stageProgress = (1 / totalStages) * 100;
-
-                let stageTime = stageTimes[currentStage];
-                let subProgress = 0;
-
-                const stageInterval = setInterval(() => {
-                    subProgress += (Math.random() * 1.5) + 0.5;
-                    if (subProgress >= 100) {
-                        subProgress = 100;
-                        clearInterval(stageInterval);
-                        currentStage++;
-
-                        if (currentStage < totalStages) {
-                            setTimeout(updateStage, 500);
-                        } else {
-                            // Complete the last stage
-                            completeLoadingStage(stageNames[currentStage - 1]);
-                        }
-                    }
+        const loadingStage = generationStageMap[job.stage];
+        if (!loadingStage) {
+            return;
+        }
 
-                    progress = baseProgress + (stageProgress * (subProgress / 100));
-                    loaderProgress.textContent = `${Math.floor(progress)}%`;
-                }, stageTime / 20);
-            }
+        const stageIndex = loadingStageOrder.indexOf(loadingStage);
+        while (currentLoadingStageIndex < stageIndex) {
+            completeLoadingStage(loadingStageOrder[currentLoadingStageIndex]);
+            currentLoadingStageIndex++;
+            activateLoadingStage(loadingStageOrder[currentLoadingStageIndex]);
+        }
+
+        if (job.status === 'done') {
+            completeLoadingStage(loadingStage);
         }
+    }
+
+    // Poll generation job status until it finishes
+    function pollJob(jobId) {
+        fetch(`/jobs/${jobId}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    throw new Error(data.message);
+                }
 
-        // Start the first stage
-        updateStage();
+                const job = data.job;
+                updateJobProgress(job);
+
+                if (job.status === 'done') {
+                    return fetch(`/jobs/${jobId}/result`)
+                        .then(response => response.json())
+                        .then(handleGenerationResult);
+                }
+                if (job.status === 'error') {
+                    handleGenerationResult({status: 'error', message: job.error});
+                    return;
+                }
+
+                setTimeout(() => pollJob(jobId), JOB_POLL_INTERVAL);
+            })
+            .catch(handleGenerationNetworkError);
     }
 
     // Activate a loading stage
@@ -877,9 +817,9 @@ document.addEventListener('DOMContentLoaded', function () {
         const modelHiddenInput = document.getElementById('model-select-hidden');
         const selectedModelValue = modelHiddenInput ? modelHiddenInput.value : selectedModel;
 
-        startRealisticProgress();
+        currentLoadingStageIndex = 0;
 
-        fetch('/generate', {
+        fetch('/jobs', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -887,45 +827,93 @@ document.addEventListener('DOMContentLoaded', function () {
             body: JSON.stringify({
                 text: textContent,
                 questionNumber: questionNumber,
-                model: selectedModelValue
+                model: selectedModelValue,
+                documentId: documentIds.text
             })
         })
         .then(response => response.json())
         .then(data => {
-            if (data.status === 'success') {
-                quizData = data.questions;
-
-                // Показываем экран предварительного просмотра
-                showScreen(testPreviewScreen);
-                
-                // Теперь подготавливаем содержимое экрана
-                prepareTestPreview();
-
-                // Update test generation stats
-                if (!isPremiumMode) {
-                    testsCreatedToday++;
-                    localStorage.setItem('testsCreatedToday', testsCreatedToday.toString());
-                    updateFreeTestsLimit();
-                }
+            if (data.status !== 'success') {
+                handleGenerationResult(data);
+                return;
+            }
+            pollJob(data.job_id);
+        })
+        .catch(handleGenerationNetworkError);
+    }
 
-                logMessage('Генерация завершена успешно!');
-            } else {
-                logMessage('Ошибка генерации: ' + data.message);
-                
-                // Показываем пользователю ошибку и возвращаем к редактированию
-                setTimeout(() => {
-                    alert('Ошибка генерации: ' + data.message);
-                    showScreen(createTestScreen);
-                }, 2000);
+    // Upload a document: text is extracted on the server and generation is queued as a job
+    function generateFromFile(file) {
+        showScreen(loadingScreen);
+
+        const questionNumber = parseInt(document.getElementById('question-number').value);
+        const modelHiddenInput = document.getElementById('model-select-hidden');
+        const selectedModelValue = modelHiddenInput ? modelHiddenInput.value : selectedModel;
+
+        currentLoadingStageIndex = 0;
+
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('questionNumber', questionNumber);
+        formData.append('model', selectedModelValue);
+        formData.append('documentId', documentIds.file);
+        if (!isPremiumMode) {
+            // PDF and DOCX length is known only after extraction: the server checks the free mode limit
+            formData.append('maxLength', 10000);
+        }
+
+        fetch('/upload', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                handleGenerationResult(data);
+                return;
             }
+            pollJob(data.job_id);
         })
-        .catch(error => {
-            logMessage('Ошибка сети: ' + error.message);
+        .catch(handleGenerationNetworkError);
+    }
+
+    // Handle finished generation result
+    function handleGenerationResult(data) {
+        if (data.status === 'success') {
+            quizData = data.questions;
+
+            // Показываем экран предварительного просмотра
+            showScreen(testPreviewScreen);
+            
+            // Теперь подготавливаем содержимое экрана
+            prepareTestPreview();
+
+            // Update test generation stats
+            if (!isPremiumMode) {
+                testsCreatedToday++;
+                localStorage.setItem('testsCreatedToday', testsCreatedToday.toString());
+                updateFreeTestsLimit();
+            }
+
+            logMessage('Генерация завершена успешно!');
+        } else {
+            logMessage('Ошибка генерации: ' + data.message);
+            
+            // Показываем пользователю ошибку и возвращаем к редактированию
             setTimeout(() => {
-                alert('Ошибка сети: ' + error.message);
+                alert('Ошибка генерации: ' + data.message);
                 showScreen(createTestScreen);
             }, 2000);
-        });
+        }
+    }
+
+    // Handle network errors during generation
+    function handleGenerationNetworkError(error) {
+        logMessage('Ошибка сети: ' + error.message);
+        setTimeout(() => {
+            alert('Ошибка сети: ' + error.message);
+            showScreen(createTestScreen);
+        }, 2000);
     }
 
     // Update quality indicator
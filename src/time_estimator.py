@@ -0,0 +1,240 @@
+'''
+ICEQ (2025) - Самокалибрующаяся оценка времени генерации
+
+Основной функционал:
+- Запись фактического времени завершённых генераций
+- Гребневая регрессия времени по длине текста, количеству чанков,
+  кластеров и вопросов - отдельно для каждой LLM
+- Доверительный интервал прогноза
+- Сохранение замеров на диск (модель восстанавливается после перезапуска);
+  замеры рабочих процессов pre-fork сервера объединяются в одном файле
+
+Пример использования:
+    >>> estimator = GenerationTimeEstimator('.cache/time_estimator.json')
+    >>> features = {'text_length': 52000, 'chunks': 340, 'clusters': 10, 'questions_num': 10}
+    >>> estimator.record('deepseek', features, seconds=41.7)
+    >>> estimator.estimate('deepseek', features)  # None, пока замеров мало
+'''
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import os
+import json
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: pre-fork сервер недоступен, файл замеров используется одним процессом
+    fcntl = None
+
+# Файл замеров по умолчанию (в корне проекта)
+DEFAULT_ESTIMATOR_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.cache',
+    'time_estimator.json'
+)
+# Признаки регрессии (к ним добавляется свободный член)
+ESTIMATOR_FEATURES = ('text_length', 'chunks', 'clusters', 'questions_num')
+# Масштаб признаков, чтобы коэффициенты были одного порядка
+FEATURE_SCALES = {'text_length': 10_000.0, 'chunks': 100.0, 'clusters': 10.0, 'questions_num': 1.0}
+# Минимальное количество замеров LLM для прогноза по регрессии
+DEFAULT_MIN_SAMPLES = 8
+# Сколько последних замеров каждой LLM хранить
+DEFAULT_MAX_SAMPLES = 500
+# Коэффициент гребневой регуляризации
+RIDGE_ALPHA = 1e-2
+# Квантиль нормального распределения для 90% интервала
+CONFIDENCE_Z = 1.645
+
+
+class GenerationTimeEstimator:
+    """
+    Оценка времени генерации, обучаемая на фактических замерах
+
+    Модель каждой LLM - линейная регрессия с гребневой регуляризацией по
+    ESTIMATOR_FEATURES. Интервал прогноза учитывает и разброс остатков, и
+    неопределённость коэффициентов, поэтому при малом числе замеров он шире.
+    На диск сохраняются сами замеры: коэффициенты пересчитываются при загрузке.
+    Запись выполняется под блокировкой {path}.lock: ещё не сохранённые замеры
+    добавляются к перечитанным с диска, поэтому процессы с общим файлом не
+    затирают замеры друг друга и обучаются на всех замерах.
+
+    Attributes:
+        path (str | None): файл замеров (None - только память)
+        min_samples (int): минимальное количество замеров для прогноза
+        max_samples (int): сколько последних замеров каждой LLM хранить
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = DEFAULT_ESTIMATOR_PATH,
+            min_samples: int = DEFAULT_MIN_SAMPLES,
+            max_samples: int = DEFAULT_MAX_SAMPLES
+    ):
+        self.path = path
+        self.min_samples = max(len(ESTIMATOR_FEATURES) + 2, min_samples)
+        self.max_samples = max_samples
+
+        self.__samples: Dict[str, List[list]] = {}
+        # Замеры этого процесса, ещё не записанные в файл
+        self.__unsaved: Dict[str, List[list]] = {}
+        self.__models: Dict[str, dict] = {}
+        self.__lock = threading.Lock()
+        self.__load()
+
+    @staticmethod
+    def __design_row(features: dict) -> np.ndarray:
+        return np.array(
+            [1.0] + [float(features[name]) / FEATURE_SCALES[name] for name in ESTIMATOR_FEATURES],
+            dtype=np.float64
+        )
+
+    @contextmanager
+    def __locked(self) -> Iterator[None]:
+        """Блокировка файла замеров между процессами"""
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __read(self) -> Optional[Dict[str, List[list]]]:
+        """Читает замеры из файла (None - файла нет или он не подходит)"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+            if data.get('features') != list(ESTIMATOR_FEATURES):
+                print('ℹ️ Набор признаков оценки времени изменился, старые замеры не используются')
+                return None
+            return {llm: samples[-self.max_samples:] for llm, samples in data['samples'].items()}
+        except (OSError, ValueError, KeyError) as e:
+            print(f'⚠️ Не удалось загрузить замеры времени генерации ({self.path}): {e}')
+            return None
+
+    def __load(self) -> None:
+        if self.path is None:
+            return
+        self.__samples = self.__read() or {}
+        for llm in self.__samples:
+            self.__fit(llm)
+
+    def __save(self) -> None:
+        """Добавляет несохранённые замеры к замерам на диске (вызывается под блокировкой)"""
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.__locked():
+                samples = self.__read() or {}
+                for llm, unsaved in self.__unsaved.items():
+                    merged = samples.setdefault(llm, [])
+                    merged.extend(unsaved)
+                    del merged[:-self.max_samples]
+
+                tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'w', encoding='utf8') as f:
+                    json.dump({'features': list(ESTIMATOR_FEATURES), 'samples': samples}, f)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f'⚠️ Не удалось сохранить замеры времени генерации: {e}')
+            return
+
+        # Замеры других процессов тоже участвуют в обучении
+        self.__unsaved.clear()
+        self.__samples = samples
+        for llm in self.__samples:
+            self.__fit(llm)
+
+    def __fit(self, llm: str) -> None:
+        """Пересчитывает модель LLM по её замерам (вызывается под блокировкой)"""
+        samples = self.__samples.get(llm, [])
+        if len(samples) < self.min_samples:
+            self.__models.pop(llm, None)
+            return
+
+        X = np.stack([self.__design_row(dict(zip(ESTIMATOR_FEATURES, sample[:-1]))) for sample in samples])
+        y = np.array([sample[-1] for sample in samples], dtype=np.float64)
+
+        # Свободный член не регуляризуется
+        penalty = RIDGE_ALPHA * np.eye(X.shape[1])
+        penalty[0, 0] = 0.0
+        precision = X.T @ X + penalty
+        covariance = np.linalg.pinv(precision)
+        coefficients = covariance @ X.T @ y
+
+        residuals = y - X @ coefficients
+        dof = max(1, len(y) - X.shape[1])
+        self.__models[llm] = {
+            'coefficients': coefficients,
+            'covariance': covariance,
+            'residual_std': float(np.sqrt(residuals @ residuals / dof)),
+            'samples': len(y)
+        }
+
+    def record(self, llm: str, features: dict, seconds: float) -> None:
+        """
+        Сохраняет фактическое время генерации и переобучает модель LLM
+
+        Args:
+            llm (str): LLM ('deepseek', 'qwen', 'iceq')
+            features (dict): значения ESTIMATOR_FEATURES
+            seconds (float): фактическое время, секунд
+        """
+        sample = [float(features[name]) for name in ESTIMATOR_FEATURES] + [float(seconds)]
+        with self.__lock:
+            samples = self.__samples.setdefault(llm, [])
+            samples.append(sample)
+            del samples[:-self.max_samples]
+            self.__unsaved.setdefault(llm, []).append(sample)
+            del self.__unsaved[llm][:-self.max_samples]
+            self.__fit(llm)
+            self.__save()
+
+    def estimate(self, llm: str, features: dict) -> Optional[dict]:
+        """
+        Прогнозирует время генерации
+
+        Args:
+            llm (str): LLM
+            features (dict): значения ESTIMATOR_FEATURES
+
+        Returns:
+            dict | None: {'seconds', 'lower', 'upper', 'samples'} или None,
+                если замеров этой LLM пока меньше min_samples
+        """
+        with self.__lock:
+            model = self.__models.get(llm)
+        if model is None:
+            return None
+
+        x = self.__design_row(features)
+        seconds = float(x @ model['coefficients'])
+        spread = model['residual_std'] * float(np.sqrt(1.0 + x @ model['covariance'] @ x))
+        return {
+            'seconds': max(0.0, seconds),
+            'lower': max(0.0, seconds - CONFIDENCE_Z * spread),
+            'upper': max(0.0, seconds + CONFIDENCE_Z * spread),
+            'samples': model['samples']
+        }
+
+    def stats(self) -> dict:
+        """Количество замеров и среднеквадратичная ошибка модели каждой LLM"""
+        with self.__lock:
+            return {
+                llm: {
+                    'samples': len(samples),
+                    'calibrated': llm in self.__models,
+                    'residual_std': round(self.__models[llm]['residual_std'], 2) if llm in self.__models else None
+                }
+                for llm, samples in self.__samples.items()
+            }